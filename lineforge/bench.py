@@ -0,0 +1,523 @@
+"""
+Benchmarks: python -m lineforge.bench [options]
+
+Generates a deterministic synthetic corpus (line art, photos, multi-frame ICOs,
+large TIFFs), then times
+
+  - every enabled stage on its own, one file at a time, so per-file cost and
+    peak memory are not mixed with other stages or workers, and
+  - the whole of run_all with the configured workers and mode.
+
+Tools are either the real magick/potrace/inkscape or stand-in shims that sleep
+for a fixed latency and write minimal valid outputs, which isolates LineForge's
+own orchestration cost. Every benchmark is appended as one JSON line to the
+results file; --compare prints the change against the previous comparable one.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import stat
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from .cli import load_job, settings_from_job
+from .deps import TOOL_ENV
+from .pipeline import build_steps, run_all
+from .settings import Settings
+from .utils import list_images
+
+ICO_SIZES = [(16, 16), (24, 24), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]
+RESULTS_FILE = "bench_results.jsonl"
+
+
+@dataclass
+class CorpusSpec:
+    lineart: int = 24
+    photos: int = 12
+    icos: int = 4
+    tiffs: int = 1
+    size: int = 512          # edge of line art and photos
+    tiff_size: int = 6000    # edge of the large TIFFs
+    seed: int = 1
+
+
+# ---- corpus ----
+def _lineart(rng: random.Random, size: int, mode: str = "L") -> Image.Image:
+    """Strokes, outlines and filled shapes in black on white (or on transparent for RGBA)."""
+    img = Image.new(mode, (size, size), (0, 0, 0, 0) if mode == "RGBA" else 255)
+    ink = (0, 0, 0, 255) if mode == "RGBA" else 0
+    d = ImageDraw.Draw(img)
+    pt = lambda: (rng.uniform(0, size), rng.uniform(0, size))  # noqa: E731
+    for _ in range(rng.randint(12, 30)):
+        kind = rng.random()
+        w = max(1, int(rng.uniform(0.002, 0.015) * size))
+        if kind < 0.4:
+            d.line([pt() for _ in range(rng.randint(2, 6))], fill=ink, width=w, joint="curve")
+        elif kind < 0.7:
+            (x0, y0), (x1, y1) = pt(), pt()
+            d.ellipse([min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)], outline=ink, width=w)
+        elif kind < 0.9:
+            d.polygon([pt() for _ in range(rng.randint(3, 7))], outline=ink, width=w)
+        else:
+            x, y = pt()
+            r = rng.uniform(0.01, 0.05) * size
+            d.ellipse([x - r, y - r, x + r, y + r], fill=ink)
+    return img
+
+
+def _photo(seed: List[int], size: int) -> Image.Image:
+    """Smooth colour fields plus sensor-like noise: compresses and thresholds like a photo."""
+    g = np.random.default_rng(seed)
+    base = Image.fromarray(g.integers(0, 256, (6, 6, 3), dtype=np.uint8)).resize((size, size), Image.BICUBIC)
+    noise = g.normal(0, 12, (size, size, 3))
+    arr = np.clip(np.asarray(base, dtype=np.float64) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(arr).filter(ImageFilter.GaussianBlur(0.6))
+
+
+def make_corpus(root: Path, spec: CorpusSpec, log=print) -> List[Path]:
+    """
+    Write the corpus described by spec into root and return its files.
+    A corpus already there with the same spec is reused.
+    """
+    root = Path(root)
+    manifest = root / "corpus.json"
+    if manifest.exists() and json.loads(manifest.read_text(encoding="utf-8")) == asdict(spec):
+        return list_images(root)
+
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    log(f"Generating corpus in {root} ...")
+    for i in range(spec.lineart):
+        _lineart(random.Random(f"lineart:{spec.seed}:{i}"), spec.size).save(root / f"lineart_{i:04d}.png")
+    for i in range(spec.photos):
+        _photo([spec.seed, 1, i], spec.size).save(root / f"photo_{i:04d}.jpg", quality=90)
+    for i in range(spec.icos):
+        icon = _lineart(random.Random(f"ico:{spec.seed}:{i}"), 256, "RGBA")
+        icon.save(root / f"icon_{i:04d}.ico", sizes=ICO_SIZES)
+    for i in range(spec.tiffs):
+        big = _lineart(random.Random(f"tiff:{spec.seed}:{i}"), spec.tiff_size)
+        big.save(root / f"large_{i:04d}.tif", compression="tiff_lzw")
+    manifest.write_text(json.dumps(asdict(spec), indent=1), encoding="utf-8")
+    return list_images(root)
+
+
+# ---- shims ----
+_SHIM = r'''
+import os, sys, time
+
+def _sleep():
+    if LATENCY_MS > 0:
+        time.sleep(LATENCY_MS / 1000.0)
+
+def _pbm_size(data):
+    toks = []
+    for line in data.split(b"\n"):
+        if line.startswith(b"#"):
+            continue
+        toks += line.split()
+        if len(toks) >= 3:
+            return int(toks[1]), int(toks[2])
+    raise SystemExit("shim potrace: bad PBM header")
+
+def potrace(args):
+    src, dst = args[0], args[args.index("-o") + 1]
+    data = sys.stdin.buffer.read() if src == "-" else open(src, "rb").read()
+    if not data.startswith(b"P4"):
+        raise SystemExit("shim potrace: input is not a raw PBM")
+    w, h = _pbm_size(data)
+    _sleep()
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%dpt" height="%dpt" viewBox="0 0 %d %d">'
+        '<g transform="translate(0,%d) scale(0.1,-0.1)" fill="#000000" stroke="none">'
+        '<path d="M%d %d l%d 0 0 %d -%d 0z"/></g></svg>'
+        % (w, h, w, h, h, w * 2, h * 2, w * 6, h * 6, w * 6)
+    )
+    if dst == "-":
+        sys.stdout.write(svg)
+        return
+    with open(dst, "w") as fh:
+        fh.write(svg)
+
+def _png(path, width):
+    from PIL import Image
+    Image.new("RGBA", (width, width), (0, 0, 0, 255)).save(path)
+
+def inkscape(args):
+    if "--shell" in args:
+        _sleep()
+        sys.stdout.write("Inkscape interactive shell mode.\n> ")
+        sys.stdout.flush()
+        for line in sys.stdin:
+            if line.strip() == "quit":
+                break
+            acts = dict((a.split(":", 1) + [""])[:2] for a in line.strip().split(";"))
+            if "export-filename" in acts:
+                _sleep()
+                _png(acts["export-filename"], int(acts.get("export-width") or 16))
+            sys.stdout.write("> ")
+            sys.stdout.flush()
+        return
+    opts = dict((a[2:].split("=", 1) + [""])[:2] for a in args if a.startswith("--"))
+    _sleep()
+    _png(opts["export-filename"], int(opts.get("export-width") or 16))
+
+def _split(fmt_path):
+    head, sep, rest = fmt_path.partition(":")
+    if sep and len(head) <= 4 and head.isalpha() and len(head) > 1:
+        return head.lower(), rest
+    return "", fmt_path
+
+def _job(tokens):
+    from io import BytesIO
+    from PIL import Image
+    *ops, out = tokens
+    inputs = []
+    for t in ops:
+        fmt, p = _split(t)
+        if p == "-" and fmt:
+            inputs.append(BytesIO(sys.stdin.buffer.read()))
+        elif not t.startswith("-") and os.path.isfile(t):
+            inputs.append(t)
+    if not inputs:
+        raise SystemExit("shim magick: no input in " + " ".join(tokens))
+    fmt, dst = _split(out)
+    if "%" in dst:  # ICO split: one file per frame
+        im = Image.open(inputs[0])
+        sizes = sorted(im.ico.sizes()) if hasattr(im, "ico") else [im.size]
+        for k, size in enumerate(sizes):
+            frame = im.ico.getimage(size) if hasattr(im, "ico") else im
+            frame.convert("RGBA").save(dst % k)
+        return
+    if dst.lower().endswith(".ico"):
+        frames = [Image.open(p).convert("RGBA") for p in inputs]
+        frames[0].save(dst, sizes=[f.size for f in frames], append_images=frames[1:])
+        return
+    im = Image.open(inputs[0])
+    im = im.convert("L")
+    target = sys.stdout.buffer if dst == "-" else dst
+    if fmt == "pbm":
+        im.point(lambda v: 255 if v > 127 else 0).convert("1").save(target, "PPM")
+    else:
+        im.save(target, "PNG")
+
+def magick(args):
+    _sleep()
+    job = []
+    i = 0
+    while i < len(args):
+        if args[i] == "-write":  # -write OUT -delete 0--1: end of one batched job
+            _job(job + [args[i + 1]])
+            job = []
+            i += 4
+            continue
+        job.append(args[i])
+        i += 1
+    _job(job)
+
+{"magick": magick, "potrace": potrace, "inkscape": inkscape}[TOOL](sys.argv[1:])
+'''
+
+
+def write_shims(root: Path, latency_ms: float) -> Dict[str, str]:
+    """Write magick/potrace/inkscape stand-ins into root; returns tool -> executable path."""
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    tools = {}
+    for tool in TOOL_ENV:
+        src = f"TOOL = {tool!r}\nLATENCY_MS = {float(latency_ms)!r}\n" + _SHIM
+        if sys.platform.startswith("win"):
+            script = root / f"{tool}_shim.py"
+            script.write_text(src, encoding="utf-8")
+            exe = root / f"{tool}.cmd"
+            exe.write_text(f'@"{sys.executable}" "{script}" %*\n', encoding="utf-8")
+        else:
+            exe = root / tool
+            exe.write_text(f"#!{sys.executable}\n" + src, encoding="utf-8")
+            exe.chmod(exe.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        tools[tool] = str(exe)
+    return tools
+
+
+# ---- memory ----
+def rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where the current value is not available)."""
+    if sys.platform.startswith("linux"):
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    if sys.platform.startswith("win"):
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage",
+                )
+            ]
+
+        c = Counters()
+        c.cb = ctypes.sizeof(c)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(c), c.cb)
+        return int(c.WorkingSetSize)
+    import resource
+    return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)  # bytes on macOS
+
+
+class PeakRss:
+    """Samples this process's RSS on a background thread while the block runs."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakRss":
+        self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+# ---- benchmarks ----
+def _result(files: int, seconds: float, peak: int, failed: int = 0) -> Dict[str, object]:
+    return {
+        "files": files,
+        "failed": failed,
+        "seconds": round(seconds, 4),
+        "files_per_s": round(files / seconds, 3) if seconds > 0 else None,
+        "peak_rss_mb": round(peak / (1 << 20), 1),
+    }
+
+
+def _median(runs: List[Dict[str, object]]) -> Dict[str, object]:
+    """The run with the median time (peak memory is the worst seen)."""
+    runs = sorted(runs, key=lambda r: r["seconds"])
+    mid = dict(runs[(len(runs) - 1) // 2])
+    mid["peak_rss_mb"] = max(r["peak_rss_mb"] for r in runs)
+    if len(runs) > 1:
+        mid["seconds_all"] = [r["seconds"] for r in runs]
+    return mid
+
+
+def bench_stages(files: List[Path], out_root: Path, s: Settings) -> Dict[str, Dict[str, object]]:
+    """
+    Time each enabled stage over the corpus, one file at a time, each stage fed
+    the previous stage's outputs. ICOs go through as plain images (largest frame).
+    """
+    shutil.rmtree(out_root, ignore_errors=True)
+    steps = build_steps(out_root, s)
+    results: Dict[str, Dict[str, object]] = {}
+    items: List = list(files)
+    try:
+        for step in steps:
+            outs = []
+            failed = 0
+            with PeakRss() as mem:
+                t = time.perf_counter()
+                for item in items:
+                    try:
+                        outs.append(step.run(item))
+                    except Exception:
+                        failed += 1
+                seconds = time.perf_counter() - t
+            results[step.key] = _result(len(items), seconds, mem.peak, failed)
+            items = outs
+    finally:
+        for step in steps:
+            if step.close:
+                step.close()
+    return results
+
+
+def bench_run_all(corpus: Path, out_root: Path, s: Settings) -> Dict[str, object]:
+    """Time one full run_all over the corpus (ICO frames count as files)."""
+    shutil.rmtree(out_root, ignore_errors=True)
+    counts: Dict[str, object] = {}
+
+    def progress(event):
+        if event["event"] in ("start", "done"):
+            counts.update(event)
+
+    with PeakRss() as mem:
+        t = time.perf_counter()
+        run_all(corpus, out_root, s, lambda msg: None, progress)
+        seconds = time.perf_counter() - t
+    return _result(int(counts.get("files", 0)), seconds, mem.peak, int(counts.get("failed", 0)))
+
+
+def _version() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=Path(__file__).resolve().parent,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=10,
+        ).stdout.decode().strip()
+        return out or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def _comparable(a: Dict[str, object], b: Dict[str, object]) -> bool:
+    keys = ("corpus", "tools", "latency_ms", "settings")
+    return all(a.get(k) == b.get(k) for k in keys)
+
+
+def compare(prev: Dict[str, object], cur: Dict[str, object]) -> str:
+    """Side-by-side files/sec and peak memory of two results."""
+    lines = [f"Compared with {prev['version']} ({prev['when']}):"]
+    rows = [(f"[{k}]", prev["stages"].get(k), v) for k, v in cur["stages"].items()]  # type: ignore[union-attr]
+    rows.append(("run_all", prev.get("run_all"), cur.get("run_all")))
+    for name, old, new in rows:
+        if not old or not new or not old.get("files_per_s") or not new.get("files_per_s"):
+            continue
+        speed = new["files_per_s"] / old["files_per_s"] - 1
+        mem = new["peak_rss_mb"] - old["peak_rss_mb"]
+        lines.append(
+            f"  {name:8} {old['files_per_s']:>9.2f} -> {new['files_per_s']:>9.2f} files/s ({speed:+.1%})   "
+            f"peak {old['peak_rss_mb']:.0f} -> {new['peak_rss_mb']:.0f} MB ({mem:+.0f})"
+        )
+    return "\n".join(lines)
+
+
+def _format(result: Dict[str, object]) -> str:
+    lines = []
+    rows = [(f"[{k}]", v) for k, v in result["stages"].items()]  # type: ignore[union-attr]
+    if result.get("run_all"):
+        rows.append(("run_all", result["run_all"]))
+    for name, r in rows:
+        fps = f"{r['files_per_s']:.2f}" if r["files_per_s"] else "-"
+        lines.append(
+            f"  {name:8} {r['files']:>6} files  {r['seconds']:>9.3f}s  {fps:>9} files/s  "
+            f"peak {r['peak_rss_mb']:.0f} MB" + (f"  ({r['failed']} failed)" if r["failed"] else "")
+        )
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    d = CorpusSpec()
+    p = argparse.ArgumentParser(prog="lineforge.bench", description="Benchmark LineForge on a synthetic corpus.")
+    p.add_argument("--work", default="bench", help="working folder for corpus, outputs and shims (default: ./bench)")
+    p.add_argument("--lineart", type=int, default=d.lineart, help=f"line art PNGs (default: {d.lineart})")
+    p.add_argument("--photos", type=int, default=d.photos, help=f"photo JPEGs (default: {d.photos})")
+    p.add_argument("--icos", type=int, default=d.icos, help=f"multi-frame ICOs (default: {d.icos})")
+    p.add_argument("--tiffs", type=int, default=d.tiffs, help=f"large line art TIFFs (default: {d.tiffs})")
+    p.add_argument("--size", type=int, default=d.size, help=f"line art / photo edge in px (default: {d.size})")
+    p.add_argument("--tiff-size", type=int, default=d.tiff_size, help=f"TIFF edge in px (default: {d.tiff_size})")
+    p.add_argument("--seed", type=int, default=d.seed)
+    p.add_argument("--tools", choices=("shim", "real"), default="shim",
+                   help="stand-in shims (default) or the installed magick/potrace/inkscape")
+    p.add_argument("--latency-ms", type=float, default=20.0, help="extra time per shim call (default: 20)")
+    p.add_argument("-c", "--config", metavar="JOB", help="settings as a JSON/TOML job file (see python -m lineforge)")
+    p.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                   help="override one setting, value as JSON (e.g. --set workers=4 --set pipeline_mode='\"streaming\"')")
+    p.add_argument("--repeat", type=int, default=3, help="runs of each benchmark; the median is kept (default: 3)")
+    p.add_argument("--no-stages", action="store_true", help="skip the per-stage benchmark")
+    p.add_argument("--no-run-all", action="store_true", help="skip the run_all benchmark")
+    p.add_argument("--out", help=f"results file to append to (default: <work>/{RESULTS_FILE})")
+    p.add_argument("--compare", action="store_true", help="compare with the previous comparable result in --out")
+    return p
+
+
+def _settings(args) -> Settings:
+    # ICOs in the corpus go through split/rebuild unless the job says otherwise
+    s = Settings(handle_ico=True)
+    if args.config:
+        s = settings_from_job(load_job(Path(args.config)), s)
+    job = {}
+    for item in args.set:
+        name, _, value = item.partition("=")
+        try:
+            job[name.strip()] = json.loads(value)
+        except json.JSONDecodeError:
+            job[name.strip()] = value
+    s = settings_from_job(job, s)
+    # every repeat must do the work again, and the report and ledger would be timed too
+    return replace(s, use_cache=False, run_report=False, use_ledger=False, resume=False)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    work = Path(args.work).resolve()
+    try:
+        s = _settings(args)
+    except (OSError, ValueError) as e:
+        print(f"lineforge.bench: {e}", file=sys.stderr)
+        return 2
+
+    spec = CorpusSpec(args.lineart, args.photos, args.icos, args.tiffs, args.size, args.tiff_size, args.seed)
+    corpus = work / "corpus"
+    files = make_corpus(corpus, spec)
+
+    if args.tools == "shim":
+        for tool, exe in write_shims(work / "shims", args.latency_ms).items():
+            os.environ[TOOL_ENV[tool]] = exe
+
+    result: Dict[str, object] = {
+        "when": datetime.now().isoformat(timespec="seconds"),
+        "version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "tools": args.tools,
+        "latency_ms": args.latency_ms if args.tools == "shim" else None,
+        "corpus": asdict(spec),
+        "settings": asdict(s),
+        "stages": {},
+        "run_all": None,
+    }
+    repeat = max(1, args.repeat)
+    print(f"{len(files)} files, tools: {args.tools}, {repeat} run(s) each")
+
+    try:
+        if not args.no_stages:
+            runs = [bench_stages(files, work / "out_stages", replace(s, keep_intermediates=True))
+                    for _ in range(repeat)]
+            result["stages"] = {k: _median([r[k] for r in runs]) for k in runs[0]}
+        if not args.no_run_all:
+            result["run_all"] = _median([bench_run_all(corpus, work / "out_run_all", s) for _ in range(repeat)])
+    except Exception as e:
+        print(f"lineforge.bench: {e}", file=sys.stderr)
+        return 1
+
+    print(_format(result))
+
+    out = Path(args.out) if args.out else work / RESULTS_FILE
+    previous = []
+    if out.exists():
+        previous = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines() if line.strip()]
+    with open(out, "a", encoding="utf-8") as fh:
+        fh.write(json.dumps(result) + "\n")
+    print(f"Results appended to {out}")
+
+    if args.compare:
+        prev = next((r for r in reversed(previous) if _comparable(r, result)), None)
+        print(compare(prev, result) if prev else "No earlier comparable result to compare with.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
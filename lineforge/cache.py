@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# Bump when stage output for the same input + settings changes, to orphan old entries.
+CACHE_VERSION = 3
+
+
+def hash_file(path: Path, h=None, chunk: int = 1 << 20):
+    """Feed a file's bytes into a hashlib object (sha256 by default) and return it."""
+    h = h or hashlib.sha256()
+    with open(path, "rb") as fh:
+        while True:
+            block = fh.read(chunk)
+            if not block:
+                break
+            h.update(block)
+    return h
+
+
+class StageCache:
+    """
+    Content-addressed store for stage outputs.
+
+    An entry is keyed by the stage, the bytes of its input file and the settings
+    that stage reads, so changing e.g. the export width only invalidates stage D.
+    Entries live under root/<2 hex>/<key><suffix>; a hit copies the entry to the
+    requested destination. The store is trimmed oldest-first (by last use) once it
+    grows past max_bytes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(0, int(max_bytes))
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._lock = threading.Lock()
+        self._size = sum(size for _, _, size in self._entries())
+
+    def key(self, stage: str, src: Path, params: Dict[str, object]) -> str:
+        h = hashlib.sha256()
+        h.update(f"v{CACHE_VERSION}|{stage}|".encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        h.update(b"|")
+        return hash_file(src, h).hexdigest()
+
+    def _entry(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / (key + suffix)
+
+    def entry(self, stage: str, src: Path, params: Dict[str, object], suffix: str) -> Path:
+        """Cache entry path for a stage output with the given suffix."""
+        return self._entry(self.key(stage, Path(src), params), suffix)
+
+    def restore(self, stage: str, entry: Path, dst: Path) -> bool:
+        """Copy a cached entry to dst. Returns False (and counts a miss) when absent."""
+        dst = Path(dst)
+        if entry.exists():
+            try:
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(entry, dst)
+                os.utime(entry)
+                with self._lock:
+                    self.hits[stage] += 1
+                return True
+            except FileNotFoundError:
+                pass  # evicted underneath us; count as a miss
+
+        with self._lock:
+            self.misses[stage] += 1
+        return False
+
+    def run(
+        self,
+        stage: str,
+        src: Path,
+        dst: Path,
+        params: Dict[str, object],
+        fn: Callable[[], Path],
+    ) -> Path:
+        """Return dst from cache if possible, otherwise call fn() and store its output."""
+        dst = Path(dst)
+        entry = self.entry(stage, src, params, dst.suffix)
+        if self.restore(stage, entry, dst):
+            return dst
+
+        out = Path(fn())
+        self.store(out, entry)
+        return out
+
+    def store(self, out: Path, entry: Path) -> None:
+        """Add a freshly produced stage output under entry."""
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.name}.{uuid.uuid4().hex}.tmp")
+        shutil.copyfile(out, tmp)
+        os.replace(tmp, entry)
+
+        with self._lock:
+            self._size += entry.stat().st_size
+            over = self.max_bytes and self._size > self.max_bytes
+        if over:
+            self.trim()
+
+    def _entries(self) -> List[Tuple[float, Path, int]]:
+        found = []
+        for sub in self.root.iterdir():
+            if not sub.is_dir():
+                continue
+            for p in sub.iterdir():
+                if p.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((st.st_mtime, p, st.st_size))
+        return found
+
+    def trim(self) -> None:
+        """Evict least recently used entries until the store is below 90% of max_bytes."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, _, size in entries)
+            target = int(self.max_bytes * 0.9)
+            for _, p, size in entries:
+                if total <= target:
+                    break
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
+
+    def summary(self) -> str:
+        stages = sorted(set(self.hits) | set(self.misses))
+        parts = [f"{st}: {self.hits[st]} hit / {self.misses[st]} miss" for st in stages]
+        return ", ".join(parts) if parts else "no lookups"
@@ -0,0 +1,233 @@
+"""
+Headless entry point: python -m lineforge INPUT OUTPUT [options]
+
+Settings come from the defaults, then an optional JSON/TOML job file, then
+command-line flags. Progress is written to stdout as one JSON object per line;
+the human-readable log goes to stderr. Nothing here imports tkinter.
+
+With --sweep (or "sweep" in the job file) every combination of the swept
+settings is run instead, sharing the stages they have in common (see sweep.py).
+
+Exit codes: 0 ok, 1 run failed, 2 bad arguments or job file, 3 finished but
+some files failed (continue_on_error).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import MISSING, asdict, fields
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .deps import TOOL_ENV, tool
+from .pipeline import run_all
+from .settings import Settings
+from .sweep import parse_sweep, run_sweep, sweep_values
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+
+# Job file keys that are not Settings fields.
+JOB_KEYS = ("input", "output", "sweep")
+
+
+def _field_types() -> Dict[str, type]:
+    types = {"bool": bool, "int": int, "float": float, "str": str}
+    out = {}
+    for f in fields(Settings):
+        t = f.type if isinstance(f.type, type) else types.get(str(f.type))
+        if t is None:
+            raise TypeError(f"Unsupported Settings field type for {f.name}: {f.type!r}")
+        out[f.name] = t
+    return out
+
+
+def _check_value(name: str, value, t: type):
+    """Validate a job-file value against the Settings field type (ints are fine for floats)."""
+    if t is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if (t is not bool and isinstance(value, bool)) or not isinstance(value, t):
+        raise ValueError(f"{name}: expected {t.__name__}, got {type(value).__name__} ({value!r})")
+    return value
+
+
+def load_job(path: Path) -> Dict[str, object]:
+    """Read a JSON or TOML job file (by extension) into a flat dict."""
+    path = Path(path)
+    if path.suffix.lower() == ".toml":
+        try:
+            import tomllib
+        except ModuleNotFoundError:  # Python < 3.11
+            try:
+                import tomli as tomllib  # type: ignore[no-redef]
+            except ModuleNotFoundError:
+                raise ValueError("TOML job files need Python 3.11+ or the 'tomli' package.") from None
+        with open(path, "rb") as fh:
+            data = tomllib.load(fh)
+    else:
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+
+    if not isinstance(data, dict):
+        raise ValueError(f"{path.name}: expected a mapping of setting names to values")
+    return data
+
+
+def settings_from_job(job: Dict[str, object], base: Optional[Settings] = None) -> Settings:
+    """Apply a job mapping onto base (or defaults). Unknown keys are an error."""
+    s = base or Settings()
+    types = _field_types()
+    unknown = sorted(k for k in job if k not in types and k not in JOB_KEYS)
+    if unknown:
+        raise ValueError("Unknown setting(s): " + ", ".join(unknown))
+
+    for name, value in job.items():
+        if name in types:
+            setattr(s, name, _check_value(name, value, types[name]))
+    return s
+
+
+def _job_sweep(spec) -> Dict[str, List[object]]:
+    """The job file's "sweep": a mapping of setting names to a list or a "start:stop:step" / "a,b" string."""
+    if spec is None:
+        return {}
+    if not isinstance(spec, dict):
+        raise ValueError("sweep: expected a mapping of setting names to values")
+    return {name: sweep_values(name, values) for name, values in spec.items()}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="lineforge",
+        description="Run the LineForge pipeline without the UI.",
+    )
+    p.add_argument("input", nargs="?", help="image file or folder (or 'input' in the job file)")
+    p.add_argument("output", nargs="?", help="output folder (or 'output' in the job file)")
+    p.add_argument("-c", "--config", metavar="JOB", help="JSON or TOML file mapping setting names to values")
+    p.add_argument(
+        "--events", choices=("jsonl", "none"), default="jsonl",
+        help="progress events on stdout (default: jsonl)",
+    )
+    p.add_argument("-q", "--quiet", action="store_true", help="do not write the text log to stderr")
+    p.add_argument("--log", metavar="FILE", help="also append the text log to FILE")
+    p.add_argument(
+        "--dump-settings", action="store_true",
+        help="print the effective settings as JSON and exit (a starting point for job files)",
+    )
+    p.add_argument(
+        "--list-tools", action="store_true",
+        help="show the magick/potrace/inkscape found, their versions and capabilities, and exit",
+    )
+
+    p.add_argument(
+        "--sweep", action="append", default=[], metavar="NAME=VALUES",
+        help="run every combination of the swept settings, e.g. trace_cutoff_pct=30:50:5 "
+             "or potrace_turdsize=2,4,8 (repeatable; also 'sweep' in the job file)",
+    )
+    p.add_argument(
+        "--no-contact-sheets", dest="contact_sheets", action="store_false",
+        help="with --sweep: do not write a contact sheet per input image",
+    )
+
+    g = p.add_argument_group("settings", "override any Settings field (see README for meanings)")
+    types = _field_types()
+    for f in fields(Settings):
+        flag = "--" + f.name.replace("_", "-")
+        default = f.default if f.default is not MISSING else None
+        if types[f.name] is bool:
+            g.add_argument(flag, dest=f.name, action=argparse.BooleanOptionalAction, default=None,
+                           help=f"(default: {default})")
+        else:
+            g.add_argument(flag, dest=f.name, type=types[f.name], default=None,
+                           metavar=types[f.name].__name__.upper(), help=f"(default: {default!r})")
+    return p
+
+
+def _writer(stream):
+    def emit(event: Dict[str, object]) -> None:
+        stream.write(json.dumps({"t": round(time.time(), 3), **event}) + "\n")
+        stream.flush()
+    return emit
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        job = load_job(Path(args.config)) if args.config else {}
+        s = settings_from_job(job)
+        sweep = _job_sweep(job.get("sweep"))
+        for item in args.sweep:
+            sweep.update(parse_sweep(item))
+    except (OSError, ValueError) as e:
+        print(f"lineforge: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    for f in fields(Settings):
+        value = getattr(args, f.name)
+        if value is not None:
+            setattr(s, f.name, value)
+
+    if args.dump_settings:
+        print(json.dumps(asdict(s), indent=2))
+        return EXIT_OK
+
+    if args.list_tools:
+        for name in TOOL_ENV:
+            info = tool(name)
+            print(info.describe() if info else f"{name}: not found")
+        return EXIT_OK
+
+    inp = args.input or job.get("input")
+    out = args.output or job.get("output")
+    if not inp or not out:
+        parser.print_usage(sys.stderr)
+        print("lineforge: input and output are required (as arguments or in the job file)", file=sys.stderr)
+        return EXIT_USAGE
+    inp, out = Path(str(inp)), Path(str(out))
+    if not inp.exists():
+        print(f"lineforge: input path not found: {inp}", file=sys.stderr)
+        return EXIT_USAGE
+
+    emit = _writer(sys.stdout) if args.events == "jsonl" else None
+    failures = 0
+
+    def progress(event: Dict[str, object]) -> None:
+        nonlocal failures
+        if event.get("ok") is False:
+            failures += 1
+        if emit:
+            emit(event)
+
+    log_fh = open(args.log, "a", encoding="utf-8") if args.log else None
+
+    def log(msg: str) -> None:
+        if not args.quiet:
+            sys.stderr.write(msg)
+        if log_fh:
+            log_fh.write(msg)
+
+    try:
+        if sweep:
+            run_sweep(inp, out, s, sweep, log, progress, sheets=args.contact_sheets)
+        else:
+            run_all(inp, out, s, log, progress)
+    except Exception as e:
+        log(f"\nFAILED: {e}\n")
+        if emit:
+            emit({"event": "error", "message": str(e)})
+        return EXIT_FAILED
+    finally:
+        if log_fh:
+            log_fh.close()
+
+    return EXIT_PARTIAL if failures else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
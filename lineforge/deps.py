@@ -1,6 +1,37 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import subprocess
 import sys
+import threading
 from pathlib import Path
-from .utils import which
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .utils import hidden_window_kwargs, user_cache_dir, which
+
+# Environment variables that force a tool path (benchmark shims, non-standard installs).
+TOOL_ENV = {"magick": "LINEFORGE_MAGICK", "potrace": "LINEFORGE_POTRACE", "inkscape": "LINEFORGE_INKSCAPE"}
+
+# Bump when the probes change, so cached results from older probes are redone.
+PROBE_VERSION = 1
+PROBE_TIMEOUT_S = 30.0
+
+
+class ToolInfo(NamedTuple):
+    """A resolved external tool and what it can do."""
+    name: str
+    path: str
+    version: str = ""            # as the tool reports it; "" if the probe failed
+    caps: Tuple[str, ...] = ()   # e.g. "stdin" (potrace), "shell" / "legacy-cli" (inkscape)
+
+    def has(self, cap: str) -> bool:
+        return cap in self.caps
+
+    def describe(self) -> str:
+        caps = f" [{', '.join(self.caps)}]" if self.caps else ""
+        return f"{self.name} {self.version or '(version unknown)'}{caps}: {self.path}"
 
 
 def resource_path(rel: str) -> Path:
@@ -10,16 +41,160 @@ def resource_path(rel: str) -> Path:
     return Path(__file__).resolve().parent.parent / rel
 
 
+def _override(tool: str) -> str | None:
+    return os.environ.get(TOOL_ENV[tool], "").strip() or None
+
+
+def _locate(name: str) -> str | None:
+    forced = _override(name)
+    if forced:
+        return forced
+    if name == "potrace":
+        bundled = resource_path("bin") / "potrace.exe"
+        if bundled.exists():
+            return str(bundled)
+        return which("potrace") or which("potrace.exe")
+    if name == "inkscape":
+        return which("inkscape") or which("inkscape.exe")
+    return which(name)
+
+
+# ---- probes ----
+def _run(args: List[str], input_bytes: Optional[bytes] = None) -> Tuple[int, bytes]:
+    """Run a probe; never raises. Returns (returncode, stdout + stderr)."""
+    try:
+        p = subprocess.run(
+            args, input=input_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            timeout=PROBE_TIMEOUT_S, **hidden_window_kwargs(),
+        )
+        return p.returncode, p.stdout + p.stderr
+    except (OSError, subprocess.SubprocessError):
+        return -1, b""
+
+
+def _version(text: bytes, pattern: str) -> str:
+    m = re.search(pattern, text.decode(errors="replace"))
+    return m.group(1) if m else ""
+
+
+def _probe_magick(path: str) -> Tuple[str, Tuple[str, ...]]:
+    _, out = _run([path, "-version"])
+    return _version(out, r"ImageMagick (\d+\.\d+\.\d+(?:-\d+)?)"), ()
+
+
+def _probe_potrace(path: str) -> Tuple[str, Tuple[str, ...]]:
+    _, out = _run([path, "--version"])
+    version = _version(out, r"potrace (\d+\.\d+)")
+    # reads a PBM from stdin ("-") and writes the SVG to stdout: one 1x1 black pixel
+    code, svg = _run([path, "-", "-s", "-o", "-"], b"P4\n1 1\n\x80")
+    caps = ("stdin",) if code == 0 and b"<svg" in svg else ()
+    return version, caps
+
+
+def _probe_inkscape(path: str) -> Tuple[str, Tuple[str, ...]]:
+    _, out = _run([path, "--version"])
+    version = _version(out, r"Inkscape (\d+\.\d+(?:\.\d+)?)")
+    if version.startswith("0."):
+        # 0.92 and older: -z/--export-png syntax, no actions shell
+        return version, ("legacy-cli",)
+    # 1.x, or a version we could not read (assume current)
+    return version, ("actions", "shell")
+
+
+_PROBES = {"magick": _probe_magick, "potrace": _probe_potrace, "inkscape": _probe_inkscape}
+
+
+# ---- registry ----
+def _cache_file() -> Path:
+    forced = os.environ.get("LINEFORGE_TOOL_CACHE", "").strip()
+    if forced:
+        return Path(forced)
+    return user_cache_dir() / "tools.json"
+
+
+def _probe_cached(name: str, path: str) -> ToolInfo:
+    """Probe results are kept on disk per binary, until its size or mtime changes."""
+    try:
+        st = os.stat(path)
+        stamp = [st.st_mtime_ns, st.st_size]
+    except OSError:
+        stamp = None  # e.g. a bare command name: probe every process
+
+    cache = _cache_file()
+    key = f"{name}|{os.path.normcase(os.path.abspath(path))}"
+    entries: Dict[str, dict] = {}
+    try:
+        entries = json.loads(cache.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        pass
+
+    hit = entries.get(key)
+    if stamp and hit and hit.get("stamp") == stamp and hit.get("probe") == PROBE_VERSION:
+        return ToolInfo(name, path, hit["version"], tuple(hit["caps"]))
+
+    version, caps = _PROBES[name](path)
+    if stamp:
+        entries[key] = {"stamp": stamp, "probe": PROBE_VERSION, "version": version, "caps": list(caps)}
+        try:
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(entries, indent=1), encoding="utf-8")
+            os.replace(tmp, cache)
+        except OSError:
+            pass
+    return ToolInfo(name, path, version, caps)
+
+
+_lock = threading.Lock()
+_known: Dict[str, Tuple[Tuple[str, str], ToolInfo]] = {}
+
+
+def tool(name: str) -> Optional[ToolInfo]:
+    """
+    The external tool `name` ("magick", "potrace" or "inkscape"), resolved and
+    probed once per process, or None if it is not installed.
+
+    The result is reused until PATH or the tool's LINEFORGE_* override changes.
+    A missing tool is looked up again on the next call, so installing it does
+    not need a restart.
+    """
+    if name not in _PROBES:
+        raise ValueError(f"Unknown tool: {name!r}")
+    key = (os.environ.get(TOOL_ENV[name], ""), os.environ.get("PATH", ""))
+    with _lock:
+        known = _known.get(name)
+        if known and known[0] == key:
+            return known[1]
+        path = _locate(name)
+        if not path:
+            return None
+        info = _probe_cached(name, path)
+        _known[name] = (key, info)
+        return info
+
+
+def known_tools() -> List[ToolInfo]:
+    """Tools resolved so far in this process."""
+    with _lock:
+        return [info for _, info in _known.values()]
+
+
+def reset_tools() -> None:
+    """Forget resolved tools (the on-disk probe cache is kept)."""
+    with _lock:
+        _known.clear()
+
+
 def find_potrace() -> str | None:
-    bundled = resource_path(r"bin\potrace.exe")
-    if bundled.exists():
-        return str(bundled)
-    return which("potrace") or which("potrace.exe")
+    info = tool("potrace")
+    return info.path if info else None
 
 
 def find_inkscape() -> str | None:
-    return which("inkscape") or which("inkscape.exe")
+    info = tool("inkscape")
+    return info.path if info else None
 
 
 def find_magick() -> str | None:
-    return which("magick")
+    info = tool("magick")
+    return info.path if info else None
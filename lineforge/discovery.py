@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .utils import IMG_EXTS, user_cache_dir
+
+# Bump when the index layout changes; older index files are then ignored.
+INDEX_VERSION = 1
+
+Globs = Union[str, Sequence[str]]
+
+
+def split_globs(globs: Globs) -> Tuple[str, ...]:
+    """Glob patterns from "a;b", "a, b" or a sequence, lower-cased (matching ignores case)."""
+    if isinstance(globs, str):
+        globs = re.split(r"[;,\n]", globs)
+    return tuple(g.strip().replace("\\", "/").lower() for g in globs if g and g.strip())
+
+
+def _matches(patterns: Tuple[str, ...], rel: str, name: str) -> bool:
+    """Patterns containing '/' are matched against the path relative to the input folder, others against the name."""
+    return any(fnmatchcase(rel if "/" in p else name, p) for p in patterns)
+
+
+def _is_image_name(name: str) -> bool:
+    dot = name.rfind(".")
+    return dot > 0 and name[dot:].lower() in IMG_EXTS
+
+
+def _scan(folder: str, recursive: bool) -> Tuple[List[str], List[str]]:
+    """Image file names and (when recursive) subfolder names in one folder, from a single scandir."""
+    images: List[str] = []
+    subdirs: List[str] = []
+    try:
+        with os.scandir(folder) as it:
+            for e in it:
+                # the directory entry's own type, no extra stat on Windows and most Linux filesystems
+                if _is_image_name(e.name) and e.is_file():
+                    images.append(e.name)
+                elif recursive and e.is_dir(follow_symlinks=False):
+                    subdirs.append(e.name)
+    except OSError:
+        pass  # unreadable folder: skipped, like a folder without images
+    return images, subdirs
+
+
+class DirIndex:
+    """
+    Image names and subfolders per folder, saved to disk and reused for a
+    folder as long as its modification time is unchanged.
+
+    Adding, removing or renaming entries changes a folder's mtime, so a rescan
+    only lists the folders that changed; unchanged folders cost one stat each.
+    (Some network filesystems do not update folder mtimes reliably: leave the
+    index off there.)
+    """
+
+    def __init__(self, file: Path):
+        self.file = Path(file)
+        self.dirs: Dict[str, list] = {}
+        self.reused = 0
+        self.rescanned = 0
+        self._seen: set = set()
+        self._dirty = False
+        try:
+            data = json.loads(self.file.read_text(encoding="utf-8"))
+            if data.get("version") == INDEX_VERSION:
+                self.dirs = data["dirs"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    @classmethod
+    def for_root(cls, root: Path) -> "DirIndex":
+        """The index kept in the user cache folder for one input folder."""
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(root)).encode()).hexdigest()[:20]
+        return cls(user_cache_dir() / "index" / f"{key}.json")
+
+    def listing(self, folder: str, recursive: bool) -> Tuple[List[str], List[str]]:
+        """Like _scan, from the index when the folder has not changed since it was indexed."""
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            return [], []
+        self._seen.add(folder)
+        hit = self.dirs.get(folder)
+        if hit and hit[0] == mtime:
+            self.reused += 1
+            images, subdirs = hit[1], hit[2]
+        else:
+            # always list subfolders, so the entry also serves recursive scans
+            images, subdirs = _scan(folder, True)
+            self.dirs[folder] = [mtime, images, subdirs]
+            self.rescanned += 1
+            self._dirty = True
+        return images, (subdirs if recursive else [])
+
+    def save(self, root: Optional[str] = None) -> None:
+        """
+        Write the index if anything changed. With root, folders under root that
+        were not visited (deleted since) are dropped first; only pass it after a
+        complete recursive walk.
+        """
+        if root is not None:
+            prefix = os.path.join(root, "")
+            gone = [d for d in self.dirs if (d == root or d.startswith(prefix)) and d not in self._seen]
+            for d in gone:
+                del self.dirs[d]
+            self._dirty |= bool(gone)
+        if not self._dirty:
+            return
+        try:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.file.with_name(f"{self.file.name}.{os.getpid()}.{id(self)}.tmp")
+            tmp.write_text(json.dumps({"version": INDEX_VERSION, "dirs": self.dirs}), encoding="utf-8")
+            os.replace(tmp, self.file)
+            self._dirty = False
+        except OSError:
+            pass
+
+    def summary(self) -> str:
+        return f"{self.reused} folder(s) from the index, {self.rescanned} rescanned"
+
+
+def iter_images(
+    path: Path,
+    recursive: bool = False,
+    include: Globs = (),
+    exclude: Globs = (),
+    index: Optional[DirIndex] = None,
+) -> Iterator[Path]:
+    """
+    Yield supported image files under path as they are found (in no particular
+    order). A file path yields itself if it is a supported image.
+
+    include: if given, only files matching one of these globs are yielded.
+    exclude: files matching one of these are skipped, as are whole subfolders
+        matching one (e.g. "_cache", "*/thumbs").
+    Globs without '/' match the file or folder name, globs with '/' the path
+    relative to path; matching ignores case.
+
+    Folder symlinks are not followed. With index, unchanged folders are listed
+    from it and the index is saved once the walk completes.
+    """
+    path = Path(path)
+    if path.is_file():
+        if _is_image_name(path.name):
+            yield path
+        return
+    if not path.is_dir():
+        return
+
+    inc, exc = split_globs(include), split_globs(exclude)
+    root = str(path)
+    stack: List[Tuple[str, str]] = [(root, "")]
+    while stack:
+        folder, rel = stack.pop()
+        images, subdirs = index.listing(folder, recursive) if index else _scan(folder, recursive)
+        for name in images:
+            r = rel + name
+            lname, lrel = name.lower(), r.lower()
+            if inc and not _matches(inc, lrel, lname):
+                continue
+            if exc and _matches(exc, lrel, lname):
+                continue
+            yield Path(folder, name)
+        for name in reversed(subdirs):
+            r = rel + name
+            if exc and _matches(exc, r.lower(), name.lower()):
+                continue
+            stack.append((os.path.join(folder, name), r + "/"))
+
+    if index is not None:
+        index.save(root if recursive and not exc else None)
+
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image, features
+
+# Speed/size trade-off of the raster encoders. "fast" for intermediates that
+# are only read back by the next stage, "smallest" for deliverables.
+OUTPUT_PROFILES = ("fast", "balanced", "smallest")
+OUTPUT_FORMATS = ("png", "jpg", "webp")  # WebP is always lossless
+
+# Pillow save options per format and profile.
+_PILLOW: Dict[str, Dict[str, Dict[str, object]]] = {
+    "png": {
+        "fast": {"compress_level": 1},
+        "balanced": {"compress_level": 6},
+        "smallest": {"optimize": True},  # zlib level 9
+    },
+    "jpg": {
+        "fast": {"subsampling": 2},                                     # 4:2:0
+        "balanced": {"subsampling": 0, "optimize": True},               # 4:4:4 keeps line edges crisp
+        "smallest": {"subsampling": 2, "optimize": True, "progressive": True},
+    },
+    "webp": {
+        "fast": {"lossless": True, "method": 0, "quality": 0},
+        "balanced": {"lossless": True, "method": 4, "quality": 50},
+        # higher effort costs seconds per image for ~1% smaller files
+        "smallest": {"lossless": True, "method": 6, "quality": 80},
+    },
+}
+
+# The same for ImageMagick: arguments written before the output.
+_MAGICK: Dict[str, Dict[str, List[str]]] = {
+    "png": {
+        "fast": ["-define", "png:compression-level=1", "-define", "png:compression-filter=0"],  # no row filter
+        "balanced": ["-define", "png:compression-level=6", "-define", "png:compression-filter=5"],  # adaptive
+        "smallest": ["-define", "png:compression-level=9", "-define", "png:compression-filter=5"],
+    },
+    "webp": {
+        "fast": ["-define", "webp:lossless=true", "-define", "webp:method=0", "-quality", "0"],
+        "balanced": ["-define", "webp:lossless=true", "-define", "webp:method=4", "-quality", "50"],
+        "smallest": ["-define", "webp:lossless=true", "-define", "webp:method=6", "-quality", "80"],
+    },
+}
+
+
+def output_format(fmt: str, allowed: Tuple[str, ...] = OUTPUT_FORMATS) -> str:
+    """fmt normalized ("jpeg" -> "jpg"); ValueError if it is not one of allowed."""
+    fmt = (fmt or "png").strip().lower()
+    fmt = "jpg" if fmt == "jpeg" else fmt
+    if fmt not in allowed:
+        raise ValueError(f"Unknown output format: {fmt!r}")
+    if fmt == "webp" and not features.check("webp"):
+        raise RuntimeError("This Pillow build has no WebP support.")
+    return fmt
+
+
+def output_profile(profile: str) -> str:
+    profile = (profile or "balanced").strip().lower()
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile: {profile!r}")
+    return profile
+
+
+def suffix(fmt: str) -> str:
+    return "." + output_format(fmt)
+
+
+def save_image(img: Image.Image, dst: Path, fmt: str = "png", profile: str = "balanced",
+               jpeg_quality: int = 95) -> Path:
+    """Save img to dst as fmt with the encoder settings of profile."""
+    fmt = output_format(fmt)
+    opts = dict(_PILLOW[fmt][output_profile(profile)])
+    if fmt == "jpg":
+        opts["quality"] = int(jpeg_quality)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+    img.save(dst, format={"png": "PNG", "jpg": "JPEG", "webp": "WEBP"}[fmt], **opts)
+    return Path(dst)
+
+
+def magick_output(dst: Path, fmt: str = "png", profile: str = "balanced") -> Tuple[List[str], str]:
+    """The encoder arguments and output spec that make magick write dst as fmt (png or webp)."""
+    fmt = output_format(fmt, ("png", "webp"))
+    return list(_MAGICK[fmt][output_profile(profile)]), f"{fmt}:{dst}"
+
+
+def reencode(src: Path, dst: Path, fmt: str = "png", profile: str = "balanced") -> Path:
+    """
+    Bring a PNG written by an external tool (Inkscape) to fmt and profile at
+    dst. A PNG is only rewritten for "smallest"; src is removed if dst differs.
+    """
+    src, dst = Path(src), Path(dst)
+    fmt = output_format(fmt, ("png", "webp"))
+    if fmt == "png" and output_profile(profile) != "smallest" and src == dst:
+        return dst
+    with Image.open(src) as im:
+        im.load()
+    save_image(im, dst, fmt, profile)
+    if src != dst:
+        src.unlink(missing_ok=True)
+    return dst
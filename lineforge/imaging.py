@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import io
+from pathlib import Path
+from typing import NamedTuple, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+# Rec.709 luma weights, as used by magick's "-colorspace Gray".
+LUMA = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+class MemoryImage(NamedTuple):
+    """A decoded stage output handed to the next stage without being written to disk."""
+    name: str  # file name the image would have been saved under
+    image: Image.Image
+
+    @property
+    def stem(self) -> str:
+        return Path(self.name).stem
+
+
+def load_image(src: Union[Path, Image.Image]) -> Image.Image:
+    """Decode src fully (file path) or return it unchanged (already an image)."""
+    if isinstance(src, Image.Image):
+        return src
+    img = Image.open(src)
+    img.load()  # single-frame formats release the file handle here
+    return img
+
+
+def encode_png(img: Image.Image, compress_level: int = 1) -> bytes:
+    """PNG bytes for piping an in-memory image into an external tool (fast compression)."""
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=compress_level)
+    return buf.getvalue()
+
+
+def decode_image(data: bytes) -> Image.Image:
+    """Decode encoded image bytes (e.g. a tool's stdout) fully into memory."""
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def flatten(img: Image.Image, bg: Tuple[int, int, int] = (255, 255, 255)) -> Image.Image:
+    """
+    Composite any transparency onto bg and return an "L" or "RGB" image.
+
+    Equivalent of magick's `-background <bg> -alpha remove -alpha off`.
+    16-bit grayscale is scaled down to 8 bits rather than clipped.
+    """
+    if img.mode in ("I;16", "I;16L", "I;16B", "I"):
+        arr = np.asarray(img, dtype=np.float32) / 257.0
+        return Image.fromarray(np.clip(arr + 0.5, 0, 255).astype(np.uint8), "L")
+
+    if img.mode in ("P", "PA"):
+        img = img.convert("RGBA")
+
+    if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+        img = img.convert("RGBA")
+        base = Image.new("RGBA", img.size, tuple(bg) + (255,))
+        base.alpha_composite(img)
+        return base.convert("RGB")
+
+    if img.mode in ("L", "RGB"):
+        return img
+    if img.mode == "1":
+        return img.convert("L")
+    return img.convert("RGB")
+
+
+def gray(arr: np.ndarray) -> np.ndarray:
+    """Luma of an (H, W) or (H, W, 3) array as float32 in the same 0..255 range."""
+    if arr.ndim == 2:
+        return arr.astype(np.float32, copy=False)
+    return arr[..., :3].astype(np.float32, copy=False) @ LUMA
+
+
+def to_uint8(arr: np.ndarray) -> np.ndarray:
+    """Round and clip a float array to uint8."""
+    return np.clip(np.rint(arr), 0, 255).astype(np.uint8)
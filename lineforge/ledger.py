@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+LEDGER_FILE = "run_ledger.sqlite"
+
+# Bump when the schema changes; a ledger written by another version is started afresh.
+LEDGER_VERSION = 1
+
+# Updates are committed in groups: once this many are pending, or this long after the last commit.
+COMMIT_EVERY = 500
+COMMIT_INTERVAL_S = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    started  TEXT NOT NULL,
+    finished TEXT,
+    status   TEXT NOT NULL,  -- running | done | failed | cancelled
+    input    TEXT,
+    settings TEXT            -- JSON
+);
+CREATE TABLE IF NOT EXISTS items (
+    src         TEXT NOT NULL,  -- the input image (or ICO frame) the file started as
+    stage       TEXT NOT NULL,  -- A | B | C | O | D
+    status      TEXT NOT NULL,  -- running | done | failed
+    input       TEXT,           -- what the stage read; NULL when handed over in memory
+    output      TEXT,           -- what it wrote; NULL when kept in memory
+    fingerprint TEXT,           -- source file stamp + settings of this and the earlier stages
+    out_stamp   TEXT,           -- size:mtime of output when it was written
+    error       TEXT,
+    run_id      INTEGER,
+    updated     TEXT,
+    PRIMARY KEY (src, stage)
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (status);
+"""
+
+_UPSERT = (
+    "INSERT OR REPLACE INTO items "
+    "(src, stage, status, input, output, fingerprint, out_stamp, error, run_id, updated) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def file_stamp(path: Union[str, Path]) -> Optional[str]:
+    """size:mtime_ns of a file, or None if it cannot be read."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def fingerprint(stamp: Optional[str], params: str) -> str:
+    """What a stage output depends on: its source file's stamp and the (JSON) settings chain."""
+    return hashlib.sha1(f"{stamp}|{params}".encode()).hexdigest()
+
+
+def _key(src: Union[str, Path]) -> str:
+    return os.path.abspath(str(src))
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class Ledger:
+    """
+    The status of every file in every stage of the runs into one output folder,
+    kept in SQLite so it survives crashes and can be queried afterwards.
+
+    Each (source file, stage) has one row holding the latest attempt: running,
+    done or failed, what it read and wrote, and a fingerprint of the source file
+    and settings it was produced from. Safe to update from worker threads;
+    updates are committed in groups (see COMMIT_EVERY), so a crash loses at most
+    the last second or so, and those files are simply done again on resume.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.run_id: Optional[int] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._done: Optional[Dict[Tuple[str, str], Tuple[Optional[str], str, Optional[str]]]] = None
+
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] not in (0, LEDGER_VERSION):
+            self._db.executescript("DROP TABLE IF EXISTS items; DROP TABLE IF EXISTS runs;")
+        self._db.executescript(_SCHEMA)
+        self._db.execute(f"PRAGMA user_version = {LEDGER_VERSION}")
+        self._db.commit()
+
+    # ---- runs ----
+    def begin_run(self, input_path: Path, settings: Dict[str, object]) -> int:
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO runs (started, status, input, settings) VALUES (?, 'running', ?, ?)",
+                (_now(), str(input_path), json.dumps(settings)),
+            )
+            self._db.commit()
+            self.run_id = cur.lastrowid
+        return self.run_id
+
+    def end_run(self, status: str) -> None:
+        with self._lock:
+            self._db.execute("UPDATE runs SET finished = ?, status = ? WHERE id = ?", (_now(), status, self.run_id))
+            self._db.commit()
+            self._pending = 0
+
+    # ---- items ----
+    def mark_running(self, stage: str, rows: Iterable[Tuple[Path, Optional[str], str]]) -> None:
+        """Record (src, input, fingerprint) rows as started in stage."""
+        now = _now()
+        data = [(_key(src), stage, "running", inp, None, fp, None, None, self.run_id, now) for src, inp, fp in rows]
+        with self._lock:
+            self._db.executemany(_UPSERT, data)
+            self._maybe_commit(len(data))
+
+    def record(
+        self,
+        stage: str,
+        src: Path,
+        inp: Optional[str],
+        output: Optional[Path],
+        fp: str,
+        error: Optional[str] = None,
+    ) -> None:
+        """Record src as done in stage (or failed, with error)."""
+        out = str(output) if output is not None else None
+        stamp = file_stamp(output) if output is not None and error is None else None
+        row = (
+            _key(src), stage, "failed" if error is not None else "done",
+            inp, out, fp, stamp, error, self.run_id, _now(),
+        )
+        with self._lock:
+            self._db.execute(_UPSERT, row)
+            self._maybe_commit(1)
+
+    def _maybe_commit(self, n: int) -> None:
+        self._pending += n
+        now = time.monotonic()
+        if self._pending >= COMMIT_EVERY or now - self._last_commit >= COMMIT_INTERVAL_S:
+            self._db.commit()
+            self._pending = 0
+            self._last_commit = now
+
+    # ---- resume ----
+    def resume_point(self, src: Path, plan: Sequence[Tuple[str, str, bool]]) -> List[Optional[Path]]:
+        """
+        Outputs of the leading stages src does not need to run again.
+
+        plan lists (stage, fingerprint, writes_file) in pipeline order. A stage
+        counts as finished when it is recorded as done with the same fingerprint
+        and, if it writes a file, that file is still there unchanged. The result
+        ends at the last finished stage that wrote a file (so the next stage has
+        something to read); stages kept in memory give None.
+        """
+        if self._done is None:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT src, stage, output, fingerprint, out_stamp FROM items WHERE status = 'done'"
+                ).fetchall()
+            self._done = {(r[0], r[1]): (r[2], r[3], r[4]) for r in rows}
+
+        key = _key(src)
+        outs: List[Optional[Path]] = []
+        usable = 0
+        for stage, fp, writes_file in plan:
+            row = self._done.get((key, stage))
+            if row is None or row[1] != fp:
+                break
+            if not writes_file:
+                outs.append(None)
+                continue
+            if row[0] is None or row[2] is None or file_stamp(row[0]) != row[2]:
+                break
+            outs.append(Path(row[0]))
+            usable = len(outs)
+        return outs[:usable]
+
+    # ---- reporting ----
+    def counts(self) -> Dict[str, int]:
+        """Items per status recorded by the current run."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM items WHERE run_id = ? GROUP BY status", (self.run_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def failures(self) -> List[Tuple[str, str, str]]:
+        """(src, stage, error) of every item whose latest attempt failed."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT src, stage, error FROM items WHERE status = 'failed' ORDER BY src, stage"
+            ).fetchall()
+
+    def summary(self) -> str:
+        c = self.counts()
+        return f"{c.get('done', 0)} done, {c.get('failed', 0)} failed, {c.get('running', 0)} unfinished this run"
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
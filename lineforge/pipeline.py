@@ -1,167 +1,943 @@
 from __future__ import annotations
 
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, replace
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar, Union
+
+from PIL import Image
 
 from .utils import list_images
-from .deps import find_magick, find_potrace, find_inkscape
-from .settings import Settings
-from .stages.preprocess import preprocess_magick
-from .stages.pad import pad_square
-from .stages.trace import trace_to_svg
-from .stages.export import export_svg_to_png
-from .stages.icon import split_ico_to_pngs, rebuild_ico_from_pngs
-
-
-def _choose_last_raster_dir(output_root: Path, s: Settings) -> Path:
-    if s.do_export and (output_root / "04_export_png").exists():
-        return output_root / "04_export_png"
-    if s.do_pad and (output_root / "02_padded").exists():
-        return output_root / "02_padded"
-    if s.do_preprocess and (output_root / "01_preprocessed").exists():
-        return output_root / "01_preprocessed"
-    return output_root
-
-
-def run_all(input_path: Path, output_root: Path, s: Settings, log) -> None:
+from .imaging import MemoryImage, load_image
+from .deps import find_magick, known_tools, tool
+from .settings import Settings, stage_params
+from .cache import StageCache
+from .telemetry import Telemetry
+from .ledger import LEDGER_FILE, Ledger, file_stamp, fingerprint
+from .stages.preprocess import (
+    PREPROCESS_ENGINES,
+    preprocess_image,
+    preprocess_magick,
+    preprocess_magick_batch,
+    preprocess_magick_image,
+    preprocess_pillow,
+)
+from .stages.pad import open_for_pad, pad_image, pad_output_path, pad_square
+from .stages.tiled import needs_tiling, pad_tiled, preprocess_tiled, trace_tiled
+from .stages.trace import TRACE_BINARIZERS, TRACE_ENGINES, trace_batch_to_svg, trace_native, trace_to_svg
+from .encode import output_format, output_profile, reencode, save_image, suffix
+from .stages.optimize import optimize_svg, saving
+from .stages.export import EXPORT_ENGINES, InkscapeShellPool, export_svg_builtin, export_svg_to_png
+from .stages.icon import (
+    ICO_ENGINES,
+    build_icon_pyramids,
+    parse_icon_sizes,
+    rebuild_icos_batch,
+    rebuild_icos_native,
+    split_icos_batch,
+    split_icos_native,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+PIPELINE_MODES = ("staged", "streaming")
+OPTIMIZE_NEEDS_TRACE = "Optimize SVG needs Trace: it only reads traced SVGs. Enable do_trace or turn off do_optimize."
+
+# Receives machine-readable run events: dicts with an "event" key ("start", "stage",
+# "file", "ico_split", "ico_rebuild", "done") plus event-specific fields.
+Progress = Callable[[Dict[str, object]], None]
+
+
+def _no_progress(event: Dict[str, object]) -> None:
+    pass
+
+
+class RunCancelled(RuntimeError):
+    """Raised by run_all when its cancel event is set; files already done are kept."""
+
+
+def _check_cancel(cancel: Optional[threading.Event]) -> None:
+    if cancel is not None and cancel.is_set():
+        raise RunCancelled("Cancelled.")
+
+
+def _outcome(result) -> Dict[str, object]:
+    """The ok/output/error fields of a per-file event."""
+    if isinstance(result, Exception):
+        return {"ok": False, "error": str(result)}
+    if isinstance(result, list):
+        result = result[-1] if result else None
+    return {"ok": True, "output": str(result) if isinstance(result, Path) else None}
+
+
+# What flows between stages: a file on disk, or (keep_intermediates off) a decoded image.
+Item = Union[Path, MemoryImage]
+
+
+class Step(NamedTuple):
+    """One enabled stage: where it writes and how it turns one input into one output."""
+    key: str
+    title: str
+    out_dir: Path
+    raster: bool  # output is a raster image (usable for ICO rebuild)
+    run: Callable[[Item], Item]
+    # optional: many inputs in one go (batched magick); one output or exception per input
+    run_many: Optional[Callable[[List[Path]], List[Union[Path, Exception]]]] = None
+    close: Optional[Callable[[], None]] = None  # releases long-lived workers after the run
+    in_memory: bool = False  # outputs are MemoryImage, nothing is written to out_dir
+    note: Optional[Callable[[Item, Item], str]] = None  # a log line about one file, from its input and output
+
+    def target(self) -> str:
+        return "(kept in memory)" if self.in_memory else str(self.out_dir)
+
+
+def _worker_count(s: Settings) -> int:
+    n = int(s.workers or 0)
+    if n <= 0:
+        n = os.cpu_count() or 1
+    return max(1, n)
+
+
+def _attempt(fn: Callable[[T], R], item: T) -> Union[R, Exception]:
+    try:
+        return fn(item)
+    except Exception as e:
+        return e
+
+
+def _run_batch(
+    items: List[T],
+    fn: Callable[[T], R],
+    name: Callable[[T], str],
+    s: Settings,
+    log,
+    fn_many: Optional[Callable[[List[T]], List[Union[R, Exception]]]] = None,
+    chunk: int = 1,
+    report: Optional[Callable[[int, int, T, Union[R, Exception]], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[Tuple[T, R]]:
+    """
+    Run fn(item) for every item on a worker pool.
+
+    The stage work is almost entirely external processes, so threads are enough to
+    keep every core busy. Log lines are written from the calling thread in input
+    order. On failure either the error is re-raised (pending items are cancelled)
+    or, with continue_on_error, logged and the item dropped.
+
+    With fn_many and chunk > 1, items are handed over `chunk` at a time and
+    fn_many returns a result or an exception for each of them.
+
+    report(index, total, item, result_or_exception) is called for every item,
+    in input order, from the calling thread.
+
+    Once cancel is set no new item is started; items already running finish and
+    RunCancelled is raised.
+
+    Returns (item, result) for the items that completed.
+    """
+    total = len(items)
+    done: List[Tuple[T, R]] = []
+
+    if fn_many is not None and chunk > 1:
+        groups = [items[i:i + chunk] for i in range(0, total, chunk)]
+        call = fn_many
+    else:
+        groups = [[item] for item in items]
+        call = lambda group: [_attempt(fn, group[0])]  # noqa: E731
+
+    def _call(group):
+        _check_cancel(cancel)
+        return call(group)
+
+    with ThreadPoolExecutor(max_workers=_worker_count(s)) as pool:
+        futures = [pool.submit(_call, group) for group in groups]
+        i = 0
+        try:
+            for group, fut in zip(groups, futures):
+                for item in group:
+                    i += 1
+                    log(f"  [{i}/{total}] {name(item)}\n")
+                for k, (item, result) in enumerate(zip(group, fut.result())):
+                    if report is not None:
+                        report(i - len(group) + k + 1, total, item, result)
+                    if isinstance(result, Exception):
+                        if not s.continue_on_error:
+                            raise result
+                        log(f"    FAILED: {name(item)}: {result}\n")
+                        continue
+                    done.append((item, result))
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+    return done
+
+
+def _image(item: Item):
+    """The stage input as the stage functions take it: a path or a PIL image."""
+    return item.image if isinstance(item, MemoryImage) else item
+
+
+def _cached(
+    cache: Optional[StageCache],
+    s: Settings,
+    key: str,
+    src: Item,
+    dst: Path,
+    fn: Callable[[], Path],
+) -> Path:
+    if cache is None or isinstance(src, MemoryImage):
+        return fn()  # in-memory inputs have no file to hash
+    return cache.run(key, src, dst, _stage_params(s, key), fn)
+
+
+def _cached_many(
+    cache: Optional[StageCache],
+    s: Settings,
+    key: str,
+    pairs: List[Tuple[Path, Path]],
+    fn_many: Callable[[List[Tuple[Path, Path]]], List[Union[Path, Exception]]],
+) -> List[Union[Path, Exception]]:
+    """_cached for a batch: only the (src, dst) pairs missing from the cache reach fn_many."""
+    if cache is None:
+        return fn_many(pairs)
+
+    params = _stage_params(s, key)
+    results: List[Union[Path, Exception, None]] = [None] * len(pairs)
+    todo: List[Tuple[int, Path]] = []
+    for i, (src, dst) in enumerate(pairs):
+        entry = cache.entry(key, src, params, dst.suffix)
+        if cache.restore(key, entry, dst):
+            results[i] = dst
+        else:
+            todo.append((i, entry))
+
+    if todo:
+        for (i, entry), out in zip(todo, fn_many([pairs[i] for i, _ in todo])):
+            if not isinstance(out, Exception):
+                cache.store(Path(out), entry)
+            results[i] = out
+    return results  # type: ignore[return-value]
+
+
+def _enabled(s: Settings) -> List[str]:
+    return [key for key, on in (
+        ("A", s.do_preprocess), ("B", s.do_pad), ("C", s.do_trace), ("O", s.do_optimize), ("D", s.do_export),
+    ) if on]
+
+
+def _ico_source(s: Settings, enabled: List[str]) -> List[str]:
+    """The stage whose output an ICO is rebuilt from (those frames must exist as files)."""
+    return [k for k in enabled if k not in ("C", "O")][-1:] if s.handle_ico else []
+
+
+def _stage_profile(s: Settings, key: str) -> str:
+    """Encoder profile of stage `key`: deliverables (the last stage, ICO frames) vs intermediates."""
+    enabled = _enabled(s)
+    final = key == enabled[-1] or key in _ico_source(s, enabled)
+    return output_profile(s.output_profile if final else s.intermediate_profile)
+
+
+def _stage_params(s: Settings, key: str) -> Dict[str, object]:
+    """stage_params with the one encoder profile the stage writes with, for cache keys and fingerprints."""
+    params = stage_params(s, key)
+    if "output_profile" in params:
+        del params["output_profile"], params["intermediate_profile"]
+        params["profile"] = _stage_profile(s, key)
+    return params
+
+
+def build_steps(output_root: Path, s: Settings, cache: Optional[StageCache] = None) -> List[Step]:
+    """Resolve tools and output folders for every enabled stage, in pipeline order."""
+    steps: List[Step] = []
+
+    enabled = _enabled(s)
+    # O reads SVGs: right after C, or on its own when its inputs already are SVGs (a sweep)
+    if s.do_optimize and not s.do_trace and enabled[0] != "O":
+        raise ValueError(OPTIMIZE_NEEDS_TRACE)
+    ico_source = _ico_source(s, enabled)
+
+    def in_memory(key: str) -> bool:
+        """Whether stage `key` hands its output to the next stage without writing it."""
+        if s.keep_intermediates or s.tiled or key in ico_source:
+            return False
+        nxt = enabled[enabled.index(key) + 1:enabled.index(key) + 2]
+        return nxt in (["B"], ["C"])
+
+    # Tiled mode: each worker gets an equal share of the budget
+    tile_mb = max(64, int(s.tile_memory_mb) // _worker_count(s))
+    tile_mag = find_magick() if s.tiled else None
+
+    def tiled(src: Item) -> bool:
+        return s.tiled and isinstance(src, Path) and needs_tiling(src, tile_mb)
+
+    # A) preprocess
+    if s.do_preprocess:
+        engine = (s.preprocess_engine or "magick").strip().lower()
+        if engine not in PREPROCESS_ENGINES:
+            raise ValueError(f"Unknown preprocess engine: {engine!r}")
+        mag = None
+        if engine == "magick":
+            mag = find_magick()
+            if not mag:
+                raise RuntimeError("ImageMagick 'magick' not found on PATH.")
+        keep_a = not in_memory("A")
+        d1 = output_root / "01_preprocessed"
+        if keep_a:
+            d1.mkdir(parents=True, exist_ok=True)
+        opts = (
+            s.grayscale, s.auto_level, s.contrast_stretch,
+            s.cs_black, s.cs_white, s.median, s.blur,
+            s.negate,
+            s.preprocess_mode, s.threshold_pct, s.quantize_levels
+        )
+
+        ext, prof_a = suffix(output_format(s.preprocess_out_fmt, ("png", "webp"))), _stage_profile(s, "A")
+
+        def _preprocess(src: Item) -> Item:
+            if tiled(src):
+                pgm = d1 / (src.stem + ".pgm")
+                return _cached(cache, s, "A", src, pgm, lambda: preprocess_tiled(tile_mag, src, pgm, tile_mb, *opts))
+            dst = d1 / (src.stem + ext)
+            if not keep_a:
+                if mag is None:
+                    img = preprocess_image(load_image(_image(src)), *opts)
+                else:
+                    img = preprocess_magick_image(mag, _image(src), *opts)
+                return MemoryImage(dst.name, img)
+            if mag is None:
+                return _cached(cache, s, "A", src, dst, lambda: preprocess_pillow(
+                    _image(src), dst, *opts, profile=prof_a
+                ))
+            if isinstance(src, MemoryImage):
+                save_image(preprocess_magick_image(mag, src.image, *opts), dst, ext[1:], prof_a)
+                return dst
+            return _cached(cache, s, "A", src, dst, lambda: preprocess_magick(
+                mag, src, dst, *opts, profile=prof_a
+            ))
+
+        def _preprocess_many(srcs: List[Path]) -> List[Union[Path, Exception]]:
+            pairs = [(src, d1 / (src.stem + ext)) for src in srcs]
+            return _cached_many(cache, s, "A", pairs, lambda todo: preprocess_magick_batch(
+                mag, todo, opts, s.magick_batch_size, prof_a
+            ))
+
+        batchable = mag and keep_a and not s.tiled
+        steps.append(Step("A", "Preprocess", d1, True, _preprocess, _preprocess_many if batchable else None,
+                          in_memory=not keep_a))
+
+    # B) pad
+    if s.do_pad:
+        keep_b = not in_memory("B")
+        d2 = output_root / "02_padded"
+        if keep_b:
+            d2.mkdir(parents=True, exist_ok=True)
+
+        prof_b = _stage_profile(s, "B")
+
+        def _pad(src: Item) -> Item:
+            dst = pad_output_path(d2 / src.stem, s.pad_out_fmt)
+            if tiled(src):
+                return _cached(cache, s, "B", src, dst, lambda: pad_tiled(
+                    tile_mag, src, d2 / src.stem, s.pad_size, s.pad_bg, s.pad_out_fmt, s.jpeg_quality, tile_mb, prof_b
+                ))
+            if not keep_b:
+                img = pad_image(open_for_pad(_image(src), s.pad_size), s.pad_size, s.pad_bg, s.pad_out_fmt)
+                return MemoryImage(dst.name, img)
+            return _cached(cache, s, "B", src, dst, lambda: pad_square(
+                _image(src), d2 / src.stem, s.pad_size, s.pad_bg, s.pad_out_fmt, s.jpeg_quality, prof_b
+            ))
+
+        steps.append(Step("B", "Pad", d2, True, _pad, in_memory=not keep_b))
+
+    # C) trace
+    if s.do_trace:
+        tracer = (s.trace_engine or "potrace").strip().lower()
+        if tracer not in TRACE_ENGINES:
+            raise ValueError(f"Unknown trace engine: {tracer!r}")
+        binarize = (s.trace_binarize or "magick").strip().lower()
+        if binarize not in TRACE_BINARIZERS:
+            raise ValueError(f"Unknown trace binarizer: {binarize!r}")
+        mag = potrace = None
+        potrace_stdin = False
+        if tracer == "potrace":
+            if binarize == "magick":
+                mag = find_magick()
+                if not mag:
+                    raise RuntimeError("ImageMagick 'magick' not found on PATH (needed for trace PBM).")
+            info = tool("potrace")
+            if not info:
+                raise RuntimeError("potrace not found. Put potrace.exe in bin\\ or install potrace.")
+            potrace, potrace_stdin = info.path, info.has("stdin")
+        d3 = output_root / "03_svg"
+        d3.mkdir(parents=True, exist_ok=True)
+
+        def _trace(src: Item) -> Path:
+            dst = d3 / (src.stem + ".svg")
+            if tiled(src):
+                return _cached(cache, s, "C", src, dst, lambda: trace_tiled(
+                    tile_mag, potrace, src, dst, tile_mb,
+                    s.trace_cutoff_pct, s.trace_invert,
+                    s.potrace_turdsize, s.potrace_smooth, potrace_stdin,
+                ))
+            if potrace is None:
+                return _cached(cache, s, "C", src, dst, lambda: trace_native(
+                    _image(src), dst,
+                    s.trace_cutoff_pct, s.trace_invert,
+                    s.potrace_turdsize, s.potrace_smooth,
+                ))
+            return _cached(cache, s, "C", src, dst, lambda: trace_to_svg(
+                mag, potrace, _image(src), dst,
+                s.trace_cutoff_pct, s.trace_invert,
+                s.potrace_turdsize, s.potrace_smooth,
+                binarize, potrace_stdin,
+            ))
+
+        def _trace_many(srcs: List[Path]) -> List[Union[Path, Exception]]:
+            pairs = [(src, d3 / (src.stem + ".svg")) for src in srcs]
+            return _cached_many(cache, s, "C", pairs, lambda todo: trace_batch_to_svg(
+                mag, potrace, todo,
+                s.trace_cutoff_pct, s.trace_invert,
+                s.potrace_turdsize, s.potrace_smooth,
+                s.magick_batch_size,
+            ))
+
+        # batching needs the inputs on disk; in-memory inputs are piped one by one
+        batchable = mag and not (steps and steps[-1].in_memory) and not s.tiled
+        steps.append(Step("C", "Trace", d3, False, _trace, _trace_many if batchable else None))
+
+    # O) optimize SVG
+    if s.do_optimize:
+        d3o = output_root / "03_svg_optimized"
+        d3o.mkdir(parents=True, exist_ok=True)
+
+        def _optimize(svg: Item) -> Path:
+            dst = d3o / (svg.stem + ".svg")
+            return _cached(cache, s, "O", svg, dst, lambda: optimize_svg(
+                _image(svg), dst, s.svg_precision, s.svg_merge_paths
+            ))
+
+        steps.append(Step("O", "Optimize SVG", d3o, False, _optimize, note=saving))
+
+    # D) export
+    if s.do_export:
+        engine = (s.export_engine or "inkscape").strip().lower()
+        if engine not in EXPORT_ENGINES:
+            raise ValueError(f"Unknown export engine: {engine!r}")
+        ink = tool("inkscape")  # optional for "builtin": only used as its fallback
+        if not ink and engine != "builtin":
+            raise RuntimeError("Inkscape not found on PATH (needed for export).")
+        inkscape = ink.path if ink else None
+        legacy = bool(ink) and ink.has("legacy-cli")
+        if engine == "inkscape-shell" and not ink.has("shell"):
+            raise RuntimeError(f"The inkscape-shell engine needs Inkscape 1.x; found {ink.version}.")
+        d4 = output_root / "04_export_png"
+        d4.mkdir(parents=True, exist_ok=True)
+
+        pool = None
+        if engine == "inkscape-shell":
+            pool = InkscapeShellPool(inkscape, _worker_count(s), s.export_timeout_s)
+
+        fmt_d, prof_d = output_format(s.export_format, ("png", "webp")), _stage_profile(s, "D")
+
+        def _export(svg: Path) -> Path:
+            dst = d4 / (svg.stem + suffix(fmt_d))
+            png = dst.with_suffix(".png")  # what Inkscape writes, re-encoded as fmt_d / prof_d
+            if pool is not None:
+                return _cached(cache, s, "D", svg, dst, lambda: reencode(pool.export(
+                    svg, png, s.export_width, s.export_area_drawing
+                ), dst, fmt_d, prof_d))
+            if engine == "builtin":
+                return _cached(cache, s, "D", svg, dst, lambda: export_svg_builtin(
+                    inkscape, svg, dst, s.export_width, s.export_area_drawing, legacy, fmt_d, prof_d
+                ))
+            return _cached(cache, s, "D", svg, dst, lambda: reencode(export_svg_to_png(
+                inkscape, svg, png, s.export_width, s.export_area_drawing, legacy
+            ), dst, fmt_d, prof_d))
+
+        steps.append(Step("D", "Export", d4, True, _export, close=pool.close if pool else None))
+
+    return steps
+
+
+def _where(item) -> Optional[str]:
+    return str(item) if isinstance(item, Path) else None
+
+
+class _Journal:
+    """
+    Ledger bookkeeping for one run: the fingerprint of every file at every
+    step, and (with resume) the leading steps each file can skip.
+    """
+
+    def __init__(self, ledger: Ledger, files: List[Path], steps: List[Step], s: Settings,
+                 origin: Dict[Path, Path]):
+        self.ledger = ledger
+        chain = [(step.key, _stage_params(s, step.key)) for step in steps]
+        params = [json.dumps(chain[:k + 1], sort_keys=True) for k in range(len(steps))]
+        self.fps: Dict[Path, List[str]] = {}
+        for src in files:
+            # ICO frames are extracted again every run: stamp them by their icon instead
+            ico = origin.get(src)
+            stamp = f"{file_stamp(ico)}|{src.name}" if ico else file_stamp(src)
+            self.fps[src] = [fingerprint(stamp, p) for p in params]
+
+        self.skip: Dict[Path, List[Optional[Path]]] = {}
+        if s.resume:
+            for src in files:
+                plan = [(step.key, fp, not step.in_memory) for step, fp in zip(steps, self.fps[src])]
+                outs = ledger.resume_point(src, plan)
+                if outs:
+                    self.skip[src] = outs
+
+    def resumed(self, src: Path) -> int:
+        """How many leading steps src skips."""
+        return len(self.skip.get(src, ()))
+
+    def running(self, k: int, step: Step, items: List[Tuple[Path, Item]]) -> None:
+        self.ledger.mark_running(step.key, [(src, _where(cur), self.fps[src][k]) for src, cur in items])
+
+    def record(self, k: int, step: Step, src: Path, inp: Item, result) -> None:
+        if isinstance(result, Exception):
+            self.ledger.record(step.key, src, _where(inp), None, self.fps[src][k], str(result) or repr(result))
+        else:
+            self.ledger.record(step.key, src, _where(inp), result if isinstance(result, Path) else None,
+                               self.fps[src][k])
+
+
+def _run_many(step: Step) -> Optional[Callable[[List[Tuple[Path, Item]]], List[Union[Item, Exception]]]]:
+    """step.run_many for a group of (src, item) pairs; items in memory go through step.run one by one."""
+    if step.run_many is None:
+        return None
+
+    def run(group):
+        results: List[Union[Item, Exception, None]] = [_attempt(step.run, cur) if not isinstance(cur, Path) else None
+                                                      for _, cur in group]
+        on_disk = [i for i, (_, cur) in enumerate(group) if isinstance(cur, Path)]
+        if on_disk:
+            for i, out in zip(on_disk, step.run_many([group[i][1] for i in on_disk])):
+                results[i] = out
+        return results
+
+    return run
+
+
+def _phase(telemetry: Optional[Telemetry], name: str):
+    return telemetry.phase(name) if telemetry is not None else nullcontext()
+
+
+def _timed(telemetry: Optional[Telemetry], steps: List[Step]) -> List[Step]:
+    """The steps with their run/run_many recording per-file timings."""
+    if telemetry is None:
+        return steps
+    return [step._replace(
+        run=telemetry.timed(step.key, step.run),
+        run_many=telemetry.timed_many(step.key, step.run_many) if step.run_many else None,
+    ) for step in steps]
+
+
+def _run_staged(
+    files: List[Path], steps: List[Step], s: Settings, log, progress: Progress,
+    cancel: Optional[threading.Event] = None, telemetry: Optional[Telemetry] = None,
+    journal: Optional[_Journal] = None, sources: Optional[Dict[Path, Item]] = None,
+) -> Dict[Path, List[Path]]:
+    """
+    Run each stage over the whole batch before starting the next one.
+
+    sources maps files that only exist in memory (natively split ICO frames) to
+    their image.
+    """
+    sources = sources or {}
+    outputs: Dict[Path, List[Path]] = {src: [] for src in files}
+    current: List[Tuple[Path, Item]] = [(src, sources.get(src, src)) for src in files]
+
+    for k, step in enumerate(steps):
+        log(f"\n[{step.key}] {step.title} -> {step.target()}\n")
+        todo = current
+        if journal is not None:
+            todo = [(src, cur) for src, cur in current if journal.resumed(src) <= k]
+            if len(todo) < len(current):
+                log(f"  {len(current) - len(todo)} file(s) already done (resumed)\n")
+            journal.running(k, step, todo)
+        progress({"event": "stage", "stage": step.key, "title": step.title, "files": len(todo)})
+        run_many = _run_many(step)
+
+        def report(i, total, item, result, k=k, step=step):
+            if journal is not None:
+                journal.record(k, step, item[0], item[1], result)
+            if step.note is not None and not isinstance(result, Exception):
+                log(f"    {step.note(item[1], result)}\n")
+            progress({
+                "event": "file", "stage": step.key, "index": i, "total": total, "file": str(item[0]),
+                **_outcome(result),
+            })
+
+        with _phase(telemetry, step.key):
+            done = dict((src, out) for (src, _), out in _run_batch(
+                todo, lambda item: step.run(item[1]), lambda item: item[1].name, s, log,
+                run_many, int(s.magick_batch_size), report, cancel,
+            ))
+        nxt = []
+        for src, _ in current:
+            if journal is not None and journal.resumed(src) > k:
+                out = journal.skip[src][k]
+            elif src in done:
+                out = done[src]
+            else:
+                continue
+            outputs[src].append(out)
+            nxt.append((src, out))
+        current = nxt
+
+    return {src: outs for src, outs in outputs.items() if len(outs) == len(steps)}
+
+
+def _run_streaming(
+    files: List[Path], steps: List[Step], s: Settings, log, progress: Progress,
+    cancel: Optional[threading.Event] = None, telemetry: Optional[Telemetry] = None,
+    journal: Optional[_Journal] = None, sources: Optional[Dict[Path, Item]] = None,
+) -> Dict[Path, List[Path]]:
+    """Push each file through every stage as one unit of work (sources: see _run_staged)."""
+    sources = sources or {}
+
+    def _chain(src: Path) -> List[Path]:
+        outs: List[Path] = list(journal.skip.get(src, ())) if journal is not None else []
+        cur = outs[-1] if outs else sources.get(src, src)
+        for k in range(len(outs), len(steps)):
+            step, inp = steps[k], cur
+            if journal is not None:
+                journal.running(k, step, [(src, inp)])
+            try:
+                cur = step.run(inp)
+            except Exception as e:
+                if journal is not None:
+                    journal.record(k, step, src, inp, e)
+                raise RuntimeError(f"{step.key}) {step.title}: {e}") from e
+            if journal is not None:
+                journal.record(k, step, src, inp, cur)
+            outs.append(cur)
+        return outs
+
+    keys = "".join(step.key for step in steps)
+    log(f"\n[{keys}] Streaming\n")
+    for step in steps:
+        log(f"  {step.key}) {step.title} -> {step.target()}\n")
+
+    finished: Dict[Path, List[Path]] = {}
+    if journal is not None:
+        finished = {src: journal.skip[src] for src in files if journal.resumed(src) == len(steps)}
+        if finished:
+            log(f"  {len(finished)} file(s) already done (resumed)\n")
+            files = [src for src in files if src not in finished]
+    progress({"event": "stage", "stage": keys, "title": "Streaming", "files": len(files)})
+
+    def report(i, total, src, result):
+        if not isinstance(result, Exception):
+            for k, step in enumerate(steps):
+                if step.note is not None:
+                    log(f"    {step.key}) {step.note(result[k - 1] if k else sources.get(src, src), result[k])}\n")
+        progress({
+            "event": "file", "stage": keys, "index": i, "total": total, "file": str(src), **_outcome(result),
+        })
+    with _phase(telemetry, keys):
+        done = _run_batch(files, _chain, lambda src: src.name, s, log, report=report, cancel=cancel)
+    return {**finished, **dict(done)}
+
+
+def _split_icos_native(
+    ico_files: List[Path], frame_dir: Path, sources: Dict[Path, Item],
+) -> List[Union[List[Path], Exception]]:
+    """
+    Split icons in-process. Each distinct frame gets one name under frame_dir
+    (nothing is written there) and its image in sources; a frame identical to
+    one seen before, in this or another icon, reuses that name.
+    """
+    seen: Dict[str, Path] = {}
+    results: List[Union[List[Path], Exception]] = []
+    for ico, frames in zip(ico_files, split_icos_native(ico_files)):
+        if isinstance(frames, Exception):
+            results.append(frames)
+            continue
+        names: List[Path] = []
+        for n, (key, img) in enumerate(frames):
+            fr = seen.get(key)
+            if fr is None:
+                fr = frame_dir / f"{ico.stem}_frame_{n:03d}.png"
+                if fr in sources:  # same icon name in another folder
+                    fr = frame_dir / f"{ico.stem}_frame_{n:03d}_{key[:8]}.png"
+                seen[key] = fr
+                sources[fr] = MemoryImage(fr.name, img)
+            names.append(fr)
+        results.append(names)
+    return results
+
+
+def _frame_px(frame: Path, sources: Dict[Path, Item]) -> int:
+    item = sources.get(frame)
+    if isinstance(item, MemoryImage):
+        return max(item.image.size)
+    with Image.open(frame) as im:  # reads the header only
+        return max(im.size)
+
+
+def run_all(
+    input_path: Path,
+    output_root: Path,
+    s: Settings,
+    log,
+    progress: Optional[Progress] = None,
+    cancel: Optional[threading.Event] = None,
+) -> None:
+    """
+    Run every enabled stage over the images at input_path.
+
+    log receives human-readable text; progress, if given, receives the same run
+    as structured events (see Progress). Both are called from the thread that
+    called run_all, never concurrently.
+
+    Setting cancel (from any thread) stops the run between files: running files
+    finish, nothing new starts, and RunCancelled is raised.
+
+    With s.run_report, a timing summary is logged at the end and the full report
+    (see telemetry.py) is written to output_root, also for failed or cancelled runs.
+
+    With s.use_ledger, every file's status per stage is recorded as it completes
+    in output_root/run_ledger.sqlite (see ledger.py). s.resume then skips the
+    work a previous run finished with the same inputs and settings.
+    """
+    progress = progress or _no_progress
+    ledger = None
+    if s.use_ledger or s.resume:
+        Path(output_root).mkdir(parents=True, exist_ok=True)
+        ledger = Ledger(Path(output_root) / LEDGER_FILE)
+        ledger.begin_run(input_path, asdict(s))
+    telemetry = Telemetry() if s.run_report else None
+
+    status = "failed"
+    try:
+        with telemetry or nullcontext():
+            _run_all(input_path, output_root, s, log, progress, cancel, telemetry, ledger)
+        status = "done"
+    except (RunCancelled, KeyboardInterrupt):
+        status = "cancelled"
+        raise
+    finally:
+        if ledger is not None:
+            ledger.end_run(status)
+            log(f"\n[Ledger] {ledger.summary()}: {ledger.path}\n")
+            ledger.close()
+        if telemetry is not None and telemetry.files:
+            log(telemetry.format_summary())
+            try:
+                report = telemetry.write(Path(output_root), asdict(s))
+                log(f"[Timing] Report: {report[0]}\n")
+            except OSError as e:
+                log(f"[Timing] Could not write report: {e}\n")
+
+
+def _run_all(
+    input_path: Path,
+    output_root: Path,
+    s: Settings,
+    log,
+    progress: Progress,
+    cancel: Optional[threading.Event],
+    telemetry: Optional[Telemetry],
+    ledger: Optional[Ledger] = None,
+) -> None:
     output_root = Path(output_root)
     output_root.mkdir(parents=True, exist_ok=True)
 
-    files = list_images(input_path, recursive=s.input_recursive)
+    mode = (s.pipeline_mode or "staged").strip().lower()
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode: {mode!r}")
+    if s.do_optimize and not s.do_trace:
+        raise ValueError(OPTIMIZE_NEEDS_TRACE)
+    icon_sizes = parse_icon_sizes(s.icon_sizes) if s.icon_pyramid else []
+
+    files = list_images(
+        input_path, recursive=s.input_recursive,
+        include=s.input_include, exclude=s.input_exclude, use_index=s.input_index,
+    )
     if not files:
-        raise RuntimeError(
-            "No supported images found.\n"
-            "If your images are inside subfolders, enable: Include subfolders (recursive)."
-        )
+        hint = "If your images are inside subfolders, enable: Include subfolders (recursive)."
+        if s.input_include or s.input_exclude:
+            hint += "\nAlso check the include/exclude patterns."
+        raise RuntimeError("No supported images found.\n" + hint)
 
     # ICO expand (optional)
     magick_for_ico = None
+    ico_engine = (s.ico_engine or "magick").strip().lower()
     if s.handle_ico:
-        magick_for_ico = find_magick()
-        if not magick_for_ico:
-            raise RuntimeError("ImageMagick 'magick' not found on PATH (required for ICO extract/rebuild).")
+        if ico_engine not in ICO_ENGINES:
+            raise ValueError(f"Unknown ICO engine: {ico_engine!r}")
+        if ico_engine == "magick":
+            magick_for_ico = find_magick()
+            if not magick_for_ico:
+                raise RuntimeError("ImageMagick 'magick' not found on PATH (required for ICO extract/rebuild).")
 
     ico_map: Dict[str, Dict[str, object]] = {}
+    # natively split frames: never written, the path only names them
+    sources: Dict[Path, Item] = {}
     if s.handle_ico:
         expanded: List[Path] = []
+        expanded_set: set = set()
         ico_files = [p for p in files if p.suffix.lower() == ".ico"]
         other_files = [p for p in files if p.suffix.lower() != ".ico"]
 
         if ico_files:
             log(f"\n[ICO] Extracting frames from {len(ico_files)} icon(s)...\n")
             ico_stage_dir = output_root / "_ico_frames"
-            ico_stage_dir.mkdir(parents=True, exist_ok=True)
-
-            for ico in ico_files:
-                frame_dir = ico_stage_dir / ico.stem
-                frames = split_ico_to_pngs(magick_for_ico, ico, frame_dir)
+            if ico_engine == "native":
+                with _phase(telemetry, "ICO split"):
+                    results = _split_icos_native(ico_files, ico_stage_dir, sources)
+            else:
+                ico_stage_dir.mkdir(parents=True, exist_ok=True)
+                pairs = [(ico, ico_stage_dir / ico.stem) for ico in ico_files]
+                with _phase(telemetry, "ICO split"):
+                    results = split_icos_batch(magick_for_ico, pairs, s.magick_batch_size)
+            for ico, frames in zip(ico_files, results):
+                event = {"event": "ico_split", "file": str(ico)}
+                if isinstance(frames, Exception):
+                    progress({**event, "ok": False, "error": str(frames)})
+                    if not s.continue_on_error:
+                        raise frames
+                    log(f"  FAILED: {ico.name}: {frames}\n")
+                    continue
+                progress({**event, "ok": bool(frames), "frames": len(frames)})
                 if not frames:
                     log(f"  WARN: no frames extracted from {ico.name}\n")
                     continue
+                if s.icon_pyramid:
+                    # only the largest frame is processed; the pyramid makes every size from it
+                    frames = [max(frames, key=lambda fr: _frame_px(fr, sources))]
                 ico_map[ico.stem] = {"src": ico, "frames": frames}
-                expanded.extend(frames)
+                expanded.extend(fr for fr in frames if fr not in expanded_set)
+                expanded_set.update(frames)
                 log(f"  {ico.name}: {len(frames)} frame(s)\n")
+            if ico_engine == "native":
+                log(f"  {len(expanded)} distinct frame(s) of {sum(len(i['frames']) for i in ico_map.values())}"
+                    " (identical frames are processed once)\n")
 
         files = other_files + expanded
 
     if not files:
         raise RuntimeError("No images to process after ICO extraction. (Were the ICOs valid?)")
 
-    # A) preprocess
-    if s.do_preprocess:
-        mag = find_magick()
-        if not mag:
-            raise RuntimeError("ImageMagick 'magick' not found on PATH.")
-        d1 = output_root / "01_preprocessed"
-        d1.mkdir(parents=True, exist_ok=True)
-
-        log(f"\n[A] Preprocess -> {d1}\n")
-        for i, src in enumerate(files, 1):
-            dst = d1 / (src.stem + ".png")
-            log(f"  [{i}/{len(files)}] {src.name}\n")
-            preprocess_magick(
-                mag, src, dst,
-                s.grayscale, s.auto_level, s.contrast_stretch,
-                s.cs_black, s.cs_white, s.median, s.blur,
-                s.negate,
-                s.preprocess_mode, s.threshold_pct, s.quantize_levels
-            )
-        files = list_images(d1, recursive=False)
+    if s.icon_pyramid and s.do_export and (s.do_trace or s.do_optimize):
+        # the pyramid renders every size from the SVG; the export would be thrown away
+        log("\n[ICO] Icon pyramids are made from the traced SVG: export (D) is skipped\n")
+        s = replace(s, do_export=False)
 
-    # B) pad
-    if s.do_pad:
-        d2 = output_root / "02_padded"
-        d2.mkdir(parents=True, exist_ok=True)
-        log(f"\n[B] Pad -> {d2}\n")
-        for i, src in enumerate(files, 1):
-            out_base = d2 / src.stem
-            log(f"  [{i}/{len(files)}] {src.name}\n")
-            pad_square(src, out_base, s.pad_size, s.pad_bg, s.pad_out_fmt, s.jpeg_quality)
-        files = list_images(d2, recursive=False)
+    _check_cancel(cancel)
+    cache = None
+    if s.use_cache:
+        cache_root = Path(s.cache_dir) if s.cache_dir else output_root / "_cache"
+        cache = StageCache(cache_root, int(s.cache_max_mb) * 1024 * 1024)
 
-    # C) trace
-    if s.do_trace:
-        mag = find_magick()
-        if not mag:
-            raise RuntimeError("ImageMagick 'magick' not found on PATH (needed for trace PBM).")
-        potrace = find_potrace()
-        if not potrace:
-            raise RuntimeError("potrace not found. Put potrace.exe in bin\\ or install potrace.")
-        d3 = output_root / "03_svg"
-        d3.mkdir(parents=True, exist_ok=True)
-        log(f"\n[C] Trace -> {d3}\n")
-        for i, src in enumerate(files, 1):
-            dst = d3 / (src.stem + ".svg")
-            log(f"  [{i}/{len(files)}] {src.name}\n")
-            trace_to_svg(
-                mag, potrace, src, dst,
-                s.trace_cutoff_pct, s.trace_invert,
-                s.potrace_turdsize, s.potrace_smooth
-            )
-        files = sorted(d3.glob("*.svg"))
+    # A) -> D), each stage handing its output (path or in-memory image) straight to the next
+    steps = _timed(telemetry, build_steps(output_root, s, cache))
+    for info in known_tools():
+        log(f"[Tools] {info.describe()}\n")
 
-    # D) export
-    if s.do_export:
-        inkscape = find_inkscape()
-        if not inkscape:
-            raise RuntimeError("Inkscape not found on PATH (needed for export).")
-        d4 = output_root / "04_export_png"
-        d4.mkdir(parents=True, exist_ok=True)
-        log(f"\n[D] Export -> {d4}\n")
-        for i, svg in enumerate(files, 1):
-            dst = d4 / (Path(svg).stem + ".png")
-            log(f"  [{i}/{len(files)}] {Path(svg).name}\n")
-            export_svg_to_png(inkscape, Path(svg), dst, s.export_width, s.export_area_drawing)
+    journal = None
+    if ledger is not None:
+        origin = {fr: info["src"] for info in ico_map.values() for fr in info["frames"]}  # type: ignore
+        journal = _Journal(ledger, files, steps, s, origin)
+        if s.resume:
+            full = sum(journal.resumed(src) == len(steps) for src in files)
+            log(f"[Resume] {full} of {len(files)} file(s) finished earlier, "
+                f"{len(journal.skip) - full} partly\n")
+    progress({
+        "event": "start", "input": str(input_path), "output": str(output_root),
+        "files": len(files), "mode": mode, "stages": "".join(step.key for step in steps),
+    })
+    try:
+        if mode == "streaming":
+            outputs = _run_streaming(files, steps, s, log, progress, cancel, telemetry, journal, sources)
+        else:
+            outputs = _run_staged(files, steps, s, log, progress, cancel, telemetry, journal, sources)
+    finally:
+        for step in steps:
+            if step.close:
+                step.close()
 
-    # ICO rebuild (optional)
-    if s.handle_ico and ico_map:
-        mag = find_magick()
-        if not mag:
-            raise RuntimeError("ImageMagick 'magick' not found on PATH (required for ICO rebuild).")
+    if cache is not None:
+        log(f"\n[Cache] {cache.summary()}\n")
+
+    # Icon pyramids (optional): every size from each file's master output
+    _check_cancel(cancel)
+    if s.icon_pyramid:
+        out_ico_dir = output_root / "05_ico"
+        out_ico_dir.mkdir(parents=True, exist_ok=True)
+        log(f"\n[ICO] Icon pyramids ({', '.join(map(str, icon_sizes))} px) -> {out_ico_dir}\n")
+
+        # the (optimized) traced SVG if there is one (rendered at each size), else the final raster
+        svgs = [i for i, step in enumerate(steps) if step.key in ("C", "O")]
+        idx = svgs[-1] if svgs else len(steps) - 1
+        def master(src: Path) -> Item:
+            return _image(outputs[src][idx] if steps else sources.get(src, src))
 
-        src_raster_dir = _choose_last_raster_dir(output_root, s)
+        # one per icon (identical frames of several icons share one output) and one per other image
+        frames = {info["frames"][0] for info in ico_map.values()}  # type: ignore[index]
+        masters = [
+            (stem, master(info["frames"][0]))  # type: ignore[index]
+            for stem, info in ico_map.items() if info["frames"][0] in outputs  # type: ignore[index]
+        ] + [(src.stem, master(src)) for src in files if src in outputs and src not in frames]
+        pairs = [(master, out_ico_dir / f"{stem}.ico") for stem, master in masters]
+        with _phase(telemetry, "Icon pyramid"):
+            results = build_icon_pyramids(pairs, icon_sizes, s.ico_entry_format, _worker_count(s))
+        for (stem, _), dst_ico in zip(masters, results):
+            progress({"event": "ico_rebuild", "file": f"{stem}.ico", **_outcome(dst_ico)})
+            if isinstance(dst_ico, Exception):
+                if not s.continue_on_error:
+                    raise dst_ico
+                log(f"  FAILED: {stem}.ico: {dst_ico}\n")
+                continue
+            log(f"  OK: {dst_ico.name} ({len(icon_sizes)} size(s))\n")
+
+    # ICO rebuild (optional)
+    elif s.handle_ico and ico_map:
+        raster_idx = [i for i, step in enumerate(steps) if step.raster]
         out_ico_dir = output_root / "05_ico"
         out_ico_dir.mkdir(parents=True, exist_ok=True)
 
         log(f"\n[ICO] Rebuilding icons -> {out_ico_dir}\n")
 
+        jobs: List[Tuple[str, List[Path]]] = []
         for stem, info in ico_map.items():
             frames: List[Path] = info["frames"]  # type: ignore
             processed_frames = []
 
-            for fr in frames:
-                # prefer png, but allow jpg if user forced it
-                cand_png = src_raster_dir / (Path(fr).stem + ".png")
-                cand_jpg = src_raster_dir / (Path(fr).stem + ".jpg")
-                if cand_png.exists():
-                    processed_frames.append(cand_png)
-                elif cand_jpg.exists():
-                    processed_frames.append(cand_jpg)
+            # the frame as it left the last raster-producing stage
+            if raster_idx:
+                for fr in frames:
+                    if fr in outputs:
+                        processed_frames.append(outputs[fr][raster_idx[-1]])
 
             if not processed_frames:
                 log(f"  WARN: No processed frames found for {stem}.ico (skipping)\n")
                 continue
+            jobs.append((stem, processed_frames))
 
-            dst_ico = out_ico_dir / f"{stem}.ico"
-            rebuild_ico_from_pngs(mag, processed_frames, dst_ico)
+        pairs = [(processed_frames, out_ico_dir / f"{stem}.ico") for stem, processed_frames in jobs]
+        with _phase(telemetry, "ICO rebuild"):
+            if ico_engine == "native":
+                results = rebuild_icos_native(pairs, s.ico_entry_format, _worker_count(s))
+            else:
+                results = rebuild_icos_batch(magick_for_ico, pairs, s.magick_batch_size)
+        for (stem, processed_frames), dst_ico in zip(jobs, results):
+            progress({"event": "ico_rebuild", "file": f"{stem}.ico", **_outcome(dst_ico)})
+            if isinstance(dst_ico, Exception):
+                if not s.continue_on_error:
+                    raise dst_ico
+                log(f"  FAILED: {stem}.ico: {dst_ico}\n")
+                continue
             log(f"  OK: {dst_ico.name} ({len(processed_frames)} frame(s))\n")
+
+    progress({"event": "done", "files": len(files), "completed": len(outputs), "failed": len(files) - len(outputs)})
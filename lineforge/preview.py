@@ -0,0 +1,183 @@
+"""
+Live preview: one image through the enabled stages at a reduced size, fast
+enough to follow a slider.
+
+The source is decoded once at proxy size (JPEG decodes straight to a reduced
+size). Every stage uses its in-process implementation (Pillow preprocess, the
+built-in tracer or potrace via stdin, the built-in rasterizer), so a preview
+costs no more than one potrace spawn. Each stage result is memoized, keyed by
+the source and the settings of that stage and the stages before it, so moving
+the trace cutoff only redoes trace and export.
+
+Nothing here imports tkinter; see ui/app_tk.py for the preview window.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Hashable, List, NamedTuple, Tuple
+
+from PIL import Image
+
+from .deps import tool
+from .imaging import flatten
+from .settings import Settings, stage_params
+from .stages.optimize import optimize_svg_text
+from .stages.pad import pad_image
+from .stages.preprocess import preprocess_image
+from .stages.trace import _potrace_pbm, binarize, binarize_pbm
+from .svgraster import SvgDrawing
+from .tracer import bitmap_to_svg
+
+PREVIEW_PX = 384        # longest side of the proxy image
+MEMO_ENTRIES = 48       # stage results kept (across images and settings)
+
+
+class StageTiming(NamedTuple):
+    stage: str
+    seconds: float
+    cached: bool
+
+
+class PreviewResult(NamedTuple):
+    image: Image.Image               # what the last enabled stage produced, as an RGB image
+    timings: List[StageTiming]
+
+    def describe(self) -> str:
+        total = sum(t.seconds for t in self.timings)
+        parts = [f"{t.stage} {'cached' if t.cached else f'{t.seconds * 1000:.0f}ms'}" for t in self.timings]
+        return f"{total * 1000:.0f}ms ({', '.join(parts)})"
+
+
+class LruMemo:
+    """A small thread-safe LRU map."""
+
+    def __init__(self, max_entries: int = MEMO_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self._items: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+def load_proxy(src: Path, px: int = PREVIEW_PX) -> Image.Image:
+    """Decode src with its longest side at most px (JPEG is decoded at reduced scale)."""
+    img = Image.open(src)
+    img.draft(img.mode, (px, px))
+    img.load()
+    if max(img.size) > px:
+        img.thumbnail((px, px), Image.LANCZOS, reducing_gap=2.0)
+    return img
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    return flatten(img).convert("RGB")
+
+
+def _svg_image(svg: str, width: int, area_drawing: bool) -> Image.Image:
+    return SvgDrawing.parse(svg.encode("utf-8")).render(width, area_drawing)
+
+
+class Previewer:
+    """Renders previews and memoizes every stage result. Safe to share between threads."""
+
+    def __init__(self, px: int = PREVIEW_PX, max_entries: int = MEMO_ENTRIES):
+        self.px = int(px)
+        self.memo = LruMemo(max_entries)
+        self._tmp = tempfile.mkdtemp(prefix="lineforge-preview-")
+
+    def _potrace(self, img: Image.Image, s: Settings) -> str:
+        info = tool("potrace")
+        pbm = binarize_pbm(img, s.trace_cutoff_pct, s.trace_invert)
+        dst = Path(self._tmp) / f"{threading.get_ident()}.svg"
+        _potrace_pbm(info.path, pbm, dst, s.potrace_turdsize, s.potrace_smooth, info.has("stdin"))
+        return dst.read_text(encoding="utf-8")
+
+    def _stage(self, key: str, value, s: Settings):
+        """One stage on the previous stage's result (a PIL image, or SVG text for D)."""
+        if key == "A":
+            return preprocess_image(
+                value, s.grayscale, s.auto_level, s.contrast_stretch,
+                s.cs_black, s.cs_white, s.median, s.blur, s.negate,
+                s.preprocess_mode, s.threshold_pct, s.quantize_levels,
+            )
+        if key == "B":
+            return pad_image(value, min(int(s.pad_size), self.px), s.pad_bg, s.pad_out_fmt)
+        if key == "C":
+            if (s.trace_engine or "potrace").strip().lower() == "potrace" and tool("potrace"):
+                return self._potrace(value, s)
+            black = binarize(value, s.trace_cutoff_pct, s.trace_invert)
+            return bitmap_to_svg(black, s.potrace_turdsize, s.potrace_smooth)
+        if key == "O":
+            return optimize_svg_text(value, s.svg_precision, s.svg_merge_paths) if isinstance(value, str) else value
+        return _svg_image(value, min(int(s.export_width), self.px), s.export_area_drawing)
+
+    def render(self, src: Path, s: Settings) -> PreviewResult:
+        """src through every enabled stage of s, at proxy size."""
+        src = Path(src)
+        st = os.stat(src)
+        key: Tuple = (os.path.abspath(src), st.st_mtime_ns, st.st_size, self.px)
+        timings: List[StageTiming] = []
+
+        def step(name: str, fn):
+            nonlocal key
+            key = key + (name,)
+            t = time.perf_counter()
+            hit = self.memo.get(key)
+            if hit is None:
+                hit = fn()
+                self.memo.put(key, hit)
+                timings.append(StageTiming(name, time.perf_counter() - t, False))
+            else:
+                timings.append(StageTiming(name, time.perf_counter() - t, True))
+            return hit
+
+        value = step("load", lambda: load_proxy(src, self.px))
+        for stage, on in (
+            ("A", s.do_preprocess), ("B", s.do_pad), ("C", s.do_trace), ("O", s.do_optimize), ("D", s.do_export),
+        ):
+            if not on:
+                continue
+            params = json.dumps(stage_params(s, stage), sort_keys=True)
+            prev = value
+            value = step(f"{stage}|{params}", lambda: self._stage(stage, prev, s))
+            timings[-1] = timings[-1]._replace(stage=stage)
+
+        if isinstance(value, str):  # trace without export: show the SVG
+            image = _svg_image(value, self.px, False)
+        else:
+            image = value
+        return PreviewResult(_to_rgb(image), timings)
+
+    def close(self) -> None:
+        self.memo.clear()
+        for p in Path(self._tmp).glob("*"):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+        try:
+            os.rmdir(self._tmp)
+        except OSError:
+            pass
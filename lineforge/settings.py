@@ -1,13 +1,27 @@
 from dataclasses import dataclass
+from typing import Dict, Tuple
 
 @dataclass
 class Settings:
     # Input behavior
     input_recursive: bool = False
     handle_ico: bool = False
+    # "magick" (frames written to _ico_frames, rebuilt with -colors 256)
+    # | "native" (in-process: frames stay in memory, identical frames are processed once)
+    ico_engine: str = "magick"
+    ico_entry_format: str = "auto"   # native rebuild and pyramids: "png" | "bmp" | "auto" (PNG at 256px, BMP below)
+    # Pyramid: each input (or an ICO's largest frame) is processed once and every size is made from it
+    icon_pyramid: bool = False
+    icon_sizes: str = "256,128,64,48,32,24,16"
+    # ";"-separated globs; without "/" they match names, with "/" paths relative to the input folder
+    input_include: str = ""          # empty = every supported image
+    input_exclude: str = ""          # also skips whole subfolders, e.g. "_cache;*/thumbs"
+    input_index: bool = False        # reuse the folder listing of unchanged folders (keyed by folder mtime)
 
     # A) preprocess
     do_preprocess: bool = True
+    preprocess_engine: str = "magick"  # "magick" | "pillow" (in-process, no process spawn)
+    preprocess_out_fmt: str = "png"    # "png" | "webp" (lossless)
 
     # Shared preprocess toggles
     grayscale: bool = True
@@ -34,7 +48,7 @@ class Settings:
     do_pad: bool = True
     pad_size: int = 512
     pad_bg: str = "white"
-    pad_out_fmt: str = "png"
+    pad_out_fmt: str = "png"         # "png" | "jpg" | "webp" (lossless)
     jpeg_quality: int = 95
 
     # C) trace
@@ -43,8 +57,81 @@ class Settings:
     trace_invert: bool = False
     potrace_turdsize: int = 8
     potrace_smooth: bool = True  # uses default smoothing; "off" applies --flat
+    trace_binarize: str = "magick"  # PBM step: "magick" | "pillow" (in-process, piped to potrace stdin)
+    trace_engine: str = "potrace"   # "potrace" | "native" (in-process tracer, no potrace/magick needed)
+
+    # O) optimize the traced SVG before export
+    do_optimize: bool = False
+    svg_precision: int = 1           # decimals of a pixel kept in coordinates (potrace writes tenths: 1 is lossless)
+    svg_merge_paths: bool = True     # consecutive paths with the same fill become one path
 
     # D) export
     do_export: bool = True
     export_width: int = 512
     export_area_drawing: bool = True
+    export_format: str = "png"       # "png" | "webp" (lossless)
+    # "inkscape" (one process per SVG) | "inkscape-shell" (long-lived Inkscape 1.x shell workers)
+    # | "builtin" (in-process rasterizer for potrace SVGs; falls back to Inkscape for other SVGs)
+    export_engine: str = "inkscape"
+    export_timeout_s: float = 60.0   # shell workers silent for longer than this are restarted
+
+    # Encoding of A/B/D outputs: "fast" | "balanced" | "smallest" (PNG zlib level and filter,
+    # JPEG optimize/progressive/subsampling, WebP effort). The last stage's outputs (and ICO
+    # frames) use output_profile; outputs that only feed the next stage use intermediate_profile.
+    output_profile: str = "balanced"
+    intermediate_profile: str = "fast"
+
+    # Execution
+    # "staged" (each stage finishes the batch first) | "streaming" (each file runs A->D as one unit)
+    pipeline_mode: str = "staged"
+    workers: int = 0                 # parallel files per stage; 0 = one per CPU core
+    continue_on_error: bool = False  # log failed files and keep going instead of stopping
+    # files per magick process for preprocess, trace PBMs and ICO split/rebuild (staged mode); 1 = one each
+    magick_batch_size: int = 1
+    # Off: A/B outputs that only feed B/C are handed on in memory and 01_/02_ stay empty.
+    # Staged mode then holds the whole batch's images in memory between stages.
+    keep_intermediates: bool = True
+    # Images too large to process whole within tile_memory_mb are preprocessed, padded and traced
+    # in strips of rows (grayscale, in-process; ImageMagick only decodes them)
+    tiled: bool = False
+    tile_memory_mb: int = 1024       # working memory shared by the workers for tiled images
+    # Log a timing summary and write run_report.json / .csv (per stage, file and command) to the output
+    run_report: bool = True
+    # Record each file's status per stage in <output>/run_ledger.sqlite as it completes
+    use_ledger: bool = True
+    resume: bool = False             # skip work the ledger shows finished with the same inputs and settings
+
+    # Incremental cache: reuse a stage's output when its input bytes and settings are unchanged
+    use_cache: bool = False
+    cache_dir: str = ""              # empty = <output>/_cache
+    cache_max_mb: int = 4096         # least recently used entries are evicted past this; 0 = unbounded
+
+
+# Settings each stage reads. Anything not listed here does not affect that stage's output.
+# The encoder profiles change JPEG pixels (chroma subsampling) and the bytes of every format.
+# A stage writes with only one of them, depending on its place in the run.
+STAGE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "A": (
+        "preprocess_engine", "grayscale", "auto_level", "contrast_stretch", "cs_black", "cs_white",
+        "median", "blur", "negate", "preprocess_mode", "threshold_pct", "quantize_levels",
+        "tiled", "tile_memory_mb", "preprocess_out_fmt", "output_profile", "intermediate_profile",
+    ),
+    "B": (
+        "pad_size", "pad_bg", "pad_out_fmt", "jpeg_quality", "tiled", "tile_memory_mb",
+        "output_profile", "intermediate_profile",
+    ),
+    "C": (
+        "trace_engine", "trace_binarize", "trace_cutoff_pct", "trace_invert",
+        "potrace_turdsize", "potrace_smooth", "tiled", "tile_memory_mb",
+    ),
+    "O": ("svg_precision", "svg_merge_paths"),
+    "D": (
+        "export_engine", "export_width", "export_area_drawing", "export_format",
+        "output_profile", "intermediate_profile",
+    ),
+}
+
+
+def stage_params(s: Settings, key: str) -> Dict[str, object]:
+    """The subset of settings stage `key` depends on."""
+    return {name: getattr(s, name) for name in STAGE_FIELDS[key]}
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from typing import Callable, Iterable, List, NamedTuple, Optional, TypeVar, Union
+
+from ..utils import run_cmd
+
+T = TypeVar("T")
+
+# Stay well under the 32767 character command line limit on Windows.
+MAX_CMDLINE_CHARS = 30000
+
+
+class MagickJob(NamedTuple):
+    """One magick command minus the executable: inputs + operators, then the output spec."""
+    args: List[str]
+    output: str
+
+    def command(self, magick: str) -> List[str]:
+        return [magick] + self.args + [self.output]
+
+
+def chunked(items: List[T], size: int, cost=None) -> Iterable[List[T]]:
+    """
+    Split items into runs of at most `size`, also keeping the summed cost(item)
+    of each run below MAX_CMDLINE_CHARS when cost is given.
+    """
+    size = max(1, int(size))
+    run: List[T] = []
+    used = 0
+    for item in items:
+        c = cost(item) if cost else 0
+        if run and (len(run) >= size or used + c > MAX_CMDLINE_CHARS):
+            yield run
+            run, used = [], 0
+        run.append(item)
+        used += c
+    if run:
+        yield run
+
+
+def job_chars(job: MagickJob) -> int:
+    return sum(len(a) + 3 for a in job.args) + len(job.output) + 16
+
+
+def run_magick_batch(magick: str, jobs: List[MagickJob]) -> List[Optional[Exception]]:
+    """
+    Run many magick jobs in a single process.
+
+    Every job but the last writes its result with -write and then empties the
+    image list, so each job only sees its own images:
+
+        magick <job1> -write <out1> -delete 0--1 <job2> -write <out2> ... <jobN> <outN>
+
+    magick stops at the first failing job, so if the batch fails every job is run
+    again on its own to attribute the error to the right source file.
+
+    Returns one entry per job: None on success, otherwise the exception.
+    """
+    if not jobs:
+        return []
+    if len(jobs) == 1:
+        return [_run_one(magick, jobs[0])]
+
+    args: List[str] = [magick]
+    for job in jobs[:-1]:
+        args += job.args + ["-write", job.output, "-delete", "0--1"]
+    args += jobs[-1].args + [jobs[-1].output]
+
+    try:
+        run_cmd(args)
+        return [None] * len(jobs)
+    except RuntimeError:
+        return [_run_one(magick, job) for job in jobs]
+
+
+def _run_one(magick: str, job: MagickJob) -> Optional[Exception]:
+    try:
+        run_cmd(job.command(magick))
+        return None
+    except Exception as e:
+        return e
+
+
+def build_job(factory: Callable[..., MagickJob], *args) -> Union[MagickJob, Exception]:
+    """Call a *_job builder, returning the exception instead of raising it."""
+    try:
+        return factory(*args)
+    except Exception as e:
+        return e
+
+
+def run_jobs(
+    magick: str,
+    jobs: List[Union[MagickJob, Exception]],
+    batch_size: int,
+) -> List[Optional[Exception]]:
+    """
+    Run prepared jobs batch_size per magick process (see run_magick_batch).
+    Entries that are already exceptions (the job could not be built) are passed through.
+    """
+    ready = [job for job in jobs if isinstance(job, MagickJob)]
+    outcome: List[Optional[Exception]] = []
+    for chunk in chunked(ready, batch_size, job_chars):
+        outcome += run_magick_batch(magick, chunk)
+
+    it = iter(outcome)
+    return [job if isinstance(job, Exception) else next(it) for job in jobs]
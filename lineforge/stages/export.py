@@ -1,8 +1,18 @@
 from __future__ import annotations
 
+import queue
+import subprocess
+import threading
+import time
+from collections import deque
 from pathlib import Path
+from typing import List, Optional
 
-from ..utils import run_cmd
+from ..encode import reencode
+from ..svgraster import SvgUnsupported, rasterize_svg
+from ..utils import hidden_window_kwargs, notify_cmd, run_cmd
+
+EXPORT_ENGINES = ("inkscape", "inkscape-shell", "builtin")
 
 
 def export_svg_to_png(
@@ -11,8 +21,9 @@ def export_svg_to_png(
     dst: Path,
     width: int = 512,
     area_drawing: bool = True,
+    legacy_cli: bool = False,
 ) -> Path:
-    """Export an SVG to a PNG using Inkscape CLI."""
+    """Export an SVG to a PNG using Inkscape CLI (legacy_cli: Inkscape 0.92 syntax)."""
     svg = Path(svg)
     dst = Path(dst)
 
@@ -23,15 +34,212 @@ def export_svg_to_png(
 
     w = max(1, int(width))
 
-    args = [
-        inkscape,
-        str(svg),
-        "--export-type=png",
-        f"--export-filename={dst}",
-        f"--export-width={w}",
-    ]
+    if legacy_cli:
+        args = [inkscape, "-z", str(svg), f"--export-png={dst}", f"--export-width={w}"]
+    else:
+        args = [
+            inkscape,
+            str(svg),
+            "--export-type=png",
+            f"--export-filename={dst}",
+            f"--export-width={w}",
+        ]
     if area_drawing:
         args.append("--export-area-drawing")
 
     run_cmd(args)
     return dst
+
+
+def export_svg_builtin(
+    inkscape: Optional[str],
+    svg: Path,
+    dst: Path,
+    width: int = 512,
+    area_drawing: bool = True,
+    legacy_cli: bool = False,
+    fmt: str = "png",
+    profile: str = "balanced",
+) -> Path:
+    """
+    Export an SVG to a PNG (or lossless WebP, see encode) with the in-process
+    rasterizer (potrace-style SVGs), falling back to the Inkscape CLI for
+    anything it does not support.
+    """
+    try:
+        return rasterize_svg(svg, dst, width, area_drawing, fmt, profile)
+    except SvgUnsupported as e:
+        if not inkscape:
+            raise RuntimeError(
+                f"Built-in rasterizer cannot export {Path(svg).name} ({e}) and Inkscape was not found."
+            ) from e
+    png = export_svg_to_png(inkscape, svg, Path(dst).with_suffix(".png"), width, area_drawing, legacy_cli)
+    return reencode(png, dst, fmt, profile)
+
+
+class InkscapeShell:
+    """
+    One long-lived `inkscape --shell` process (Inkscape 1.x actions syntax).
+
+    Each export is a single line of actions; the shell prints its "> " prompt
+    once the line has been processed. A worker that dies, or does not answer
+    within `timeout` seconds, is killed and started again on the next export.
+    """
+
+    def __init__(self, inkscape: str, timeout: float = 60.0):
+        self.inkscape = inkscape
+        self.timeout = float(timeout)
+        self._proc: Optional[subprocess.Popen] = None
+        self._out: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._err: deque = deque(maxlen=20)
+
+    @staticmethod
+    def _pump(stream, sink) -> None:
+        while True:
+            chunk = stream.read1(4096)
+            if not chunk:
+                break
+            sink(chunk)
+        sink(None)
+
+    def start(self) -> None:
+        self.close()
+        self._out = queue.Queue()
+        self._err.clear()
+        t0 = time.perf_counter()
+        self._proc = subprocess.Popen(
+            [self.inkscape, "--shell"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **hidden_window_kwargs(),
+        )
+        spawned = time.perf_counter()
+        threading.Thread(target=self._pump, args=(self._proc.stdout, self._out.put), daemon=True).start()
+        threading.Thread(
+            target=self._pump,
+            args=(self._proc.stderr, lambda c: c is not None and self._err.append(c)),
+            daemon=True,
+        ).start()
+        self._wait_prompt()
+        notify_cmd([self.inkscape, "--shell"], spawned - t0, time.perf_counter() - t0, None, 0, 0)
+
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def close(self, graceful: bool = True) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if graceful and proc.poll() is None:
+                proc.stdin.write(b"quit\n")
+                proc.stdin.flush()
+                proc.wait(timeout=5)
+        except Exception:
+            pass
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    def _stderr_tail(self) -> str:
+        return b"".join(self._err).decode(errors="replace").strip()
+
+    def _wait_prompt(self) -> None:
+        buf = b""
+        deadline = time.monotonic() + self.timeout
+        while not buf.rstrip(b" ").endswith(b">"):
+            left = deadline - time.monotonic()
+            try:
+                chunk = self._out.get(timeout=max(0.0, left))
+            except queue.Empty:
+                self.close(graceful=False)
+                raise RuntimeError(f"Inkscape shell did not respond within {self.timeout:g}s (restarting)")
+            if chunk is None:
+                self.close(graceful=False)
+                raise RuntimeError("Inkscape shell exited unexpectedly:\n" + self._stderr_tail())
+            buf += chunk
+
+    def export(self, svg: Path, dst: Path, width: int = 512, area_drawing: bool = True) -> Path:
+        svg = Path(svg).resolve()
+        dst = Path(dst).resolve()
+
+        if not svg.exists():
+            raise FileNotFoundError(f"SVG not found: {svg}")
+        if ";" in str(svg) or ";" in str(dst):
+            raise ValueError(f"Paths containing ';' cannot be sent to the Inkscape shell: {svg}")
+
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        dst.unlink(missing_ok=True)
+
+        actions: List[str] = [
+            f"file-open:{svg}",
+            "export-type:png",
+            f"export-filename:{dst}",
+            f"export-width:{max(1, int(width))}",
+            "export-area-drawing" if area_drawing else "export-area-page",
+            "export-do",
+            "file-close",
+        ]
+
+        if not self.alive():
+            self.start()
+
+        try:
+            self._proc.stdin.write((";".join(actions) + "\n").encode())
+            self._proc.stdin.flush()
+        except OSError as e:
+            self.close(graceful=False)
+            raise RuntimeError(f"Inkscape shell is not accepting commands: {e}") from e
+        self._wait_prompt()
+
+        if not dst.exists():
+            raise RuntimeError(f"Inkscape shell did not export {svg.name}:\n" + self._stderr_tail())
+        return dst
+
+
+class InkscapeShellPool:
+    """
+    A fixed number of InkscapeShell workers shared by export threads.
+
+    Workers are started lazily. If a worker dies or hangs mid-export it is
+    restarted and the file is retried once before the error is raised.
+    """
+
+    def __init__(self, inkscape: str, size: int, timeout: float = 60.0):
+        self.inkscape = inkscape
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self._idle: "queue.Queue[InkscapeShell]" = queue.Queue()
+        self._all: List[InkscapeShell] = []
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> InkscapeShell:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                worker = InkscapeShell(self.inkscape, self.timeout)
+                self._all.append(worker)
+                return worker
+        return self._idle.get()
+
+    def export(self, svg: Path, dst: Path, width: int = 512, area_drawing: bool = True) -> Path:
+        worker = self._acquire()
+        try:
+            try:
+                return worker.export(svg, dst, width, area_drawing)
+            except RuntimeError:
+                if worker.alive():
+                    raise
+                return worker.export(svg, dst, width, area_drawing)
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        with self._lock:
+            for worker in self._all:
+                worker.close()
+            self._all.clear()
@@ -1,17 +1,37 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import os
+import struct
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple, Union
 
+import numpy as np
+from PIL import Image
+
+from ..imaging import load_image
+from ..svgraster import load_svg
 from ..utils import run_cmd
+from .batch import MagickJob, build_job, run_jobs
 
+# "magick": frames are extracted to _ico_frames and rebuilt by ImageMagick
+# "native": in-process; frames stay in memory and identical frames are processed once
+ICO_ENGINES = ("magick", "native")
+# Entry encoding of natively rebuilt icons; "auto" is PNG at 256px and BMP below, as Windows' own icons.
+ICO_ENTRY_FORMATS = ("auto", "png", "bmp")
+ICO_MAX_PX = 256  # the largest size an ICO entry can declare
 
-def split_ico_to_pngs(magick: str, ico_path: Path, out_dir: Path) -> List[Path]:
-    """
-    Extract all embedded icon frames from .ico into PNG files using ImageMagick.
 
-    Produces: out_dir/<stem>_frame_000.png, etc.
-    """
+def _frames_for(ico_path: Path, out_dir: Path) -> List[Path]:
+    return sorted(Path(out_dir).glob(f"{Path(ico_path).stem}_frame_*.png"))
+
+
+def split_ico_job(ico_path: Path, out_dir: Path) -> MagickJob:
+    """Build the magick arguments that write every frame of ico_path into out_dir."""
     ico_path = Path(ico_path)
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -20,33 +40,253 @@ def split_ico_to_pngs(magick: str, ico_path: Path, out_dir: Path) -> List[Path]:
         raise FileNotFoundError(f"ICO not found: {ico_path}")
 
     # ImageMagick writes one file per frame using a numbered pattern.
+    # -scene 0 restarts the numbering when several icons share one magick process.
     pattern = out_dir / f"{ico_path.stem}_frame_%03d.png"
 
     args = [
-        magick,
+        "-scene", "0",
         str(ico_path),
         "-alpha", "on",
         "-strip",
-        str(pattern),
     ]
-    run_cmd(args)
+    return MagickJob(args, str(pattern))
+
 
-    frames = sorted(out_dir.glob(f"{ico_path.stem}_frame_*.png"))
+def split_ico_to_pngs(magick: str, ico_path: Path, out_dir: Path) -> List[Path]:
+    """
+    Extract all embedded icon frames from .ico into PNG files using ImageMagick.
+
+    Produces: out_dir/<stem>_frame_000.png, etc.
+    """
+    job = split_ico_job(ico_path, out_dir)
+    run_cmd(job.command(magick))
+
+    frames = _frames_for(ico_path, out_dir)
     return frames
 
 
+def split_icos_batch(
+    magick: str,
+    pairs: List[Tuple[Path, Path]],
+    batch_size: int = 16,
+) -> List[Union[List[Path], Exception]]:
+    """
+    split_ico_to_pngs for many (ico_path, out_dir) pairs, batch_size icons per
+    magick process. Returns the frame list, or the exception, for each icon.
+    """
+    jobs = [build_job(split_ico_job, ico, out_dir) for ico, out_dir in pairs]
+    errors = run_jobs(magick, jobs, batch_size)
+    return [err or _frames_for(ico, out_dir) for (ico, out_dir), err in zip(pairs, errors)]
+
+
+def rebuild_ico_job(png_frames: List[Path], dst_ico: Path) -> MagickJob:
+    """Build the magick arguments that combine png_frames into dst_ico."""
+    dst_ico = Path(dst_ico)
+    dst_ico.parent.mkdir(parents=True, exist_ok=True)
+
+    if not png_frames:
+        raise RuntimeError("No PNG frames supplied to rebuild ICO.")
+
+    return MagickJob([str(p) for p in png_frames] + ["-colors", "256"], str(dst_ico))
+
+
 def rebuild_ico_from_pngs(magick: str, png_frames: List[Path], dst_ico: Path) -> Path:
     """
     Rebuild an .ico from multiple PNG frames using ImageMagick.
 
     NOTE: Best results when frames are square and common icon sizes (16, 24, 32, 48, 64, 128, 256).
     """
+    job = rebuild_ico_job(png_frames, dst_ico)
+    run_cmd(job.command(magick))
+    return Path(dst_ico)
+
+
+def rebuild_icos_batch(
+    magick: str,
+    pairs: List[Tuple[List[Path], Path]],
+    batch_size: int = 16,
+) -> List[Union[Path, Exception]]:
+    """
+    rebuild_ico_from_pngs for many (png_frames, dst_ico) pairs, batch_size icons
+    per magick process. Returns dst_ico, or the exception, for each icon.
+    """
+    jobs = [build_job(rebuild_ico_job, frames, dst) for frames, dst in pairs]
+    errors = run_jobs(magick, jobs, batch_size)
+    return [err or Path(dst) for (_, dst), err in zip(pairs, errors)]
+
+
+# ---- native engine ----
+def read_ico_frames(ico_path: Path) -> List[Image.Image]:
+    """Every frame of an .ico as an RGBA image (largest first), decoded in-process."""
+    ico_path = Path(ico_path)
+    if not ico_path.exists():
+        raise FileNotFoundError(f"ICO not found: {ico_path}")
+    with Image.open(ico_path) as im:
+        if im.format != "ICO":
+            raise ValueError(f"Not an ICO file: {ico_path.name}")
+        return [im.ico.frame(i).convert("RGBA") for i in range(len(im.ico.entry))]
+
+
+def frame_key(img: Image.Image) -> str:
+    """Content hash of a decoded frame: equal for pixel-identical frames."""
+    h = hashlib.sha1(f"{img.mode}|{img.width}x{img.height}|".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def split_icos_native(ico_paths: List[Path]) -> List[Union[List[Tuple[str, Image.Image]], Exception]]:
+    """The (frame_key, frame) list, or the exception, for each icon. Nothing is written."""
+    results: List[Union[List[Tuple[str, Image.Image]], Exception]] = []
+    for ico in ico_paths:
+        try:
+            results.append([(frame_key(fr), fr) for fr in read_ico_frames(ico)])
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _bmp_entry(img: Image.Image) -> bytes:
+    """A 32-bit BMP icon entry: BITMAPINFOHEADER, bottom-up BGRA rows, then the AND mask."""
+    w, h = img.size
+    rgba = np.asarray(img.convert("RGBA"))[::-1]
+    xor = np.ascontiguousarray(rgba[..., [2, 1, 0, 3]]).tobytes()
+    # 1 = transparent, for readers that ignore alpha; rows padded to 32 bits
+    mask = np.packbits(rgba[..., 3] == 0, axis=1)
+    stride = (w + 31) // 32 * 4
+    mask = np.pad(mask, ((0, 0), (0, stride - mask.shape[1]))).tobytes()
+    header = struct.pack("<IiiHHIIiiII", 40, w, h * 2, 1, 32, 0, len(xor) + len(mask), 0, 0, 0, 0)
+    return header + xor + mask
+
+
+def _png_entry(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def ico_entry(img: Image.Image, entry_format: str = "auto") -> Tuple[int, int, bytes]:
+    """(width, height, data) of one icon entry; frames larger than 256px are scaled down."""
+    img = img.convert("RGBA")
+    if max(img.size) > ICO_MAX_PX:
+        img.thumbnail((ICO_MAX_PX, ICO_MAX_PX), Image.LANCZOS)
+    fmt = (entry_format or "auto").strip().lower()
+    if fmt not in ICO_ENTRY_FORMATS:
+        raise ValueError(f"Unknown ICO entry format: {entry_format!r}")
+    if fmt == "auto":
+        fmt = "png" if max(img.size) >= ICO_MAX_PX else "bmp"
+    data = _png_entry(img) if fmt == "png" else _bmp_entry(img)
+    return img.width, img.height, data
+
+
+def write_ico(entries: List[Tuple[int, int, bytes]], dst_ico: Path) -> Path:
+    """Write (width, height, data) entries as an .ico; written to a temp file, then moved into place."""
     dst_ico = Path(dst_ico)
+    if not entries:
+        raise RuntimeError("No frames supplied to rebuild ICO.")
     dst_ico.parent.mkdir(parents=True, exist_ok=True)
 
-    if not png_frames:
-        raise RuntimeError("No PNG frames supplied to rebuild ICO.")
+    head = struct.pack("<HHH", 0, 1, len(entries))
+    offset = len(head) + 16 * len(entries)
+    directory, blobs = [], []
+    for w, h, data in entries:
+        # 0 means 256 in the one-byte size fields
+        directory.append(struct.pack("<BBBBHHII", w % 256, h % 256, 0, 0, 1, 32, len(data), offset))
+        blobs.append(data)
+        offset += len(data)
 
-    args = [magick] + [str(p) for p in png_frames] + ["-colors", "256", str(dst_ico)]
-    run_cmd(args)
+    tmp = dst_ico.with_name(f"{dst_ico.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(head + b"".join(directory) + b"".join(blobs))
+    os.replace(tmp, dst_ico)
     return dst_ico
+
+
+def rebuild_icos_native(
+    pairs: List[Tuple[List[Path], Path]],
+    entry_format: str = "auto",
+    workers: int = 1,
+) -> List[Union[Path, Exception]]:
+    """
+    rebuild_ico_from_pngs without ImageMagick and without -colors 256: frames are
+    stored as 32-bit PNG or BMP entries. A frame file shared by several icons is
+    encoded once. Returns dst_ico, or the exception, for each pair.
+    """
+    encoded: Dict[Path, Tuple[int, int, bytes]] = {}
+    lock = threading.Lock()
+
+    def entry(frame: Path) -> Tuple[int, int, bytes]:
+        with lock:
+            hit = encoded.get(frame)
+        if hit is None:
+            hit = ico_entry(load_image(frame), entry_format)
+            with lock:
+                encoded[frame] = hit
+        return hit
+
+    def one(pair: Tuple[List[Path], Path]) -> Union[Path, Exception]:
+        frames, dst = pair
+        try:
+            return write_ico([entry(Path(fr)) for fr in frames], dst)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        return list(pool.map(one, pairs))
+
+
+# ---- pyramid ----
+def parse_icon_sizes(text: str) -> List[int]:
+    """ "256,48,16" -> [256, 48, 16]: distinct sizes, largest first."""
+    try:
+        sizes = sorted({int(p) for p in str(text).replace(";", ",").split(",") if p.strip()}, reverse=True)
+    except ValueError:
+        raise ValueError(f"Icon sizes must be whole numbers, got {text!r}") from None
+    if not sizes or sizes[-1] < 1 or sizes[0] > ICO_MAX_PX:
+        raise ValueError(f"Icon sizes must be between 1 and {ICO_MAX_PX}, got {text!r}")
+    return sizes
+
+
+def _square(img: Image.Image, size: int) -> Image.Image:
+    """img fitted into a transparent size x size canvas, centered."""
+    img = img.convert("RGBA")
+    if img.size == (size, size):
+        return img
+    img.thumbnail((size, size), Image.LANCZOS)
+    canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    canvas.paste(img, ((size - img.width) // 2, (size - img.height) // 2))
+    return canvas
+
+
+def icon_pyramid(master: Union[Path, Image.Image], sizes: List[int]) -> List[Image.Image]:
+    """
+    Every size (square, RGBA) from one master image in a single pass.
+
+    An SVG master is parsed once and rendered at each size, so small sizes stay
+    crisp; a raster master is decoded once and resampled to each size.
+    """
+    if not isinstance(master, Image.Image) and Path(master).suffix.lower() == ".svg":
+        drawing = load_svg(Path(master))
+        return [_square(drawing.render(n, area_drawing=False), n) for n in sizes]
+
+    img = load_image(master).convert("RGBA")
+    side = max(img.size)
+    img = _square(img, side)
+    return [img if n == side else img.resize((n, n), Image.LANCZOS, reducing_gap=3.0) for n in sizes]
+
+
+def build_icon_pyramids(
+    pairs: List[Tuple[Union[Path, Image.Image], Path]],
+    sizes: List[int],
+    entry_format: str = "auto",
+    workers: int = 1,
+) -> List[Union[Path, Exception]]:
+    """An .ico with every size for each (master, dst_ico) pair. Returns dst_ico, or the exception, for each."""
+    def one(pair) -> Union[Path, Exception]:
+        master, dst = pair
+        try:
+            return write_ico([ico_entry(img, entry_format) for img in icon_pyramid(master, sizes)], dst)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        return list(pool.map(one, pairs))
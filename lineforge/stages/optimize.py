@@ -0,0 +1,444 @@
+"""
+SVG optimizer for traced output, run between trace and export.
+
+The SVG is read and written one element at a time (ElementTree's pull parser),
+so memory stays flat however many paths a file has:
+
+- group transforms are baked into the path coordinates, which are rounded to
+  `precision` decimals of a root user unit (a bitmap pixel for traced SVGs)
+  and written as integers under one scale() group, like potrace does;
+- the XML declaration, doctype, metadata, comments and attributes that only
+  restate defaults are dropped;
+- consecutive paths with the same fill become one path (only where that cannot
+  change the result: opaque, nonzero fill, outlines wound the same way);
+- every segment is written absolute or relative, whichever is shorter, with
+  H/V for straight lines and implicit command repeats.
+
+Only potrace-style SVGs (filled paths in groups) are rewritten; anything else
+(strokes, shapes, text, arcs, ...) is copied unchanged.
+"""
+from __future__ import annotations
+
+import io
+import os
+import re
+import shutil
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import ImageColor
+
+from ..svgraster import _IGNORED, _NUMBER, _PATH_TOKEN, SvgUnsupported, _style, _tag, parse_transform
+
+MAX_PRECISION = 4
+
+# Inherited paint properties; stroke is only accepted as "none".
+_PAINT = ("fill", "fill-rule", "fill-opacity", "stroke")
+# Attributes that cannot change how a fill-only drawing looks; dropped.
+_HARMLESS = {
+    "id", "class", "version", "stroke-width", "stroke-linecap", "stroke-linejoin",
+    "stroke-miterlimit", "stroke-dasharray", "stroke-dashoffset", "stroke-opacity",
+}
+_ROOT_KEPT = ("width", "height", "viewBox", "preserveAspectRatio")
+# One subpath: "M" then "L" or "C" per segment, and its points (one for M/L, three for C)
+Subpath = Tuple[str, List[Tuple[float, float]]]
+
+
+def _fmt(v: float) -> str:
+    text = f"{v:.6f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _root_value(name: str, value: str) -> Optional[str]:
+    """A root attribute with its numbers written compactly; None if it restates the default."""
+    if name == "preserveAspectRatio":
+        return None if value.split() in (["xMidYMid"], ["xMidYMid", "meet"]) else value
+    return re.sub(_NUMBER, lambda m: _fmt(float(m.group(0))), value)
+
+
+def _unit(name: str, value: str) -> float:
+    """An opacity, clamped to 0..1."""
+    try:
+        return max(0.0, min(1.0, float(value)))
+    except ValueError:
+        raise SvgUnsupported(f"unsupported {name} {value!r}") from None
+
+
+def _color(value: str) -> str:
+    """fill value as the shortest hex color."""
+    try:
+        rgb = ImageColor.getrgb(value)
+    except ValueError:
+        raise SvgUnsupported(f"unsupported fill {value!r}") from None
+    if len(rgb) == 4 and rgb[3] != 255:
+        raise SvgUnsupported(f"unsupported fill {value!r}")
+    text = "".join(f"{c:02x}" for c in rgb[:3])
+    if text[0::2] == text[1::2]:
+        text = text[0::2]
+    return "#" + text
+
+
+def _parse_path(d: str) -> List[Subpath]:
+    """
+    Path data -> subpaths with absolute points. Handles M L H V C S Q T Z,
+    absolute and relative; quadratics become the equivalent cubics.
+    """
+    tokens = _PATH_TOKEN.findall(d or "")
+    subpaths: List[Subpath] = []
+    ops: List[str] = []
+    pts: List[Tuple[float, float]] = []
+    cx = cy = sx = sy = 0.0
+    last_c = last_q = None  # previous control point, reflected by S / T
+    cmd = None
+    i = 0
+
+    def take(n: int) -> List[float]:
+        nonlocal i
+        if i + n > len(tokens):
+            raise SvgUnsupported("truncated path data")
+        try:
+            vals = [float(tok) for tok in tokens[i:i + n]]
+        except ValueError:
+            raise SvgUnsupported("malformed path data") from None
+        i += n
+        return vals
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            cmd = tokens[i]
+            i += 1
+        elif cmd is None:
+            raise SvgUnsupported("path data does not start with a command")
+        c = cmd.upper()
+        ox, oy = (cx, cy) if cmd.islower() else (0.0, 0.0)
+        ctrl_c = ctrl_q = None
+
+        if c == "M":
+            if ops:
+                subpaths.append(("".join(ops), pts))
+            x, y = take(2)
+            cx, cy = sx, sy = ox + x, oy + y
+            ops, pts = ["M"], [(cx, cy)]
+            cmd = "l" if cmd == "m" else "L"  # further pairs are implicit lineto
+        elif not ops and c != "Z":
+            raise SvgUnsupported("path data does not start with a moveto")
+        elif c in ("L", "H", "V"):
+            if c == "L":
+                x, y = take(2)
+                cx, cy = ox + x, oy + y
+            elif c == "H":
+                cx = ox + take(1)[0]
+            else:
+                cy = oy + take(1)[0]
+            ops.append("L")
+            pts.append((cx, cy))
+        elif c in ("C", "S"):
+            if c == "C":
+                x1, y1, x2, y2, x, y = take(6)
+                p1 = (ox + x1, oy + y1)
+            else:
+                x2, y2, x, y = take(4)
+                p1 = (2 * cx - last_c[0], 2 * cy - last_c[1]) if last_c else (cx, cy)
+            ctrl_c = (ox + x2, oy + y2)
+            ops.append("C")
+            pts += [p1, ctrl_c, (ox + x, oy + y)]
+            cx, cy = ox + x, oy + y
+        elif c in ("Q", "T"):
+            if c == "Q":
+                qx, qy = take(2)
+                q = (ox + qx, oy + qy)
+            else:
+                q = (2 * cx - last_q[0], 2 * cy - last_q[1]) if last_q else (cx, cy)
+            x, y = take(2)
+            x, y = ox + x, oy + y
+            ops.append("C")
+            pts += [
+                (cx + (q[0] - cx) * 2 / 3, cy + (q[1] - cy) * 2 / 3),
+                (x + (q[0] - x) * 2 / 3, y + (q[1] - y) * 2 / 3),
+                (x, y),
+            ]
+            cx, cy, ctrl_q = x, y, q
+        elif c == "Z":
+            if ops:
+                subpaths.append(("".join(ops), pts))
+            ops, pts = [], []
+            cx, cy = sx, sy
+            cmd = None  # Z takes no arguments
+        else:
+            raise SvgUnsupported(f"unsupported path command {cmd!r}")
+        last_c, last_q = ctrl_c, ctrl_q
+
+    if ops:
+        subpaths.append(("".join(ops), pts))
+    return subpaths
+
+
+def _join(nums: List[int]) -> str:
+    return " ".join(map(str, nums)).replace(" -", "-")
+
+
+class _PathWriter:
+    """
+    Writes the data of one output <path>. The current point carries over from
+    one merged source path to the next, so relative moves stay correct.
+    """
+
+    def __init__(self, out: IO[str]):
+        self.out = out
+        self.cur = (0, 0)
+        self.last: Optional[str] = None  # the command a bare number list would repeat
+        self.parts: List[str] = []
+
+    def _emit(self, rel: str, rel_nums: List[int], abs_: str, abs_nums: List[int]) -> None:
+        """Write one command, relative or absolute, whichever is shorter."""
+        a, b = _join(rel_nums), _join(abs_nums)
+        a = rel + a if rel != self.last else a if a[0] == "-" else " " + a
+        b = abs_ + b if abs_ != self.last else b if b[0] == "-" else " " + b
+        if len(b) < len(a):
+            a, rel = b, abs_
+        self.parts.append(a)
+        self.last = "l" if rel == "m" else "L" if rel == "M" else rel
+
+    def subpath(self, ops: str, q: np.ndarray) -> None:
+        """One closed subpath: ops as from _parse_path, q its points on the integer grid."""
+        pts = [tuple(p) for p in q.tolist()]
+        sx, sy = pts[0]
+        # a final line back to the start is what "z" draws anyway
+        if ops.endswith("L") and pts[-1] == (sx, sy):
+            ops, pts = ops[:-1], pts[:-1]
+        if len(ops) < 2 or (len(ops) < 3 and "C" not in ops):
+            return  # encloses nothing
+
+        cx, cy = self.cur
+        emit = self._emit
+        emit("m", [sx - cx, sy - cy], "M", [sx, sy])
+        cx, cy = sx, sy
+        i = 1
+        for k in range(1, len(ops)):
+            if ops[k] == "L":
+                x, y = pts[i]
+                i += 1
+                if x == cx and y == cy:
+                    continue
+                if ops[k + 1:k + 2] == "L":
+                    # the next line goes straight on: one line will do
+                    nx, ny = pts[i]
+                    if (x - cx) * (ny - y) == (y - cy) * (nx - x) and (x - cx) * (nx - x) + (y - cy) * (ny - y) >= 0:
+                        continue
+                if y == cy:
+                    emit("h", [x - cx], "H", [x])
+                elif x == cx:
+                    emit("v", [y - cy], "V", [y])
+                else:
+                    emit("l", [x - cx, y - cy], "L", [x, y])
+            else:
+                (x1, y1), (x2, y2), (x, y) = pts[i:i + 3]
+                i += 3
+                if x1 == x2 == x == cx and y1 == y2 == y == cy:
+                    continue
+                emit("c", [x1 - cx, y1 - cy, x2 - cx, y2 - cy, x - cx, y - cy], "C", [x1, y1, x2, y2, x, y])
+            cx, cy = x, y
+        self.parts.append("z")
+        self.out.write("".join(self.parts))
+        self.parts.clear()
+        self.cur = (sx, sy)
+        self.last = None
+
+
+class _Optimizer:
+    """Rewrites one SVG from parser events; see the module docstring."""
+
+    def __init__(self, out: IO[str], precision: int, merge: bool):
+        self.out = out
+        self.precision = max(0, min(MAX_PRECISION, int(precision)))
+        self.merge = merge
+        self.scale = 10.0 ** self.precision
+        # per open element: (transform matrix, inherited paint)
+        self.stack: List[Tuple[np.ndarray, Dict[str, str]]] = []
+        self.skip = 0      # depth inside metadata/title/desc/defs
+        self.open_key: Optional[Tuple[Tuple[str, str], ...]] = None  # attributes of the <path> being written
+        self.open_sign = 0
+        self.writer: Optional[_PathWriter] = None
+        self.done = False
+
+    def _attrs(self, el: ET.Element, allowed: Tuple[str, ...]) -> Dict[str, str]:
+        attrs = _style(el)
+        for name in attrs:
+            if name not in allowed and name not in _PAINT and name not in _HARMLESS:
+                raise SvgUnsupported(f"unsupported attribute {name!r} on <{_tag(el)}>")
+        return attrs
+
+    def _paint(self, attrs: Dict[str, str]) -> Dict[str, str]:
+        paint = dict(self.stack[-1][1]) if self.stack else {"fill": "#000", "fill-rule": "nonzero"}
+        paint.update({k: attrs[k].strip() for k in _PAINT if k in attrs})
+        if paint.get("stroke", "none") != "none":
+            raise SvgUnsupported("strokes are not optimized")
+        return paint
+
+    def start(self, el: ET.Element) -> None:
+        tag = _tag(el)
+        if self.skip or tag in _IGNORED or tag is None:
+            self.skip += 1
+            return
+        if not self.stack:
+            if tag != "svg":
+                raise SvgUnsupported(f"root element is <{tag}>, not <svg>")
+            attrs = self._attrs(el, _ROOT_KEPT + ("x", "y"))
+            kept = {k: _root_value(k, attrs[k]) for k in _ROOT_KEPT if k in attrs}
+            self.out.write('<svg xmlns="http://www.w3.org/2000/svg"'
+                           + "".join(f' {k}="{v}"' for k, v in kept.items() if v is not None) + ">\n")
+            if self.precision:
+                self.out.write(f'<g transform="scale({_fmt(1 / self.scale)})">\n')
+            self.stack.append((np.eye(3), self._paint(attrs)))
+            return
+        if tag not in ("g", "path"):
+            raise SvgUnsupported(f"unsupported element <{tag}>")
+
+        attrs = self._attrs(el, ("transform", "opacity", "d") if tag == "path" else ("transform", "opacity"))
+        if tag == "g" and _unit("opacity", attrs.get("opacity", "1")) != 1:
+            raise SvgUnsupported("group opacity is not optimized")
+        m = self.stack[-1][0] @ parse_transform(attrs.get("transform"))
+        paint = self._paint(attrs)
+        self.stack.append((m, paint))
+        if tag == "path":
+            self._path(attrs.get("d", ""), m, paint, attrs.get("opacity", "1"))
+
+    def end(self, el: ET.Element) -> None:
+        if self.skip:
+            self.skip -= 1
+            return
+        self.stack.pop()
+        if not self.stack:
+            self._close_path()
+            if self.precision:
+                self.out.write("</g>\n")
+            self.out.write("</svg>\n")
+            self.done = True
+
+    def _key(self, paint: Dict[str, str], opacity: str) -> Optional[Tuple[Tuple[str, str], ...]]:
+        """The output attributes of a path with this paint, or None if it draws nothing."""
+        if paint["fill"] == "none":
+            return None
+        attrs = [("fill", _color(paint["fill"]))]
+        if paint.get("fill-rule", "nonzero") != "nonzero":
+            attrs.append(("fill-rule", paint["fill-rule"]))
+        for name, value in (("fill-opacity", paint.get("fill-opacity", "1")), ("opacity", opacity)):
+            v = _unit(name, value)
+            if v != 1:
+                attrs.append((name, _fmt(v)))
+        return tuple(attrs)
+
+    def _path(self, d: str, m: np.ndarray, paint: Dict[str, str], opacity: str) -> None:
+        key = self._key(paint, opacity)
+        subpaths = _parse_path(d)
+        if key is None or not subpaths:
+            return
+        pts = np.array([p for _, sp in subpaths for p in sp], dtype=np.float64)
+        pts = pts @ m[:2, :2].T + m[:2, 2]
+        q = np.rint(pts * self.scale).astype(np.int64)
+
+        # merged paths must wind the same way: compare the signed areas of their
+        # control polygons (each subpath closed on itself)
+        sign = 0
+        if self.merge:
+            ends = np.cumsum([len(sp) for _, sp in subpaths])
+            nxt = np.arange(1, len(q) + 1)
+            nxt[ends - 1] = np.concatenate([[0], ends[:-1]])
+            x, y = q[:, 0], q[:, 1]
+            area = int(np.dot(x, y[nxt]) - np.dot(y, x[nxt]))
+            sign = (area > 0) - (area < 0)
+
+        # overlapping translucent or even-odd paths would look different as one path
+        mergeable = self.merge and len(key) == 1
+        if not (mergeable and key == self.open_key and sign in (0, self.open_sign)):
+            self._close_path()
+            self.out.write("<path" + "".join(f' {k}="{v}"' for k, v in key if (k, v) != ("fill", "#000")) + ' d="')
+            self.open_key = key if mergeable else None
+            self.open_sign = sign
+            self.writer = _PathWriter(self.out)
+        elif not self.open_sign:
+            self.open_sign = sign
+
+        at = 0
+        for ops, sp in subpaths:
+            self.writer.subpath(ops, q[at:at + len(sp)])
+            at += len(sp)
+        if not mergeable:
+            self._close_path()
+
+    def _close_path(self) -> None:
+        if self.writer is not None:
+            self.out.write('"/>\n')
+            self.writer = None
+            self.open_key = None
+
+
+def optimize_stream(src: IO[bytes], out: IO[str], precision: int = 1, merge: bool = True) -> None:
+    """Write the optimized form of the SVG read from src to out; SvgUnsupported if it cannot be."""
+    opt = _Optimizer(out, precision, merge)
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parents: List[ET.Element] = []
+
+    def events() -> None:
+        for event, el in parser.read_events():
+            if event == "start":
+                opt.start(el)
+                parents.append(el)
+            else:
+                opt.end(el)
+                parents.pop()
+                if parents:
+                    del parents[-1][-1]  # done with it: keep the tree from growing
+
+    try:
+        for chunk in iter(lambda: src.read(1 << 16), b""):
+            parser.feed(chunk)
+            events()
+        parser.close()
+        events()
+    except ET.ParseError as e:
+        raise SvgUnsupported(f"not valid XML: {e}") from None
+    if not opt.done:
+        raise SvgUnsupported("no <svg> root element")
+
+
+def optimize_svg_text(svg: str, precision: int = 1, merge: bool = True) -> str:
+    """optimize_stream for SVG text; the text unchanged if it cannot be optimized."""
+    out = io.StringIO()
+    try:
+        optimize_stream(io.BytesIO(svg.encode("utf-8")), out, precision, merge)
+    except SvgUnsupported:
+        return svg
+    return out.getvalue()
+
+
+def optimize_svg(src: Path, dst: Path, precision: int = 1, merge: bool = True) -> Path:
+    """
+    Write the optimized src to dst. An SVG the optimizer does not handle is
+    copied unchanged.
+    """
+    src, dst = Path(src), Path(dst)
+    if src.suffix.lower() != ".svg":
+        raise RuntimeError(f"The SVG optimizer needs an SVG input (is trace enabled?): {src.name}")
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    part = dst.with_name(dst.name + ".part")
+    try:
+        try:
+            with open(src, "rb") as fh, open(part, "w", encoding="utf-8", newline="\n") as out:
+                optimize_stream(fh, out, precision, merge)
+        except SvgUnsupported:
+            shutil.copyfile(src, part)
+        os.replace(part, dst)
+    finally:
+        part.unlink(missing_ok=True)
+    return dst
+
+
+def saving(src: Path, dst: Path) -> str:
+    """How much smaller dst is than src, for the log."""
+    before, after = os.path.getsize(src), os.path.getsize(dst)
+    if before == after:
+        return f"{before:,} bytes, unchanged"
+    return f"{before:,} -> {after:,} bytes ({before - after:,} saved, {1 - after / max(1, before):.0%})"
@@ -1,51 +1,109 @@
 from pathlib import Path
+from typing import Tuple, Union
+
 from PIL import Image
 
+from ..encode import save_image, suffix
+
+
+def pad_output_path(out_base: Path, out_fmt: str) -> Path:
+    """Where pad_square writes for a given base path and output format."""
+    return Path(out_base).with_suffix(suffix(out_fmt))
+
+
+# Resizes first box-reduce to within this factor of the target, then Lanczos
+# the rest; at 3 the result is indistinguishable from a full Lanczos resize.
+REDUCING_GAP = 3.0
+# JPEG draft decoding keeps at least this multiple of the fitted size, so the
+# final Lanczos still does the last 2x or more (DCT scaling alone is softer).
+DRAFT_MARGIN = 2
+
+
+def _fit(w: int, h: int, size: int) -> Tuple[int, int]:
+    scale = min(size / w, size / h)
+    return int(w * scale), int(h * scale)
+
+
+def _opaque(img: Image.Image) -> bool:
+    """True if img has no alpha channel, or one that is fully opaque everywhere."""
+    if img.mode in ("RGBA", "LA"):
+        return img.getchannel("A").getextrema() == (255, 255)
+    return "transparency" not in img.info
+
+
+def open_for_pad(src: Union[Path, Image.Image], size: int) -> Image.Image:
+    """
+    Decode src no larger than pad_image needs for a size x size canvas. JPEG is
+    decoded at a reduced scale (1/2 to 1/8) that still covers DRAFT_MARGIN
+    times the fitted size; other formats decode fully. Images are returned
+    unchanged.
+    """
+    if isinstance(src, Image.Image):
+        return src
+    img = Image.open(src)
+    nw, nh = _fit(img.width, img.height, size)
+    img.draft(img.mode, (nw * DRAFT_MARGIN, nh * DRAFT_MARGIN))
+    img.load()
+    return img
 
-def pad_square(in_path: Path, out_base: Path, size: int, bg_mode: str, out_fmt: str, jpeg_quality: int = 95) -> Path:
+
+def pad_image(img: Image.Image, size: int, bg_mode: str, out_fmt: str = "png") -> Image.Image:
+    """
+    Fit img into a size x size canvas, centered, on the chosen background.
+    The result is what pad_square would save for out_fmt (JPEG gets no alpha).
+    """
     transparent = bg_mode == "transparent"
-    img = Image.open(in_path)
+    nw, nh = _fit(img.width, img.height, size)
+    # an alpha channel that is opaque everywhere is dropped instead of composited
+    opaque = _opaque(img)
 
     if transparent:
-        img = img.convert("RGBA")
-        w, h = img.size
-        scale = min(size / w, size / h)
-        nw, nh = int(w * scale), int(h * scale)
-        img = img.resize((nw, nh), Image.LANCZOS)
+        if opaque and img.mode in ("RGB", "L"):
+            # resize first: the RGBA copy is made at the target size only
+            img = img.resize((nw, nh), Image.LANCZOS, reducing_gap=REDUCING_GAP).convert("RGBA")
+        else:
+            img = img.convert("RGBA")
+            img = img.resize((nw, nh), Image.LANCZOS, reducing_gap=REDUCING_GAP)
 
         canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
         canvas.paste(img, ((size - nw) // 2, (size - nh) // 2), img)
     else:
         bg = (0, 0, 0) if bg_mode == "black" else (255, 255, 255)
 
-        if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+        if not opaque or img.mode in ("P", "PA"):
             img = img.convert("RGBA")
             flat = Image.new("RGBA", img.size, bg + (255,))
             flat.paste(img, (0, 0), img)
             img = flat.convert("RGB")
-        else:
+        elif img.mode != "RGB":
             img = img.convert("RGB")
 
-        w, h = img.size
-        scale = min(size / w, size / h)
-        nw, nh = int(w * scale), int(h * scale)
-        img = img.resize((nw, nh), Image.LANCZOS)
+        img = img.resize((nw, nh), Image.LANCZOS, reducing_gap=REDUCING_GAP)
 
         canvas = Image.new("RGB", (size, size), bg)
         canvas.paste(img, ((size - nw) // 2, (size - nh) // 2))
 
-    out_base.parent.mkdir(parents=True, exist_ok=True)
+    if out_fmt in ("jpg", "jpeg") and transparent:
+        # JPEG doesn't support transparency — flatten to white
+        flat = Image.new("RGB", canvas.size, (255, 255, 255))
+        flat.paste(canvas, (0, 0), canvas)
+        canvas = flat
 
-    if out_fmt in ("jpg", "jpeg"):
-        if transparent:
-            # JPEG doesn't support transparency — flatten to white
-            flat = Image.new("RGB", canvas.size, (255, 255, 255))
-            flat.paste(canvas, (0, 0), canvas)
-            canvas = flat
-        p = out_base.with_suffix(".jpg")
-        canvas.save(p, quality=jpeg_quality)
-    else:
-        p = out_base.with_suffix(".png")
-        canvas.save(p)
+    return canvas
+
+
+def pad_square(
+    in_path: Union[Path, Image.Image],
+    out_base: Path,
+    size: int,
+    bg_mode: str,
+    out_fmt: str,
+    jpeg_quality: int = 95,
+    profile: str = "balanced",
+) -> Path:
+    img = open_for_pad(in_path, size)
+    canvas = pad_image(img, size, bg_mode, out_fmt)
+
+    out_base.parent.mkdir(parents=True, exist_ok=True)
 
-    return p
+    return save_image(canvas, pad_output_path(out_base, out_fmt), out_fmt, profile, jpeg_quality)
@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+from functools import partial
 from pathlib import Path
+from typing import List, Sequence, Tuple, Union
 
+import numpy as np
+from PIL import Image, ImageFilter
+
+from ..encode import magick_output, save_image
+from ..imaging import decode_image, encode_png, flatten, gray, load_image, to_uint8
 from ..utils import run_cmd
+from .batch import MagickJob, build_job, run_jobs
 
+PREPROCESS_MODES = ("none", "threshold", "quantize")
+PREPROCESS_ENGINES = ("magick", "pillow")
 
-def preprocess_magick(
-    magick: str,
-    src: Path,
-    dst: Path,
+
+def _magick_ops(
     grayscale: bool = True,
     auto_level: bool = True,
     contrast_stretch: bool = True,
@@ -20,25 +28,16 @@ def preprocess_magick(
     mode: str = "none",               # "none" | "threshold" | "quantize"
     threshold_pct: int = 45,          # used when mode == "threshold"
     quantize_levels: int = 16,        # used when mode == "quantize"
-) -> Path:
+) -> List[str]:
     """
-    Preprocess an image using ImageMagick CLI (magick).
-    Always writes a PNG to dst.
+    The magick operators applied between reading the source and writing the PNG.
 
     Modes:
       - none: no hard threshold or quantize
       - threshold: brightness cutoff (2-tone B/W)
       - quantize: grayscale tone reduction (levels)
     """
-    src = Path(src)
-    dst = Path(dst)
-
-    if not src.exists():
-        raise FileNotFoundError(f"Source image not found: {src}")
-
-    dst.parent.mkdir(parents=True, exist_ok=True)
-
-    args: list[str] = [magick, str(src)]
+    args: list[str] = []
 
     # Flatten alpha (avoid transparency artifacts downstream)
     args += ["-background", "white", "-alpha", "remove", "-alpha", "off"]
@@ -92,8 +91,220 @@ def preprocess_magick(
     else:
         raise ValueError(f"Unknown preprocess mode: {mode!r}")
 
-    # Force PNG output
-    args += [f"png:{dst}"]
+    return args
+
+
+def _out_fmt(dst: Path) -> str:
+    return "webp" if Path(dst).suffix.lower() == ".webp" else "png"
+
+
+def preprocess_magick_job(src: Path, dst: Path, *opts, profile: str = "balanced") -> MagickJob:
+    """
+    Build the magick arguments that preprocess src into a PNG at dst (lossless
+    WebP if dst ends in .webp), encoded per profile.
+    opts are the preprocess_magick settings after dst, in order.
+    """
+    src = Path(src)
+    dst = Path(dst)
+
+    if not src.exists():
+        raise FileNotFoundError(f"Source image not found: {src}")
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+
+    defines, output = magick_output(dst, _out_fmt(dst), profile)
+    return MagickJob([str(src)] + _magick_ops(*opts) + defines, output)
+
+
+def preprocess_magick(
+    magick: str,
+    src: Path,
+    dst: Path,
+    grayscale: bool = True,
+    auto_level: bool = True,
+    contrast_stretch: bool = True,
+    cs_black: float = 0.5,
+    cs_white: float = 0.5,
+    median: int = 1,
+    blur: float = 0.0,
+    negate: bool = False,
+    mode: str = "none",
+    threshold_pct: int = 45,
+    quantize_levels: int = 16,
+    profile: str = "balanced",
+) -> Path:
+    """
+    Preprocess an image using ImageMagick CLI (magick).
+    Writes a PNG (or WebP) to dst. See preprocess_magick_job for the operations.
+    """
+    job = preprocess_magick_job(
+        src, dst,
+        grayscale, auto_level, contrast_stretch,
+        cs_black, cs_white, median, blur,
+        negate,
+        mode, threshold_pct, quantize_levels,
+        profile=profile,
+    )
+    run_cmd(job.command(magick))
+    return Path(dst)
+
+
+def preprocess_magick_image(magick: str, src: Union[Path, Image.Image], *opts) -> Image.Image:
+    """
+    preprocess_magick without touching disk: the source (a path, or an in-memory
+    image piped in as PNG) is read by magick and the result comes back over stdout.
+    """
+    data = None
+    inp = str(src)
+    if isinstance(src, Image.Image):
+        data = encode_png(src)
+        inp = "png:-"
+    elif not Path(src).exists():
+        raise FileNotFoundError(f"Source image not found: {src}")
+
+    out = run_cmd([magick, inp] + _magick_ops(*opts) + ["png:-"], input_bytes=data)
+    return decode_image(out)
+
+
+def preprocess_magick_batch(
+    magick: str,
+    pairs: List[Tuple[Path, Path]],
+    opts: Sequence = (),
+    batch_size: int = 16,
+    profile: str = "balanced",
+) -> List[Union[Path, Exception]]:
+    """
+    Preprocess many (src, dst) pairs that share the same settings, batch_size
+    files per magick process. opts are the preprocess_magick arguments after dst.
+
+    Returns dst, or the exception for that file, for each pair.
+    """
+    factory = partial(preprocess_magick_job, profile=profile)
+    jobs = [build_job(factory, src, dst, *opts) for src, dst in pairs]
+    errors = run_jobs(magick, jobs, batch_size)
+    return [err or Path(dst) for (_, dst), err in zip(pairs, errors)]
+
+
+def stretch_bounds(hist: np.ndarray, black_pct: float, white_pct: float) -> Tuple[int, int]:
+    """The levels a contrast stretch maps to black and white, from a 256-bin histogram."""
+    total = float(hist.sum())
+    lo = int(np.searchsorted(np.cumsum(hist), total * float(black_pct) / 100.0, side="right"))
+    hi = 255 - int(np.searchsorted(np.cumsum(hist[::-1]), total * float(white_pct) / 100.0, side="right"))
+    return lo, hi
+
+
+def _contrast_stretch(arr: np.ndarray, black_pct: float, white_pct: float) -> np.ndarray:
+    """
+    Linear stretch that saturates black_pct% of pixels to black and white_pct% to white
+    (magick's -contrast-stretch, channels in sync).
+    """
+    lo, hi = stretch_bounds(np.bincount(to_uint8(arr).ravel(), minlength=256), black_pct, white_pct)
+    if hi <= lo:
+        return arr
+    return np.clip((arr - lo) * (255.0 / (hi - lo)), 0, 255)
+
+
+def preprocess_image(
+    img: Image.Image,
+    grayscale: bool = True,
+    auto_level: bool = True,
+    contrast_stretch: bool = True,
+    cs_black: float = 0.5,
+    cs_white: float = 0.5,
+    median: int = 1,
+    blur: float = 0.0,
+    negate: bool = False,
+    mode: str = "none",
+    threshold_pct: int = 45,
+    quantize_levels: int = 16,
+) -> Image.Image:
+    """
+    In-process equivalent of preprocess_magick on an already decoded image.
+
+    Applies the same operations in the same order and returns an "L" (grayscale)
+    or "RGB" image. Quantize picks an adaptive median-cut palette, like magick's
+    -colors, so tone boundaries can differ slightly from the magick output.
+    """
+    mode = (mode or "none").strip().lower()
+    if mode not in PREPROCESS_MODES:
+        raise ValueError(f"Unknown preprocess mode: {mode!r}")
+
+    arr = np.asarray(flatten(img), dtype=np.float32)
+
+    if grayscale:
+        arr = gray(arr)
+
+    if auto_level:
+        lo, hi = float(arr.min()), float(arr.max())
+        if hi > lo:
+            arr = (arr - lo) * (255.0 / (hi - lo))
+
+    if contrast_stretch:
+        arr = _contrast_stretch(arr, cs_black, cs_white)
+
+    out = to_uint8(arr)
+    im = Image.fromarray(out, "L" if out.ndim == 2 else "RGB")
+
+    # magick's -median N is an NxN window; Pillow needs an odd size
+    if int(median) > 1:
+        im = im.filter(ImageFilter.MedianFilter(int(median) | 1))
+
+    if float(blur) > 0.0:
+        im = im.filter(ImageFilter.GaussianBlur(float(blur)))
+
+    if negate:
+        im = Image.fromarray(255 - np.asarray(im), im.mode)
+
+    if mode == "threshold":
+        tp = max(0, min(100, int(threshold_pct)))
+        cut = 255.0 * tp / 100.0
+        # like magick's -threshold: one cut of the pixel's intensity, so colour input ends up black and white
+        mask = np.where(gray(np.asarray(im)) > cut, 255, 0).astype(np.uint8)
+        if im.mode == "RGB":
+            mask = np.repeat(mask[..., None], 3, axis=2)
+        im = Image.fromarray(mask, im.mode)
+
+    elif mode == "quantize":
+        levels = max(2, min(256, int(quantize_levels)))
+        if im.mode != "L":
+            im = Image.fromarray(to_uint8(gray(np.asarray(im))), "L")
+        im = im.quantize(levels, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE).convert("L")
+
+    return im
+
+
+def preprocess_pillow(
+    src: Union[Path, Image.Image],
+    dst: Path,
+    grayscale: bool = True,
+    auto_level: bool = True,
+    contrast_stretch: bool = True,
+    cs_black: float = 0.5,
+    cs_white: float = 0.5,
+    median: int = 1,
+    blur: float = 0.0,
+    negate: bool = False,
+    mode: str = "none",
+    threshold_pct: int = 45,
+    quantize_levels: int = 16,
+    profile: str = "balanced",
+) -> Path:
+    """
+    Preprocess an image in-process (Pillow/NumPy) instead of spawning magick.
+    Writes a PNG (or WebP, by dst's suffix) to dst. See preprocess_image.
+    """
+    dst = Path(dst)
+
+    if not isinstance(src, Image.Image) and not Path(src).exists():
+        raise FileNotFoundError(f"Source image not found: {src}")
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
 
-    run_cmd(args)
-    return dst
+    out = preprocess_image(
+        load_image(src),
+        grayscale, auto_level, contrast_stretch,
+        cs_black, cs_white, median, blur,
+        negate,
+        mode, threshold_pct, quantize_levels,
+    )
+    return save_image(out, dst, _out_fmt(dst), profile)
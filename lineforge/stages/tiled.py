@@ -0,0 +1,328 @@
+"""
+Tiled processing for images too large to hold in memory whole (archival
+scans of hundreds of megapixels).
+
+The source is decoded once to an 8-bit grayscale PGM, by ImageMagick held to
+the memory budget with -limit (it caches pixels on disk past that). A PGM can
+be read back a band of rows at a time, so preprocess, pad and trace work on
+horizontal strips sized to fit the budget:
+
+- preprocess: a first pass collects the histogram auto-level, contrast
+  stretch and quantize need. Median and blur see extra rows past each strip
+  edge, so strips filter exactly like the whole image. Writes a PGM.
+- pad: strips are box-reduced and the small result is padded as usual.
+- trace: each strip is binarized and traced with TRACE_HALO extra rows on
+  each side, and its paths go into the one SVG in place. Neighbouring strips
+  overlap, so a shape cut by one strip's edge is drawn whole by the other.
+
+Tiled output is grayscale.
+"""
+from __future__ import annotations
+
+import math
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from ..imaging import to_uint8
+from ..tracer import bitmap_to_svg
+from ..utils import run_cmd
+from .pad import DRAFT_MARGIN, pad_square
+from .preprocess import PREPROCESS_MODES, stretch_bounds
+from .trace import _potrace_pbm
+
+MB = 1024 * 1024
+# Bytes of working memory per strip pixel (float copies, filters, tracer edge lists).
+WORK_BYTES_PER_PX = 48
+MIN_STRIP_ROWS = 64
+# Rows traced past each edge of a strip; shapes cut there are traced whole by the neighbour.
+TRACE_HALO = 32
+
+_PGM_HEADER = re.compile(rb"P5(?:\s+(?:#[^\n]*\n)*)(\d+)(?:\s+(?:#[^\n]*\n)*)(\d+)(?:\s+(?:#[^\n]*\n)*)(\d+)\s")
+
+
+class Pgm:
+    """An 8-bit binary PGM (P5) on disk, read a band of rows at a time."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            m = _PGM_HEADER.match(f.read(1024))
+        if not m or int(m.group(3)) != 255:
+            raise ValueError(f"Not an 8-bit binary PGM: {self.path}")
+        self.width, self.height = int(m.group(1)), int(m.group(2))
+        self._offset = m.end()
+
+    def strips(self, rows: int, halo: int = 0) -> Iterator[Tuple[int, int, int, np.ndarray]]:
+        """
+        (y0, y1, top, band) for consecutive strips of `rows` rows: band holds
+        rows y0 - halo to y1 + halo (clipped to the image), row y0 is band[top].
+        """
+        with open(self.path, "rb") as f:
+            for y0 in range(0, self.height, rows):
+                y1 = min(self.height, y0 + rows)
+                a, b = max(0, y0 - halo), min(self.height, y1 + halo)
+                f.seek(self._offset + a * self.width)
+                data = f.read((b - a) * self.width)
+                if len(data) != (b - a) * self.width:
+                    raise ValueError(f"Truncated PGM: {self.path}")
+                yield y0, y1, y0 - a, np.frombuffer(data, np.uint8).reshape(b - a, self.width)
+
+
+class PgmWriter:
+    """Writes an 8-bit PGM a band of rows at a time; the file appears complete or not at all."""
+
+    def __init__(self, path: Path, width: int, height: int):
+        self.path = Path(path)
+        self._tmp = self.path.with_name(self.path.name + ".part")
+        self._f = open(self._tmp, "wb")
+        self._f.write(b"P5\n%d %d\n255\n" % (width, height))
+
+    def write(self, rows: np.ndarray) -> None:
+        self._f.write(np.ascontiguousarray(rows, dtype=np.uint8).tobytes())
+
+    def __enter__(self) -> "PgmWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._f.close()
+        if exc_type is None:
+            os.replace(self._tmp, self.path)
+        else:
+            self._tmp.unlink(missing_ok=True)
+
+
+def needs_tiling(src: Path, budget_mb: int) -> bool:
+    """Whether processing src whole would take more than budget_mb of working memory."""
+    try:
+        with Image.open(src) as im:  # reads the header only
+            w, h = im.size
+    except Image.DecompressionBombError:
+        return True  # Pillow refuses to even open it
+    except Exception:
+        return False  # not for us to report: the regular path will
+    return w * h * WORK_BYTES_PER_PX > budget_mb * MB
+
+
+def strip_rows(width: int, budget_mb: int, halo: int = 0) -> int:
+    """Rows per strip so that a strip and its halo fit budget_mb."""
+    rows = int(budget_mb * MB // (max(1, width) * WORK_BYTES_PER_PX)) - 2 * halo
+    return max(MIN_STRIP_ROWS, rows)
+
+
+def _is_pgm(src: Path) -> bool:
+    try:
+        Pgm(src)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def decode_gray(magick: Optional[str], src: Path, dst: Path, budget_mb: int) -> Path:
+    """
+    src as an 8-bit grayscale PGM, alpha removed onto white. Returns src
+    itself if it already is one, otherwise writes dst with ImageMagick.
+    """
+    src = Path(src)
+    if not src.exists():
+        raise FileNotFoundError(f"Source image not found: {src}")
+    if _is_pgm(src):
+        return src
+    if not magick:
+        raise RuntimeError("ImageMagick 'magick' is required to decode large images in tiled mode.")
+    limit = f"{max(16, int(budget_mb))}MiB"
+    run_cmd([
+        magick, "-limit", "memory", limit, "-limit", "map", limit, f"{src}[0]",
+        "-background", "white", "-alpha", "remove", "-alpha", "off",
+        "-colorspace", "Gray", "-depth", "8", f"pgm:{dst}",
+    ])
+    return Path(dst)
+
+
+def _point_lut(hist: np.ndarray, auto_level: bool, contrast_stretch: bool,
+               cs_black: float, cs_white: float) -> np.ndarray:
+    """auto-level and contrast stretch (as preprocess_image does them) as a lookup table."""
+    v = np.arange(256, dtype=np.float32)
+    if auto_level:
+        present = np.nonzero(hist)[0]
+        lo, hi = (float(present[0]), float(present[-1])) if len(present) else (0.0, 0.0)
+        if hi > lo:
+            v = (v - lo) * (255.0 / (hi - lo))
+    if contrast_stretch:
+        lo, hi = stretch_bounds(np.bincount(to_uint8(v), weights=hist, minlength=256), cs_black, cs_white)
+        if hi > lo:
+            v = np.clip((v - lo) * (255.0 / (hi - lo)), 0, 255)
+    return to_uint8(v)
+
+
+def _quantize_lut(hist: np.ndarray, levels: int) -> np.ndarray:
+    """
+    The median-cut levels-tone quantize of the whole image, as a lookup table.
+    The boxes are cut on a 1M pixel sample with the image's histogram.
+    """
+    counts = np.floor(hist * ((1 << 20) / max(1, hist.sum()))).astype(np.int64)
+    counts = np.maximum(counts, hist > 0)  # every tone present keeps a say
+    sample = np.repeat(np.arange(256, dtype=np.uint8), counts)
+    quantized = Image.fromarray(sample.reshape(1, -1), "L").quantize(
+        levels, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE,
+    )
+    lut = np.arange(256, dtype=np.uint8)
+    lut[sample] = np.asarray(quantized.convert("L")).ravel()  # each tone -> the level of its box
+    return lut
+
+
+def preprocess_tiled(
+    magick: Optional[str],
+    src: Path,
+    dst: Path,
+    budget_mb: int,
+    grayscale: bool = True,
+    auto_level: bool = True,
+    contrast_stretch: bool = True,
+    cs_black: float = 0.5,
+    cs_white: float = 0.5,
+    median: int = 1,
+    blur: float = 0.0,
+    negate: bool = False,
+    mode: str = "none",
+    threshold_pct: int = 45,
+    quantize_levels: int = 16,
+) -> Path:
+    """
+    preprocess_image in strips within budget_mb. Always grayscale (grayscale
+    is ignored); writes a PGM next to dst (same stem) and returns its path.
+    """
+    mode = (mode or "none").strip().lower()
+    if mode not in PREPROCESS_MODES:
+        raise ValueError(f"Unknown preprocess mode: {mode!r}")
+
+    dst = Path(dst).with_suffix(".pgm")
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    size = int(median) | 1 if int(median) > 1 else 0
+    halo = size // 2 + (math.ceil(3 * float(blur)) + 2 if float(blur) > 0.0 else 0)
+
+    # negate and threshold, after the filters
+    finish = np.arange(256, dtype=np.uint8)
+    if negate:
+        finish = 255 - finish
+    if mode == "threshold":
+        cut = 255.0 * max(0, min(100, int(threshold_pct))) / 100.0
+        finish = np.where(finish > cut, 255, 0).astype(np.uint8)
+
+    with tempfile.TemporaryDirectory(dir=dst.parent) as td:
+        pgm = Pgm(decode_gray(magick, src, Path(td) / "source.pgm", budget_mb))
+        rows = strip_rows(pgm.width, budget_mb, halo)
+
+        hist = np.zeros(256, dtype=np.int64)
+        for _, _, _, band in pgm.strips(rows):
+            hist += np.bincount(band.ravel(), minlength=256)
+        lut = _point_lut(hist, auto_level, contrast_stretch, cs_black, cs_white)
+
+        def filtered() -> Iterator[np.ndarray]:
+            for y0, y1, top, band in pgm.strips(rows, halo):
+                im = Image.fromarray(lut[band], "L")
+                if size:
+                    im = im.filter(ImageFilter.MedianFilter(size))
+                if float(blur) > 0.0:
+                    im = im.filter(ImageFilter.GaussianBlur(float(blur)))
+                yield finish[np.asarray(im)[top:top + y1 - y0]]
+
+        if mode != "quantize":
+            with PgmWriter(dst, pgm.width, pgm.height) as out:
+                for core in filtered():
+                    out.write(core)
+            return dst
+
+        # the palette depends on the filtered tones: filter to a temp file, then map it
+        tmp = Path(td) / "filtered.pgm"
+        hist = np.zeros(256, dtype=np.int64)
+        with PgmWriter(tmp, pgm.width, pgm.height) as out:
+            for core in filtered():
+                hist += np.bincount(core.ravel(), minlength=256)
+                out.write(core)
+        lut = _quantize_lut(hist, max(2, min(256, int(quantize_levels))))
+        with PgmWriter(dst, pgm.width, pgm.height) as out:
+            for _, _, _, band in Pgm(tmp).strips(rows):
+                out.write(lut[band])
+    return dst
+
+
+def pad_tiled(
+    magick: Optional[str],
+    src: Path,
+    out_base: Path,
+    size: int,
+    bg_mode: str,
+    out_fmt: str,
+    jpeg_quality: int,
+    budget_mb: int,
+    profile: str = "balanced",
+) -> Path:
+    """pad_square for a large src: strips are box-reduced to about twice the target size first."""
+    out_base = Path(out_base)
+    out_base.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=out_base.parent) as td:
+        pgm = Pgm(decode_gray(magick, src, Path(td) / "source.pgm", budget_mb))
+        k = max(1, int(max(pgm.width, pgm.height) / size / DRAFT_MARGIN))
+        rows = max(k, strip_rows(pgm.width, budget_mb) // k * k)  # whole boxes per strip
+        parts = [np.asarray(Image.fromarray(band, "L").reduce(k)) for _, _, _, band in pgm.strips(rows)]
+    small = Image.fromarray(np.vstack(parts), "L")
+    return pad_square(small, out_base, size, bg_mode, out_fmt, jpeg_quality, profile)
+
+
+def trace_tiled(
+    magick: Optional[str],
+    potrace: Optional[str],
+    src: Path,
+    dst: Path,
+    budget_mb: int,
+    cutoff_pct: int = 45,
+    invert: bool = False,
+    turdsize: int = 8,
+    smooth: bool = True,
+    potrace_stdin: bool = True,
+) -> Path:
+    """
+    Trace a large src to one SVG, strip by strip within budget_mb: with potrace,
+    or the built-in tracer when potrace is None. Binarizes like trace.binarize.
+    """
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    cut = 255.0 * max(0, min(100, int(cutoff_pct))) / 100.0
+
+    with tempfile.TemporaryDirectory(dir=dst.parent) as td:
+        pgm = Pgm(decode_gray(magick, src, Path(td) / "source.pgm", budget_mb))
+        w, h = pgm.width, pgm.height
+        part = dst.with_name(dst.name + ".part")
+        try:
+            with open(part, "w", encoding="utf-8") as out:
+                out.write(
+                    '<?xml version="1.0" standalone="no"?>\n'
+                    '<svg version="1.0" xmlns="http://www.w3.org/2000/svg"\n'
+                    f' width="{w:.6f}pt" height="{h:.6f}pt" viewBox="0 0 {w:.6f} {h:.6f}"\n'
+                    ' preserveAspectRatio="xMidYMid meet">\n'
+                    "<metadata>\nCreated by LineForge tiled tracer\n</metadata>\n"
+                )
+                for y0, _, top, band in pgm.strips(strip_rows(w, budget_mb, TRACE_HALO), TRACE_HALO):
+                    black = (255 - band if invert else band) <= cut
+                    if potrace is None:
+                        svg = bitmap_to_svg(black, turdsize, smooth)
+                    else:
+                        pbm = b"P4\n%d %d\n" % (w, len(black)) + np.packbits(black, axis=1).tobytes()
+                        strip_svg = Path(td) / "strip.svg"
+                        _potrace_pbm(potrace, pbm, strip_svg, turdsize, smooth, potrace_stdin)
+                        svg = strip_svg.read_text(encoding="utf-8")
+                    # the strip's group(s), in strip coordinates: shift them into place
+                    start, end = svg.find("<g"), svg.rfind("</svg>")
+                    if start >= 0:
+                        out.write(f'<g transform="translate(0.000000,{y0 - top:.6f})">\n{svg[start:end]}</g>\n')
+                out.write("</svg>\n")
+            os.replace(part, dst)
+        finally:
+            part.unlink(missing_ok=True)
+    return dst
@@ -2,19 +2,107 @@ from __future__ import annotations
 
 import tempfile
 from pathlib import Path
+from typing import List, Tuple, Union
 
+import numpy as np
+from PIL import Image
+
+from ..imaging import encode_png, flatten, gray, load_image
+from ..tracer import bitmap_to_svg
 from ..utils import run_cmd
+from .batch import MagickJob, build_job, run_jobs
+
+TRACE_BINARIZERS = ("magick", "pillow")
+TRACE_ENGINES = ("potrace", "native")
+
+
+def binarize(img: Image.Image, cutoff_pct: int = 45, invert: bool = False) -> np.ndarray:
+    """
+    Boolean bitmap of img, True = black, in-process.
+
+    Same steps as the magick PBM command in trace_to_svg: alpha removed onto
+    white, grayscale, optional invert, then pixels at or below the cutoff
+    become black.
+    """
+    cutoff = max(0, min(100, int(cutoff_pct)))
+
+    arr = gray(np.asarray(flatten(img), dtype=np.float32))
+    if invert:
+        arr = 255.0 - arr
+
+    return arr <= 255.0 * cutoff / 100.0
+
+
+def binarize_pbm(img: Image.Image, cutoff_pct: int = 45, invert: bool = False) -> bytes:
+    """
+    Encode img as a raw (P4) PBM, in-process (see binarize). Rows are bit-packed
+    MSB first and padded to a whole byte, which is exactly the P4 row layout.
+    """
+    black = binarize(img, cutoff_pct, invert)
+    h, w = black.shape
+    return b"P4\n%d %d\n" % (w, h) + np.packbits(black, axis=1).tobytes()
+
+
+def _pbm_ops(cutoff_pct: int = 45, invert: bool = False) -> List[str]:
+    cutoff = max(0, min(100, int(cutoff_pct)))
+
+    args = ["-background", "white", "-alpha", "remove", "-alpha", "off"]
+    args += ["-colorspace", "Gray"]
+    if invert:
+        args += ["-negate"]
+    args += ["-threshold", f"{cutoff}%"]
+    return args
+
+
+def pbm_magick_job(src: Path, pbm: Path, cutoff_pct: int = 45, invert: bool = False) -> MagickJob:
+    """Build the magick arguments that write a clean 1-bit PBM of src for potrace."""
+    src = Path(src)
+    if not src.exists():
+        raise FileNotFoundError(f"Source image not found: {src}")
+
+    return MagickJob([str(src)] + _pbm_ops(cutoff_pct, invert), f"pbm:{pbm}")
+
+
+def _potrace_args(potrace: str, pbm: str, dst: Path, turdsize: int, smooth: bool) -> List[str]:
+    pargs = [
+        potrace,
+        pbm,
+        "-s",
+        "-o",
+        str(dst),
+        "--turdsize",
+        str(int(turdsize)),
+    ]
+
+    # No '--smooth' (not standard). If user wants "less smoothing", use '--flat'.
+    if not smooth:
+        pargs.append("--flat")
+
+    return pargs
+
+
+def _potrace_pbm(potrace: str, pbm_bytes: bytes, dst: Path, turdsize: int, smooth: bool, stdin: bool) -> None:
+    """Hand an in-memory PBM to potrace: on stdin, or through a temp file for builds that cannot read stdin."""
+    if stdin:
+        run_cmd(_potrace_args(potrace, "-", dst, turdsize, smooth), input_bytes=pbm_bytes)
+        return
+    with tempfile.TemporaryDirectory() as td:
+        pbm = Path(td) / "input.pbm"
+        pbm.write_bytes(pbm_bytes)
+        run_cmd(_potrace_args(potrace, str(pbm), dst, turdsize, smooth))
 
 
 def trace_to_svg(
-    magick: str,
+    magick: str | None,
     potrace: str,
-    src: Path,
+    src: Union[Path, Image.Image],
     dst: Path,
     cutoff_pct: int = 45,
     invert: bool = False,
     turdsize: int = 8,
     smooth: bool = True,
+    binarize: str = "magick",
+    potrace_stdin: bool = True,
 ) -> Path:
     """
     Trace a raster image to SVG using ImageMagick -> PBM then Potrace.
@@ -25,55 +113,131 @@ def trace_to_svg(
     - When smooth=False, we use '--flat' (common potrace flag) to reduce curve fitting.
 
     Args:
-        magick: path to ImageMagick CLI ('magick')
+        magick: path to ImageMagick CLI ('magick'); unused when binarize="pillow"
         potrace: path to potrace executable
-        src: source raster image
+        src: source raster image (file, or an image already in memory)
         dst: destination SVG path
         cutoff_pct: threshold cutoff percent (0..100)
         invert: invert colors before threshold
         turdsize: speck removal (potrace --turdsize)
         smooth: if False, pass '--flat' to reduce smoothing (no curves)
+        binarize: "magick" makes the PBM with ImageMagick; "pillow" builds it
+            in-process (one process spawn per image instead of two)
+        potrace_stdin: whether this potrace reads the PBM from stdin (see
+            deps.tool). Then the PBM goes from magick / Pillow straight to
+            potrace through a pipe; otherwise through a temp file.
     """
-    src = Path(src)
     dst = Path(dst)
+    in_memory = isinstance(src, Image.Image)
 
-    if not src.exists():
+    if not in_memory and not Path(src).exists():
         raise FileNotFoundError(f"Source image not found: {src}")
 
+    binarize = (binarize or "magick").strip().lower()
+    if binarize not in TRACE_BINARIZERS:
+        raise ValueError(f"Unknown trace binarizer: {binarize!r}")
+
     dst.parent.mkdir(parents=True, exist_ok=True)
 
     cutoff = max(0, min(100, int(cutoff_pct)))
 
+    if binarize == "pillow":
+        pbm_bytes = binarize_pbm(load_image(src), cutoff, invert)
+        _potrace_pbm(potrace, pbm_bytes, dst, turdsize, smooth, potrace_stdin)
+        return dst
+
+    if not magick:
+        raise RuntimeError("ImageMagick 'magick' is required for the magick PBM step.")
+
+    if in_memory:
+        # PNG in on stdin, PBM out on stdout, straight into potrace
+        pbm_bytes = run_cmd(
+            [magick, "png:-"] + _pbm_ops(cutoff, invert) + ["pbm:-"],
+            input_bytes=encode_png(src),
+        )
+        _potrace_pbm(potrace, pbm_bytes, dst, turdsize, smooth, potrace_stdin)
+        return dst
+
+    src = Path(src)
+
+    if potrace_stdin:
+        # magick writes the PBM to stdout, potrace reads it from stdin: no temp files
+        pbm_bytes = run_cmd(pbm_magick_job(src, Path("-"), cutoff, invert).command(magick))
+        _potrace_pbm(potrace, pbm_bytes, dst, turdsize, smooth, True)
+        return dst
+
     with tempfile.TemporaryDirectory() as td:
         td_path = Path(td)
         pbm = td_path / (src.stem + ".pbm")
 
         # 1) Make a clean 1-bit PBM for potrace
-        args = [magick, str(src)]
-        args += ["-background", "white", "-alpha", "remove", "-alpha", "off"]
-        args += ["-colorspace", "Gray"]
-        if invert:
-            args += ["-negate"]
-        args += ["-threshold", f"{cutoff}%"]
-        args += [f"pbm:{pbm}"]
-
-        run_cmd(args)
+        run_cmd(pbm_magick_job(src, pbm, cutoff, invert).command(magick))
 
         # 2) Potrace -> SVG
-        pargs = [
-            potrace,
-            str(pbm),
-            "-s",
-            "-o",
-            str(dst),
-            "--turdsize",
-            str(int(turdsize)),
-        ]
-
-        # No '--smooth' (not standard). If user wants "less smoothing", use '--flat'.
-        if not smooth:
-            pargs.append("--flat")
-
-        run_cmd(pargs)
+        run_cmd(_potrace_args(potrace, str(pbm), dst, turdsize, smooth))
+
+    return dst
+
+
+def trace_native(
+    src: Union[Path, Image.Image],
+    dst: Path,
+    cutoff_pct: int = 45,
+    invert: bool = False,
+    turdsize: int = 8,
+    smooth: bool = True,
+) -> Path:
+    """
+    Raster -> SVG without potrace: binarize in-process and vectorize with the
+    built-in tracer (same threshold, turdsize and smoothing settings).
+    """
+    dst = Path(dst)
 
+    if not isinstance(src, Image.Image) and not Path(src).exists():
+        raise FileNotFoundError(f"Source image not found: {src}")
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+
+    black = binarize(load_image(src), cutoff_pct, invert)
+    dst.write_text(bitmap_to_svg(black, turdsize, smooth), encoding="utf-8")
     return dst
+
+
+def trace_batch_to_svg(
+    magick: str,
+    potrace: str,
+    pairs: List[Tuple[Path, Path]],
+    cutoff_pct: int = 45,
+    invert: bool = False,
+    turdsize: int = 8,
+    smooth: bool = True,
+    batch_size: int = 16,
+) -> List[Union[Path, Exception]]:
+    """
+    trace_to_svg (magick PBM step) for many (src, dst) pairs: the PBMs are written
+    batch_size per magick process, then potrace runs once per file.
+
+    Returns dst, or the exception for that file, for each pair.
+    """
+    cutoff = max(0, min(100, int(cutoff_pct)))
+
+    with tempfile.TemporaryDirectory() as td:
+        # index the PBMs so sources with the same stem cannot collide
+        pbms = [Path(td) / f"{i:06d}.pbm" for i in range(len(pairs))]
+        jobs = [build_job(pbm_magick_job, src, pbm, cutoff, invert) for (src, _), pbm in zip(pairs, pbms)]
+        errors = run_jobs(magick, jobs, batch_size)
+
+        results: List[Union[Path, Exception]] = []
+        for (_, dst), pbm, err in zip(pairs, pbms, errors):
+            if err is not None:
+                results.append(err)
+                continue
+            try:
+                dst = Path(dst)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                run_cmd(_potrace_args(potrace, str(pbm), dst, turdsize, smooth))
+                results.append(dst)
+            except Exception as e:
+                results.append(e)
+
+    return results
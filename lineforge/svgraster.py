@@ -0,0 +1,467 @@
+from __future__ import annotations
+
+import math
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageColor
+
+from .encode import save_image
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+
+# Anti-aliasing: coverage is sampled on SUPERSAMPLE sub-rows per pixel row (exact along the row).
+SUPERSAMPLE = 4
+# Curves are flattened until they stay within this many output pixels of the true curve.
+FLATTEN_TOLERANCE_PX = 0.2
+# Output rows rasterized at a time (bounds the size of the supersampled buffer).
+BAND_ROWS = 128
+
+_UNITS = {"": 1.0, "px": 1.0, "pt": 96 / 72, "pc": 16.0, "mm": 96 / 25.4, "cm": 96 / 2.54, "in": 96.0}
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_PATH_TOKEN = re.compile(rf"[A-Za-z]|{_NUMBER}")
+_TRANSFORM = re.compile(r"(\w+)\s*\(([^)]*)\)")
+_IGNORED = {"metadata", "title", "desc", "defs"}
+
+
+class SvgUnsupported(ValueError):
+    """The SVG uses something outside the subset the built-in rasterizer draws."""
+
+
+class FilledPath(NamedTuple):
+    """One filled <path>: subpaths as (K, 4, 2) cubic segments in root user units."""
+    subpaths: List[np.ndarray]
+    rgb: Tuple[int, int, int]
+    alpha: float
+    evenodd: bool
+
+
+def _length(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    m = re.fullmatch(rf"\s*({_NUMBER})\s*([a-z]*)\s*", value)
+    if not m or m.group(2) not in _UNITS:
+        raise SvgUnsupported(f"unsupported length {value!r}")
+    return float(m.group(1)) * _UNITS[m.group(2)]
+
+
+def _numbers(text: str) -> List[float]:
+    return [float(n) for n in re.findall(_NUMBER, text)]
+
+
+def parse_transform(text: Optional[str]) -> np.ndarray:
+    """SVG transform attribute -> 3x3 affine matrix (translate/scale/rotate/matrix)."""
+    m = np.eye(3)
+    if not text:
+        return m
+    for name, args in _TRANSFORM.findall(text):
+        v = _numbers(args)
+        t = np.eye(3)
+        if name == "matrix" and len(v) == 6:
+            t[0, :] = v[0], v[2], v[4]
+            t[1, :] = v[1], v[3], v[5]
+        elif name == "translate" and len(v) in (1, 2):
+            t[0, 2] = v[0]
+            t[1, 2] = v[1] if len(v) == 2 else 0.0
+        elif name == "scale" and len(v) in (1, 2):
+            t[0, 0] = v[0]
+            t[1, 1] = v[1] if len(v) == 2 else v[0]
+        elif name == "rotate" and len(v) in (1, 3):
+            a = math.radians(v[0])
+            c, s = math.cos(a), math.sin(a)
+            t[:2, :2] = [[c, -s], [s, c]]
+            if len(v) == 3:
+                cx, cy = v[1], v[2]
+                t[0, 2] = cx - c * cx + s * cy
+                t[1, 2] = cy - s * cx - c * cy
+        else:
+            raise SvgUnsupported(f"unsupported transform {name}({args})")
+        m = m @ t
+    return m
+
+
+def _line(p0, p1) -> Tuple:
+    return (p0, p0 + (p1 - p0) / 3.0, p0 + (p1 - p0) * (2.0 / 3.0), p1)
+
+
+def parse_path(d: str) -> List[np.ndarray]:
+    """
+    Path data -> list of subpaths, each a (K, 4, 2) array of cubic segments.
+
+    Handles the commands potrace and most simple editors emit (M L H V C S Q T Z,
+    absolute and relative, with implicit repeats). Lines become straight cubics.
+    Elliptical arcs are not supported.
+    """
+    tokens = _PATH_TOKEN.findall(d or "")
+    subpaths: List[np.ndarray] = []
+    segs: List[Tuple] = []
+    cur = start = np.zeros(2)
+    last_ctrl = None  # reflected for S/T
+    cmd = None
+    i = 0
+
+    def take(n: int) -> np.ndarray:
+        nonlocal i
+        if i + n > len(tokens):
+            raise SvgUnsupported("truncated path data")
+        try:
+            vals = [float(tok) for tok in tokens[i:i + n]]
+        except ValueError:
+            raise SvgUnsupported("malformed path data") from None
+        i += n
+        return np.array(vals)
+
+    def close_subpath() -> None:
+        nonlocal segs
+        if segs:
+            subpaths.append(np.array(segs, dtype=np.float64))
+        segs = []
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            cmd = tokens[i]
+            i += 1
+        elif cmd is None:
+            raise SvgUnsupported("path data does not start with a command")
+
+        c = cmd.upper()
+        rel = cmd.islower()
+        base = cur if rel else np.zeros(2)
+        ctrl = None
+
+        if c == "M":
+            close_subpath()
+            cur = start = base + take(2)
+            cmd = "l" if rel else "L"  # further pairs are implicit lineto
+        elif c == "L":
+            p = base + take(2)
+            segs.append(_line(cur, p))
+            cur = p
+        elif c in ("H", "V"):
+            v = take(1)[0]
+            p = cur.copy()
+            axis = 0 if c == "H" else 1
+            p[axis] = (cur[axis] if rel else 0.0) + v
+            segs.append(_line(cur, p))
+            cur = p
+        elif c == "C":
+            v = take(6)
+            p1, p2, p = base + v[0:2], base + v[2:4], base + v[4:6]
+            segs.append((cur, p1, p2, p))
+            cur, ctrl = p, p2
+        elif c == "S":
+            v = take(4)
+            p1 = 2 * cur - last_ctrl[1] if last_ctrl and last_ctrl[0] == "C" else cur
+            p2, p = base + v[0:2], base + v[2:4]
+            segs.append((cur, p1, p2, p))
+            cur, ctrl = p, p2
+        elif c in ("Q", "T"):
+            if c == "Q":
+                q = base + take(2)
+            else:
+                q = 2 * cur - last_ctrl[1] if last_ctrl and last_ctrl[0] == "Q" else cur
+            p = base + take(2)
+            segs.append((cur, cur + (q - cur) * (2.0 / 3.0), p + (q - p) * (2.0 / 3.0), p))
+            cur = p
+            last_ctrl = ("Q", q)
+            continue
+        elif c == "Z":
+            if not np.allclose(cur, start):
+                segs.append(_line(cur, start))
+            close_subpath()
+            cur = start
+            cmd = None  # Z takes no arguments; numbers after it are an error
+        else:
+            raise SvgUnsupported(f"unsupported path command {cmd!r}")
+
+        last_ctrl = ("C", ctrl) if ctrl is not None else None
+
+    close_subpath()
+    return subpaths
+
+
+def _style(el: ET.Element) -> Dict[str, str]:
+    """Presentation attributes of el, with inline style declarations taking precedence."""
+    attrs = {k: v for k, v in el.attrib.items() if not k.startswith("{")}
+    for decl in attrs.pop("style", "").split(";"):
+        if ":" in decl:
+            k, v = decl.split(":", 1)
+            attrs[k.strip()] = v.strip()
+    return attrs
+
+
+def _tag(el: ET.Element) -> Optional[str]:
+    """Local SVG tag name, or None for elements from other namespaces."""
+    if el.tag.startswith(SVG_NS):
+        return el.tag[len(SVG_NS):]
+    if el.tag.startswith("{"):
+        return None
+    return el.tag
+
+
+def _opacity(value: str) -> float:
+    try:
+        return max(0.0, min(1.0, float(value)))
+    except ValueError:
+        raise SvgUnsupported(f"unsupported opacity {value!r}") from None
+
+
+class SvgDrawing:
+    """
+    A parsed SVG made only of filled paths (potrace output and similar).
+
+    Supported: nested <g>/<path> with transform, fill, fill-rule, fill-opacity and
+    opacity on paths. Anything else that would draw (strokes, shapes, text, images,
+    clipping, masks, filters, group opacity, ...) raises SvgUnsupported so the
+    caller can fall back to Inkscape.
+    """
+
+    def __init__(self, paths: List[FilledPath], page: Tuple[float, float, float, float]):
+        self.paths = paths
+        self.page = page  # x, y, width, height in root user units
+
+    @classmethod
+    def parse(cls, data: bytes) -> "SvgDrawing":
+        try:
+            root = ET.fromstring(data)
+        except ET.ParseError as e:
+            raise SvgUnsupported(f"invalid XML: {e}") from None
+        if _tag(root) != "svg":
+            raise SvgUnsupported("root element is not <svg>")
+
+        for el in root.iter():
+            if el.tag.endswith("}namedview"):
+                page_opacity = el.get("{http://www.inkscape.org/namespaces/inkscape}pageopacity", "0")
+                if _opacity(page_opacity) > 0:
+                    raise SvgUnsupported("opaque page background")
+
+        paths: List[FilledPath] = []
+        inherited = {"fill": "black", "fill-rule": "nonzero", "fill-opacity": "1", "stroke": "none"}
+        for child in root:
+            cls._walk(child, np.eye(3), inherited, paths)
+        return cls(paths, cls._page(root))
+
+    @staticmethod
+    def _page(root: ET.Element) -> Tuple[float, float, float, float]:
+        vb = root.get("viewBox")
+        w, h = _length(root.get("width")), _length(root.get("height"))
+        if vb:
+            x, y, vw, vh = (_numbers(vb) + [0.0] * 4)[:4]
+            if vw <= 0 or vh <= 0:
+                raise SvgUnsupported(f"invalid viewBox {vb!r}")
+            if w and h and abs(w / h - vw / vh) > 1e-6 * (vw / vh):
+                raise SvgUnsupported("viewBox aspect differs from width/height")
+            return x, y, vw, vh
+        if not w or not h:
+            raise SvgUnsupported("no viewBox or width/height")
+        return 0.0, 0.0, w, h
+
+    @classmethod
+    def _walk(cls, el: ET.Element, ctm: np.ndarray, inherited: Dict[str, str], out: List[FilledPath]) -> None:
+        tag = _tag(el)
+        if tag is None or tag in _IGNORED:
+            return
+        if tag not in ("g", "path"):
+            raise SvgUnsupported(f"unsupported element <{tag}>")
+
+        style = _style(el)
+        if style.get("display") == "none" or style.get("visibility") in ("hidden", "collapse"):
+            return
+        for attr in ("clip-path", "mask", "filter"):
+            if style.get(attr, "none") != "none":
+                raise SvgUnsupported(f"unsupported attribute {attr}")
+
+        ctm = ctm @ parse_transform(style.get("transform"))
+        attrs = dict(inherited)
+        attrs.update({k: style[k] for k in ("fill", "fill-rule", "fill-opacity", "stroke") if k in style})
+
+        if tag == "g":
+            if _opacity(style.get("opacity", "1")) < 1:
+                raise SvgUnsupported("group opacity")
+            for child in el:
+                cls._walk(child, ctm, attrs, out)
+            return
+
+        if attrs["stroke"] != "none":
+            raise SvgUnsupported("stroked path")
+        fill = attrs["fill"]
+        if fill == "none":
+            return
+        try:
+            rgb = ImageColor.getrgb(fill)[:3]
+        except ValueError:
+            raise SvgUnsupported(f"unsupported fill {fill!r}") from None
+        alpha = _opacity(attrs["fill-opacity"]) * _opacity(style.get("opacity", "1"))
+
+        subpaths = []
+        for sp in parse_path(style.get("d", "")):
+            pts = sp.reshape(-1, 2) @ ctm[:2, :2].T + ctm[:2, 2]
+            subpaths.append(pts.reshape(sp.shape))
+        if subpaths and alpha > 0:
+            out.append(FilledPath(subpaths, rgb, alpha, attrs["fill-rule"] == "evenodd"))
+
+    def _polygons(self, scale: float) -> List[List[np.ndarray]]:
+        """Flatten every path's subpaths to closed polygons (user units) for a given px-per-unit scale."""
+        flat = iter(_flatten([sp for path in self.paths for sp in path.subpaths], scale))
+        return [[next(flat) for _ in path.subpaths] for path in self.paths]
+
+    def render(self, width: int, area_drawing: bool = True) -> Image.Image:
+        """
+        Rasterize to an RGBA image `width` pixels wide on a transparent background.
+
+        The exported area is the drawing's bounding box (area_drawing) or the page,
+        like Inkscape's --export-area-drawing / --export-area-page; the height
+        follows from the area's aspect ratio. An empty drawing (a blank trace) has
+        no bounding box, so it falls back to the (transparent) page.
+        """
+        width = max(1, int(width))
+
+        if area_drawing and self.paths:
+            # control points bound the curves, so this scale is a safe estimate for flattening
+            ctrl = np.concatenate([sp.reshape(-1, 2) for p in self.paths for sp in p.subpaths])
+            ext = max(float(np.ptp(ctrl[:, 0])), 1e-9)
+            polys = self._polygons(width / ext)
+            pts = np.concatenate([poly for pp in polys for poly in pp])
+            x0, y0 = pts.min(axis=0)
+            x1, y1 = pts.max(axis=0)
+            area = (float(x0), float(y0), float(x1 - x0), float(y1 - y0))
+        else:
+            area = self.page
+            polys = self._polygons(width / area[2])
+
+        ax, ay, aw, ah = area
+        if aw <= 0 or ah <= 0:
+            raise SvgUnsupported("export area is empty")
+        scale = width / aw
+        height = max(1, int(round(ah * scale)))
+
+        rgb = np.zeros((height, width, 3), dtype=np.float32)
+        alpha = np.zeros((height, width), dtype=np.float32)
+        offset = np.array([ax, ay])
+        px = [[(poly - offset) * scale for poly in pp] for pp in polys]
+        for path, pp in zip(self.paths, px):
+            _composite(rgb, alpha, pp, path)
+
+        out = np.dstack([rgb / np.maximum(alpha, 1e-6)[..., None], alpha]) * 255.0
+        return Image.fromarray(np.clip(np.rint(out), 0, 255).astype(np.uint8), "RGBA")
+
+
+def _flatten(subpaths: List[np.ndarray], scale: float) -> List[np.ndarray]:
+    """(K, 4, 2) cubic segment arrays -> (N, 2) polylines, subdivided per Wang's formula."""
+    if not subpaths:
+        return []
+    segs = np.concatenate(subpaths)
+    p0, p1, p2, p3 = segs[:, 0], segs[:, 1], segs[:, 2], segs[:, 3]
+    dd = np.maximum(
+        np.linalg.norm(p0 - 2 * p1 + p2, axis=1),
+        np.linalg.norm(p1 - 2 * p2 + p3, axis=1),
+    ) * scale
+    n = np.clip(np.ceil(np.sqrt(0.75 * dd / FLATTEN_TOLERANCE_PX)), 1, 256).astype(np.int64)
+
+    seg = np.repeat(np.arange(len(segs)), n)
+    first = np.cumsum(n) - n
+    t = ((np.arange(int(n.sum())) - first[seg] + 1) / n[seg])[:, None]
+    u = 1.0 - t
+    pts = (u ** 3) * p0[seg] + (3 * u * u * t) * p1[seg] + (3 * u * t * t) * p2[seg] + (t ** 3) * p3[seg]
+
+    # split back per subpath, each starting at its first segment's start point
+    ends = np.cumsum([len(sp) for sp in subpaths])
+    bounds = np.concatenate([[0], np.cumsum(n)[ends - 1]])
+    starts = np.concatenate([[0], ends[:-1]])
+    return [
+        np.vstack([segs[k, 0][None], pts[lo:hi]])
+        for k, lo, hi in zip(starts, bounds[:-1], bounds[1:])
+    ]
+
+
+def _coverage(polys: List[np.ndarray], evenodd: bool, x0: int, y0: int, w: int, h: int) -> np.ndarray:
+    """
+    Fraction of each pixel in the (x0, y0, w, h) window inside the polygons.
+
+    Scanline fill over SUPERSAMPLE sub-rows per pixel row: where an edge crosses
+    a sub-row it adds its direction (+1 down, -1 up), split between the pixel it
+    lands in and the next one by the crossing's position, and a running sum along
+    the sub-row gives the winding number (fractional in edge pixels). Sub-rows are
+    averaged into the pixel row.
+    """
+    ss = SUPERSAMPLE
+    a = np.concatenate([poly for poly in polys])
+    b = np.concatenate([np.roll(poly, -1, axis=0) for poly in polys])
+    ya, yb = (a[:, 1] - y0) * ss - 0.5, (b[:, 1] - y0) * ss - 0.5
+    keep = ya != yb
+    a, b, ya, yb = a[keep], b[keep], ya[keep], yb[keep]
+
+    # sub-row r samples y = r (in these units); an edge covers the rows in [lo, hi)
+    lo, hi = np.minimum(ya, yb), np.maximum(ya, yb)
+    r0 = np.clip(np.ceil(lo), 0, h * ss).astype(np.int64)
+    r1 = np.clip(np.ceil(hi), 0, h * ss).astype(np.int64)
+    n = r1 - r0
+    edge = np.repeat(np.arange(len(a)), n)
+    first = np.cumsum(n) - n
+    rows = r0[edge] + np.arange(int(n.sum())) - first[edge]
+
+    t = (rows - ya[edge]) / (yb[edge] - ya[edge])
+    xs = np.clip(a[edge, 0] + t * (b[edge, 0] - a[edge, 0]) - x0, 0.0, float(w))
+    cols = np.minimum(np.floor(xs).astype(np.int64), w)
+    frac = xs - cols
+    dirs = np.where(yb > ya, 1.0, -1.0)[edge]
+
+    wd = w + 2
+    cov = np.empty((h, w), dtype=np.float32)
+    for band in range(0, h, BAND_ROWS):
+        bh = min(BAND_ROWS, h - band)
+        sel = (rows >= band * ss) & (rows < (band + bh) * ss)
+        flat = (rows[sel] - band * ss) * wd + cols[sel]
+        d, f = dirs[sel], frac[sel]
+        diff = np.bincount(flat, weights=d * (1.0 - f), minlength=bh * ss * wd)
+        diff += np.bincount(flat + 1, weights=d * f, minlength=bh * ss * wd)[:bh * ss * wd]
+        winding = np.cumsum(diff.reshape(bh * ss, wd)[:, :w], axis=1, dtype=np.float32)
+        if evenodd:
+            inside = 1.0 - np.abs(np.mod(winding, 2.0) - 1.0)
+        else:
+            inside = np.minimum(np.abs(winding), 1.0)
+        cov[band:band + bh] = inside.reshape(bh, ss, w).mean(axis=1)
+    return cov
+
+
+def _composite(rgb: np.ndarray, alpha: np.ndarray, polys: List[np.ndarray], path: FilledPath) -> None:
+    """Paint one path over the (premultiplied) canvas, touching only its bounding box."""
+    height, width = alpha.shape
+    pts = np.concatenate(polys)
+    x0, y0 = np.floor(pts.min(axis=0)).astype(int)
+    x1, y1 = np.ceil(pts.max(axis=0)).astype(int)
+    x0, y0 = max(x0, 0), max(y0, 0)
+    x1, y1 = min(x1, width), min(y1, height)
+    if x1 <= x0 or y1 <= y0:
+        return
+
+    a = _coverage(polys, path.evenodd, x0, y0, x1 - x0, y1 - y0) * path.alpha
+    win = (slice(y0, y1), slice(x0, x1))
+    color = np.array(path.rgb, dtype=np.float32) / 255.0
+    rgb[win] = color * a[..., None] + rgb[win] * (1.0 - a[..., None])
+    alpha[win] = a + alpha[win] * (1.0 - a)
+
+
+def load_svg(path: Path) -> SvgDrawing:
+    """Parse an SVG file for the built-in rasterizer (raises SvgUnsupported)."""
+    return SvgDrawing.parse(Path(path).read_bytes())
+
+
+def rasterize_svg(svg: Path, dst: Path, width: int = 512, area_drawing: bool = True,
+                  fmt: str = "png", profile: str = "balanced") -> Path:
+    """
+    Export an SVG to a PNG (or lossless WebP) without Inkscape. Raises
+    SvgUnsupported for SVGs outside the subset.
+    """
+    svg = Path(svg)
+    dst = Path(dst)
+
+    if not svg.exists():
+        raise FileNotFoundError(f"SVG not found: {svg}")
+
+    img = load_svg(svg).render(width, area_drawing)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    return save_image(img, dst, fmt, profile)
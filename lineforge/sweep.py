@@ -0,0 +1,283 @@
+"""
+Parameter sweeps: run the pipeline for every combination of a few settings
+without redoing the work the combinations share.
+
+Each stage runs once per distinct combination of the swept settings it (or an
+earlier stage) reads; see STAGE_FIELDS. Sweeping trace_cutoff_pct and
+potrace_turdsize therefore preprocesses and pads every image once and only
+traces and exports once per variant, while sweeping threshold_pct redoes
+everything from preprocess on.
+"""
+from __future__ import annotations
+
+import itertools
+import threading
+from dataclasses import fields, replace
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from PIL import Image, ImageDraw
+
+from .cache import StageCache
+from .imaging import load_image
+from .pipeline import OPTIMIZE_NEEDS_TRACE, Progress, _check_cancel, _no_progress, _run_staged, build_steps
+from .settings import STAGE_FIELDS, Settings
+from .svgraster import load_svg
+from .utils import list_images
+
+STAGE_FLAGS = {"A": "do_preprocess", "B": "do_pad", "C": "do_trace", "O": "do_optimize", "D": "do_export"}
+SHARED_DIR = "_sweep"
+SHEET_DIR = "contact_sheets"
+THUMB_PX = 160
+
+# (name, value) of each swept setting a stage output depends on
+Group = Tuple[Tuple[str, object], ...]
+
+
+class Variant(NamedTuple):
+    label: str                    # also the name of its output folder
+    values: Dict[str, object]
+    outputs: Dict[Path, Path]     # source image -> output of the last stage
+
+
+def _parse_one(name: str, text: str, t: type):
+    text = text.strip()
+    if t is bool:
+        if text.lower() in ("1", "true", "yes", "on"):
+            return True
+        if text.lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"{name}: expected true/false, got {text!r}")
+    try:
+        return t(text)
+    except ValueError:
+        raise ValueError(f"{name}: expected {t.__name__}, got {text!r}") from None
+
+
+def sweep_values(name: str, spec: Union[str, Sequence[object]]) -> List[object]:
+    """
+    The values of one swept setting: a list, "a,b,c", or an inclusive range
+    "start:stop[:step]" (step defaults to 1) for numeric settings.
+    """
+    default = getattr(Settings(), name, None)
+    if name not in {f.name for f in fields(Settings)}:
+        raise ValueError(f"Unknown setting: {name}")
+    t = type(default)
+
+    if not isinstance(spec, str):
+        values = [_parse_one(name, str(v), t) if isinstance(v, str) else v for v in spec]
+        for v in values:
+            if not isinstance(v, t) and not (t is float and isinstance(v, int)):
+                raise ValueError(f"{name}: expected {t.__name__}, got {v!r}")
+        values = [t(v) for v in values]
+    elif ":" in spec:
+        if t not in (int, float):
+            raise ValueError(f"{name}: ranges need a numeric setting")
+        parts = [_parse_one(name, p, t) for p in spec.split(":")]
+        if len(parts) not in (2, 3):
+            raise ValueError(f"{name}: expected start:stop or start:stop:step, got {spec!r}")
+        start, stop = parts[0], parts[1]
+        step = parts[2] if len(parts) == 3 else t(1)
+        if step <= 0 or stop < start:
+            raise ValueError(f"{name}: empty range {spec!r}")
+        n = int((stop - start) / step + 1e-9) + 1
+        values = [t(round(start + i * step, 6)) for i in range(n)]
+    else:
+        values = [_parse_one(name, p, t) for p in spec.split(",") if p.strip()]
+
+    values = list(dict.fromkeys(values))
+    if not values:
+        raise ValueError(f"{name}: no values")
+    return values
+
+
+def parse_sweep(text: str) -> Dict[str, List[object]]:
+    """A sweep written as "name=values; name=values" (see sweep_values)."""
+    sweep: Dict[str, List[object]] = {}
+    for part in text.split(";"):
+        if not part.strip():
+            continue
+        name, sep, spec = part.partition("=")
+        if not sep:
+            raise ValueError(f"Expected name=values, got {part.strip()!r}")
+        sweep[name.strip()] = sweep_values(name.strip(), spec)
+    return sweep
+
+
+def _stage_of(name: str) -> Optional[str]:
+    for key, names in STAGE_FIELDS.items():
+        if name in names:
+            return key
+    return None
+
+
+def _fmt(value: object) -> str:
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def _label(group: Group) -> str:
+    return ",".join(f"{name}={_fmt(value)}" for name, value in group)
+
+
+def _thumb(path: Path, size: int) -> Image.Image:
+    """path as a size x size tile on white; a grey tile if it cannot be shown."""
+    tile = Image.new("RGB", (size, size), "white")
+    try:
+        if path.suffix.lower() == ".svg":
+            img = load_svg(path).render(size, area_drawing=False)  # same framing for every variant
+        else:
+            img = load_image(path)
+        img = img.convert("RGBA")
+        img.thumbnail((size, size))
+        tile.paste(img, ((size - img.width) // 2, (size - img.height) // 2), img)
+    except Exception:
+        tile.paste((200, 200, 200), (0, 0, size, size))
+    return tile
+
+
+def contact_sheet(
+    src: Path,
+    variants: List[Variant],
+    names: List[str],
+    columns: int,
+    dst: Path,
+    size: int = THUMB_PX,
+) -> Optional[Path]:
+    """One image per source: a grid of its variants, labeled with their values."""
+    cells = [(v, v.outputs.get(src)) for v in variants]
+    if not any(out for _, out in cells):
+        return None
+    pad, text_h = 6, 14
+    rows = -(-len(cells) // columns)
+    header = text_h + pad
+    sheet = Image.new("RGB", (pad + columns * (size + pad), header + rows * (size + text_h + pad) + pad), "white")
+    draw = ImageDraw.Draw(sheet)
+    draw.text((pad, pad // 2), f"{src.name}: {' / '.join(names)}", fill="black")
+
+    for i, (variant, out) in enumerate(cells):
+        x = pad + (i % columns) * (size + pad)
+        y = header + (i // columns) * (size + text_h + pad)
+        if out is not None:
+            sheet.paste(_thumb(out, size), (x, y))
+        else:
+            draw.rectangle((x, y, x + size - 1, y + size - 1), outline="red")
+        draw.text((x, y + size + 1), " / ".join(_fmt(variant.values[n]) for n in names), fill="black")
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    sheet.save(dst, format="PNG")
+    return dst
+
+
+def run_sweep(
+    input_path: Path,
+    output_root: Path,
+    s: Settings,
+    sweep: Dict[str, Union[str, Sequence[object]]],
+    log,
+    progress: Optional[Progress] = None,
+    cancel: Optional[threading.Event] = None,
+    sheets: bool = True,
+) -> List[Variant]:
+    """
+    Run every combination of the swept settings (name -> values, see
+    sweep_values) on top of s.
+
+    Variant outputs go to output_root/<name=value,...>/; stage outputs shared by
+    several variants go to output_root/_sweep/. With sheets, a contact sheet
+    per input image is written to output_root/contact_sheets/.
+
+    ICO handling is not supported, and sweeps keep no ledger or timing report.
+    """
+    progress = progress or _no_progress
+    output_root = Path(output_root)
+    if s.handle_ico:
+        raise ValueError("Sweeps do not support ICO handling; turn off handle_ico.")
+    if not sweep:
+        raise ValueError("Nothing to sweep.")
+
+    enabled = [key for key, flag in STAGE_FLAGS.items() if getattr(s, flag)]
+    if "O" in enabled and "C" not in enabled:
+        raise ValueError(OPTIMIZE_NEEDS_TRACE)
+    names = list(sweep)
+    grid = [sweep_values(name, sweep[name]) for name in names]
+    for name in names:
+        key = _stage_of(name)
+        if key is None:
+            raise ValueError(f"{name} does not change any stage output; it cannot be swept.")
+        if key not in enabled:
+            raise ValueError(f"{name} is read by stage {key}, which is disabled.")
+
+    files = list_images(
+        input_path, recursive=s.input_recursive,
+        include=s.input_include, exclude=s.input_exclude, use_index=s.input_index,
+    )
+    if not files:
+        raise RuntimeError("No supported images found.")
+
+    combos = [dict(zip(names, values)) for values in itertools.product(*grid)]
+    base = replace(s, keep_intermediates=True)
+    cache = None
+    if s.use_cache:
+        cache_root = Path(s.cache_dir) if s.cache_dir else output_root / "_cache"
+        cache = StageCache(cache_root, int(s.cache_max_mb) * 1024 * 1024)
+
+    log(f"\n[Sweep] {len(combos)} variant(s) of {len(files)} file(s): "
+        + "; ".join(f"{n} = {', '.join(map(_fmt, g))}" for n, g in zip(names, grid)) + "\n")
+
+    # per group: source image -> that group's output of the stages so far
+    made: Dict[Group, Dict[Path, Path]] = {(): {f: f for f in files}}
+    read: set = set()
+    runs = 0
+    for i, key in enumerate(enabled):
+        before = set(read)
+        read |= set(STAGE_FIELDS[key])
+        last = i == len(enabled) - 1
+        groups = list(dict.fromkeys(tuple((n, c[n]) for n in names if n in read) for c in combos))
+
+        nxt: Dict[Group, Dict[Path, Path]] = {}
+        for group in groups:
+            _check_cancel(cancel)
+            parent = tuple((n, v) for n, v in group if n in before)
+            srcs = made[parent]
+            if last:
+                root = output_root / _label(group)
+            else:
+                root = output_root / SHARED_DIR / f"{key}_{_label(group) or 'all'}"
+
+            st = replace(base, **dict(group), **{flag: k == key for k, flag in STAGE_FLAGS.items()})
+            if not last:
+                # run alone the stage counts as last: encode shared results as the intermediates they are
+                st = replace(st, output_profile=st.intermediate_profile)
+            step = build_steps(root, st, cache)[0]
+            log(f"\n[Sweep] {key}) {step.title}: {_label(group) or 'shared by all variants'}")
+            try:
+                done = _run_staged(list(srcs.values()), [step], st, log, progress, cancel)
+            finally:
+                if step.close:
+                    step.close()
+            back = {cur: src for src, cur in srcs.items()}
+            nxt[group] = {back[cur]: outs[0] for cur, outs in done.items()}
+            runs += 1
+        made = nxt
+
+    variants = []
+    for combo in combos:
+        group = tuple((n, combo[n]) for n in names)
+        variants.append(Variant(_label(group), combo, made.get(group, {})))
+    log(f"\n[Sweep] {runs} stage run(s) instead of {len(combos) * len(enabled)} for separate runs\n")
+
+    if sheets:
+        columns = len(grid[-1])
+        written = 0
+        for src in files:
+            _check_cancel(cancel)
+            if contact_sheet(src, variants, names, columns, output_root / SHEET_DIR / f"{src.stem}.png"):
+                written += 1
+        log(f"[Sweep] {written} contact sheet(s) -> {output_root / SHEET_DIR}\n")
+
+    completed = sum(len(v.outputs) for v in variants)
+    progress({
+        "event": "done", "files": len(files), "variants": len(variants),
+        "completed": completed, "failed": len(files) * len(variants) - completed,
+    })
+    return variants
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import csv
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .utils import add_cmd_observer, remove_cmd_observer
+
+REPORT_JSON = "run_report.json"
+REPORT_CSV = "run_report.csv"                    # one row per file per stage
+REPORT_CMDS_CSV = "run_report_commands.csv"      # one row per external command
+SLOWEST_FILES = 10
+
+
+class FileTiming(NamedTuple):
+    stage: str
+    file: str
+    seconds: float
+    in_bytes: Optional[int]   # None for in-memory inputs
+    out_bytes: Optional[int]
+    ok: bool
+    batch: int  # files done by the same call; seconds is that call's time split evenly
+
+
+class CmdTiming(NamedTuple):
+    tool: str
+    stage: str
+    file: str
+    start_s: float  # since the run started
+    spawn_s: float  # until the process existed
+    seconds: float  # until it exited (or, for shell workers, was ready)
+    returncode: Optional[int]
+    stdin_bytes: int
+    stdout_bytes: int
+
+
+def _size(item) -> Optional[int]:
+    if isinstance(item, (str, Path)):
+        try:
+            return os.stat(item).st_size
+        except OSError:
+            return None
+    return None
+
+
+def _name(item) -> str:
+    return getattr(item, "name", None) or str(item)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..1) of already sorted values; 0.0 when empty."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def _stats(seconds: List[float]) -> Dict[str, float]:
+    v = sorted(seconds)
+    return {
+        "total_s": round(sum(v), 4),
+        "p50_s": round(percentile(v, 0.50), 4),
+        "p95_s": round(percentile(v, 0.95), 4),
+        "max_s": round(v[-1] if v else 0.0, 4),
+    }
+
+
+class Telemetry:
+    """
+    Timings for one run: each phase (stage, ICO split/rebuild) on the wall clock,
+    each file in each stage, and every external command run_cmd starts.
+
+    Use as a context manager around the run so external commands are recorded.
+    Commands are attributed to the stage and file their thread was working on.
+    """
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.t0 = time.perf_counter()
+        self._end: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self.files: List[FileTiming] = []
+        self.cmds: List[CmdTiming] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __enter__(self) -> "Telemetry":
+        add_cmd_observer(self._on_cmd)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        remove_cmd_observer(self._on_cmd)
+        self._end = time.perf_counter()
+
+    @property
+    def wall_s(self) -> float:
+        """Seconds since the run started, or its length once it has ended."""
+        return (self._end or time.perf_counter()) - self.t0
+
+    # ---- recording ----
+    @contextmanager
+    def _at(self, stage: str, file: str) -> Iterator[None]:
+        prev = getattr(self._local, "where", ("", ""))
+        self._local.where = (stage, file)
+        try:
+            yield
+        finally:
+            self._local.where = prev
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase of the run on the calling thread."""
+        t = time.perf_counter()
+        try:
+            with self._at(name, ""):
+                yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - t
+
+    def _on_cmd(self, args, spawn_s, total_s, returncode, stdin_bytes, stdout_bytes) -> None:
+        stage, file = getattr(self._local, "where", ("", ""))
+        start = time.perf_counter() - total_s - self.t0
+        rec = CmdTiming(
+            Path(args[0]).stem.lower() if args else "?", stage, file,
+            round(start, 4), round(spawn_s, 4), round(total_s, 4), returncode, stdin_bytes, stdout_bytes,
+        )
+        with self._lock:
+            self.cmds.append(rec)
+
+    def _add(self, rec: FileTiming) -> None:
+        with self._lock:
+            self.files.append(rec)
+
+    def timed(self, stage: str, fn: Callable):
+        """Wrap a Step.run so every call is recorded as one file of `stage`."""
+        def run(item):
+            name = _name(item)
+            t = time.perf_counter()
+            out, ok = None, False
+            try:
+                with self._at(stage, name):
+                    out = fn(item)
+                ok = True
+                return out
+            finally:
+                self._add(FileTiming(
+                    stage, name, round(time.perf_counter() - t, 4),
+                    _size(item), _size(out) if ok else None, ok, 1,
+                ))
+        return run
+
+    def timed_many(self, stage: str, fn_many: Callable):
+        """Wrap a Step.run_many: the call's time is split evenly over its files."""
+        def run(items):
+            t = time.perf_counter()
+            results = None
+            try:
+                with self._at(stage, f"{len(items)} files"):
+                    results = fn_many(items)
+                return results
+            finally:
+                share = round((time.perf_counter() - t) / max(1, len(items)), 4)
+                outs = results if results is not None else [RuntimeError()] * len(items)
+                for item, out in zip(items, outs):
+                    ok = not isinstance(out, Exception)
+                    self._add(FileTiming(
+                        stage, _name(item), share, _size(item), _size(out) if ok else None, ok, len(items),
+                    ))
+        return run
+
+    # ---- reporting ----
+    def summary(self) -> Dict[str, object]:
+        stages: Dict[str, Dict[str, object]] = {}
+        for stage in dict.fromkeys(f.stage for f in self.files):
+            recs = [f for f in self.files if f.stage == stage]
+            stages[stage] = {
+                "files": len(recs),
+                "failed": sum(not f.ok for f in recs),
+                **_stats([f.seconds for f in recs]),
+                "in_bytes": sum(f.in_bytes or 0 for f in recs),
+                "out_bytes": sum(f.out_bytes or 0 for f in recs),
+            }
+
+        tools: Dict[str, Dict[str, object]] = {}
+        for tool in sorted({c.tool for c in self.cmds}):
+            recs = [c for c in self.cmds if c.tool == tool]
+            tools[tool] = {
+                "calls": len(recs),
+                "failed": sum(c.returncode not in (0, None) for c in recs),
+                **_stats([c.seconds for c in recs]),
+                "spawn_p50_ms": round(percentile(sorted(c.spawn_s for c in recs), 0.5) * 1000, 2),
+                "stdin_bytes": sum(c.stdin_bytes for c in recs),
+                "stdout_bytes": sum(c.stdout_bytes for c in recs),
+            }
+
+        # a file keeps its stem through the stages (photo.jpg -> photo.png -> photo.svg)
+        per_file: Dict[str, Dict[str, float]] = {}
+        for f in self.files:
+            by = per_file.setdefault(Path(f.file).stem, {})
+            by[f.stage] = by.get(f.stage, 0.0) + f.seconds
+        slowest = sorted(per_file.items(), key=lambda kv: sum(kv[1].values()), reverse=True)[:SLOWEST_FILES]
+
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_s": round(self.wall_s, 3),
+            "phases": {k: round(v, 3) for k, v in self.phases.items()},
+            "stages": stages,
+            "tools": tools,
+            "slowest": [
+                {"file": stem, "total_s": round(sum(by.values()), 4), "stages": {k: round(v, 4) for k, v in by.items()}}
+                for stem, by in slowest
+            ],
+        }
+
+    def format_summary(self, summary: Optional[Dict[str, object]] = None) -> str:
+        """The summary as log text."""
+        sm = summary or self.summary()
+        lines = [f"\n[Timing] {sm['wall_s']:.2f}s wall"]
+        for name, sec in sm["phases"].items():  # type: ignore[union-attr]
+            lines.append(f"  {name}: {sec:.2f}s wall")
+        for stage, st in sm["stages"].items():  # type: ignore[union-attr]
+            lines.append(
+                f"  [{stage}] {st['files']} file(s), {st['failed']} failed: "
+                f"total {st['total_s']:.2f}s  p50 {st['p50_s'] * 1000:.0f}ms  "
+                f"p95 {st['p95_s'] * 1000:.0f}ms  max {st['max_s'] * 1000:.0f}ms"
+            )
+        for tool, st in sm["tools"].items():  # type: ignore[union-attr]
+            lines.append(
+                f"  {tool}: {st['calls']} call(s), total {st['total_s']:.2f}s  "
+                f"p95 {st['p95_s'] * 1000:.0f}ms  spawn p50 {st['spawn_p50_ms']:.1f}ms"
+            )
+        if sm["slowest"]:
+            lines.append("  Slowest files:")
+            for f in sm["slowest"]:  # type: ignore[union-attr]
+                parts = ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in f["stages"].items())
+                lines.append(f"    {f['file']}: {f['total_s'] * 1000:.0f}ms ({parts})")
+        return "\n".join(lines) + "\n"
+
+    def write(self, out_dir: Path, settings: Dict[str, object]) -> Tuple[Path, Path, Path]:
+        """Write the JSON report and the per-file and per-command CSVs into out_dir."""
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        j, c, k = out_dir / REPORT_JSON, out_dir / REPORT_CSV, out_dir / REPORT_CMDS_CSV
+
+        report = {
+            "summary": self.summary(),
+            "settings": settings,
+            "files": [f._asdict() for f in self.files],
+            "commands": [cmd._asdict() for cmd in self.cmds],
+        }
+        with open(j, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=1)
+
+        for path, rows, header in ((c, self.files, FileTiming._fields), (k, self.cmds, CmdTiming._fields)):
+            with open(path, "w", encoding="utf-8", newline="") as fh:
+                w = csv.writer(fh)
+                w.writerow(header)
+                w.writerows(rows)
+        return j, c, k
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+# Polygon vertices may move this far (pixels) from the traced outline when simplifying.
+POLY_TOLERANCE = 0.5
+# Same meaning as potrace's --alphamax (default 1.0): vertices sharper than this stay corners.
+ALPHAMAX = 1.0
+
+# Edge directions on the pixel-corner lattice, y pointing down.
+_STEP = np.array([(1, 0), (0, 1), (-1, 0), (0, -1)])  # E, S, W, N
+
+
+def _edges(black: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Every boundary edge between a black and a white pixel, directed so the black
+    pixel is on its right (y down). Outer outlines then run clockwise and holes
+    counter-clockwise on screen, which is what a nonzero fill needs.
+
+    Returns start x, start y and direction index (into _STEP) per edge.
+    """
+    p = np.pad(black, 1)
+    above, below = p[:-1, 1:-1], p[1:, 1:-1]  # (H+1, W): pixels either side of each horizontal edge
+    left, right = p[1:-1, :-1], p[1:-1, 1:]   # (H, W+1): pixels either side of each vertical edge
+
+    ys, xs = np.nonzero(below & ~above)
+    east = (xs, ys, np.zeros_like(xs))
+    ys, xs = np.nonzero(above & ~below)
+    west = (xs + 1, ys, np.full_like(xs, 2))
+    ys, xs = np.nonzero(left & ~right)
+    south = (xs, ys, np.full_like(xs, 1))
+    ys, xs = np.nonzero(right & ~left)
+    north = (xs, ys + 1, np.full_like(xs, 3))
+
+    parts = (east, south, west, north)
+    return tuple(np.concatenate([part[i] for part in parts]) for i in range(3))  # type: ignore[return-value]
+
+
+def _loops(black: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[int]]:
+    """
+    Link boundary edges into closed loops.
+
+    Where two black pixels touch only at a corner the walk turns left, so
+    diagonal neighbours stay connected (potrace's "black" turn policy).
+
+    Returns x, y and direction of every edge in loop order, and each loop's start offset.
+    """
+    h, w = black.shape
+    sx, sy, d = _edges(black)
+    n = len(sx)
+    if n == 0:
+        return sx, sy, d, []
+
+    ex, ey = sx + _STEP[d, 0], sy + _STEP[d, 1]
+    start_id = sy * (w + 1) + sx
+    end_id = ey * (w + 1) + ex
+
+    order = np.argsort(start_id, kind="stable")
+    sorted_ids = start_id[order]
+    lo = np.searchsorted(sorted_ids, end_id, "left")
+    hi = np.searchsorted(sorted_ids, end_id, "right")
+
+    nxt = order[lo]
+    saddle = np.nonzero(hi - lo == 2)[0]
+    if len(saddle):
+        a, b = order[lo[saddle]], order[lo[saddle] + 1]
+        left_turn = (d[saddle] + 3) % 4
+        nxt[saddle] = np.where(d[a] == left_turn, a, b)
+
+    link = nxt.tolist()
+    seen = bytearray(n)
+    walk: List[int] = []
+    starts: List[int] = []
+    for first in range(n):
+        if seen[first]:
+            continue
+        starts.append(len(walk))
+        e = first
+        while not seen[e]:
+            seen[e] = 1
+            walk.append(e)
+            e = link[e]
+
+    idx = np.array(walk)
+    return sx[idx], sy[idx], d[idx], starts
+
+
+def _simplify(pts: np.ndarray, tol: float) -> np.ndarray:
+    """Douglas-Peucker on a closed polygon: keep the vertices needed to stay within tol."""
+    n = len(pts)
+    if n <= 3:
+        return pts
+    far = int(np.argmax(((pts - pts[0]) ** 2).sum(axis=1)))
+    keep = [False] * n
+    keep[0] = keep[far] = True
+
+    closed = np.vstack([pts, pts[:1]])
+    xs, ys = closed[:, 0].tolist(), closed[:, 1].tolist()
+    stack = [(0, far), (far, n)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        ax, ay = xs[i], ys[i]
+        dx, dy = xs[j] - ax, ys[j] - ay
+        length = math.hypot(dx, dy) or 1.0
+        if j - i > 32:
+            rel = closed[i + 1:j] - (ax, ay)
+            dist = np.abs(dx * rel[:, 1] - dy * rel[:, 0])
+            k = int(np.argmax(dist))
+            best = float(dist[k])
+        else:  # short spans: plain Python beats numpy's per-call overhead
+            best, k = -1.0, 0
+            for m in range(i + 1, j):
+                dm = abs(dx * (ys[m] - ay) - dy * (xs[m] - ax))
+                if dm > best:
+                    best, k = dm, m - i - 1
+        if best / length > tol:
+            m = i + 1 + k
+            keep[m % n] = True
+            stack += [(i, m), (m, j)]
+    return pts[np.array(keep)]
+
+
+def _polygon(x: np.ndarray, y: np.ndarray, d: np.ndarray) -> np.ndarray:
+    """
+    Straighten one pixel outline into a polygon.
+
+    The outline is cut into runs of edges with the same direction. Each run
+    contributes its midpoint, so regular staircases collapse onto a straight line.
+    The corner between two runs that are both longer than one pixel is kept, so
+    real corners stay sharp, as are both corners of a one-pixel cap (the end of a
+    one-pixel-wide line). The result is then simplified to POLY_TOLERANCE.
+    """
+    change = np.nonzero(d != np.roll(d, 1))[0]
+    if len(change) == 0:
+        change = np.array([0])
+    run_len = np.diff(np.append(change, len(d)))
+    run_len[-1] += change[0]  # the last run wraps around to the first change
+
+    corners = np.stack([x[change], y[change]], axis=1).astype(np.float64)
+    dirs = _STEP[d[change]]
+    mids = corners + dirs * (run_len[:, None] / 2.0)
+
+    sharp = (run_len >= 2) & (np.roll(run_len, 1) >= 2)
+    # ends of one-pixel caps (two turns the same way around a one-edge run), so thin lines keep their width
+    dir_in = np.roll(dirs, 1, axis=0)
+    turn = dir_in[:, 0] * dirs[:, 1] - dir_in[:, 1] * dirs[:, 0]
+    cap = (run_len == 1) & (turn == np.roll(turn, -1))
+    sharp |= cap | np.roll(cap, 1)
+    pts = np.empty((2 * len(change), 2))
+    pts[0::2] = corners
+    pts[1::2] = mids
+    keep = np.ones(len(pts), dtype=bool)
+    keep[0::2] = sharp
+    return _simplify(pts[keep], POLY_TOLERANCE)
+
+
+# One traced outline: its points and a command per point group, potrace style:
+# "M" (1 point) first, then "L" (1 point) or "C" (ctrl1, ctrl2, end).
+Outline = Tuple[str, np.ndarray]
+
+
+def _segments(v: np.ndarray, smooth: bool) -> Outline:
+    """
+    Turn a polygon into path segments like potrace does.
+
+    Flat: straight lines between the vertices. Smooth: the curve runs through the
+    midpoint of every polygon edge; around each vertex it is a cubic Bézier whose
+    control points lie on the polygon edges, unless the vertex is sharper than
+    ALPHAMAX, in which case it stays a corner (two straight lines).
+    """
+    if not smooth:
+        return "M" + "L" * (len(v) - 1), v
+
+    prev, nxt = np.roll(v, 1, axis=0), np.roll(v, -1, axis=0)
+    mid_in = (prev + v) / 2.0
+    mid_out = np.roll(mid_in, -1, axis=0)
+
+    # potrace: alpha from how far the vertex sits from the line prev -> next
+    r = np.stack([-np.sign(nxt[:, 1] - prev[:, 1]), np.sign(nxt[:, 0] - prev[:, 0])], axis=1)
+    denom = r[:, 1] * (nxt[:, 0] - prev[:, 0]) - r[:, 0] * (nxt[:, 1] - prev[:, 1])
+    para = (v[:, 0] - prev[:, 0]) * (nxt[:, 1] - prev[:, 1]) - (nxt[:, 0] - prev[:, 0]) * (v[:, 1] - prev[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = np.abs(para / denom)
+        alpha = np.where(dd > 1, 1 - 1.0 / dd, 0.0) / 0.75
+    alpha = np.where(denom != 0, alpha, 4 / 3.0)
+    corner = alpha >= ALPHAMAX
+    t = (0.5 + 0.5 * np.clip(alpha, 0.55, 1.0))[:, None]
+
+    # three points per vertex: ctrl1, ctrl2, end for a curve; vertex, end (and a
+    # dropped filler) for a corner
+    c1 = np.where(corner[:, None], v, prev + t * (v - prev))
+    c2 = np.where(corner[:, None], mid_out, nxt + t * (v - nxt))
+    grid = np.stack([c1, c2, mid_out], axis=1)
+    used = np.ones((len(v), 3), dtype=bool)
+    used[corner, 2] = False
+
+    ops = "M" + "".join(np.where(corner, "LL", "C").tolist())
+    return ops, np.vstack([mid_in[:1], grid[used]])
+
+
+def trace_bitmap(black: np.ndarray, turdsize: int = 2, smooth: bool = True) -> List[Outline]:
+    """
+    Vectorize a boolean bitmap (True = black) into closed outlines.
+
+    Outlines enclosing no more than turdsize pixels (specks and small holes) are
+    dropped, like potrace's --turdsize. Coordinates are in pixels, y down.
+    """
+    black = np.asarray(black, dtype=bool)
+    x, y, d, starts = _loops(black)
+    if not starts:
+        return []
+
+    # signed area of every loop at once (shoelace over its unit edges)
+    ex, ey = x + _STEP[d, 0], y + _STEP[d, 1]
+    area = np.add.reduceat(x * ey - ex * y, starts) / 2.0
+    bounds = starts + [len(x)]
+
+    paths = []
+    for k in np.nonzero(np.abs(area) > max(0, int(turdsize)))[0]:
+        lo, hi = bounds[k], bounds[k + 1]
+        poly = _polygon(x[lo:hi], y[lo:hi], d[lo:hi])
+        if len(poly) >= 3:
+            paths.append(_segments(poly, smooth))
+    return paths
+
+
+def _path_data(outlines: List[Outline], height: int) -> str:
+    """Path data in potrace's coordinate system: tenths of a pixel, y up, relative moves."""
+    lines = []
+    for ops, pts in outlines:
+        # round absolute positions first so relative moves do not accumulate error
+        q = np.rint(np.stack([pts[:, 0] * 10, (height - pts[:, 1]) * 10], axis=1)).astype(np.int64)
+        coords = q.tolist()
+        cx, cy = coords[0]
+        out = [f"M{cx} {cy}"]
+        i = 1
+        for op in ops[1:]:
+            if op == "C":
+                (x1, y1), (x2, y2), (x3, y3) = coords[i:i + 3]
+                out.append(f"c{x1 - cx} {y1 - cy} {x2 - cx} {y2 - cy} {x3 - cx} {y3 - cy}")
+                cx, cy = x3, y3
+                i += 3
+            else:
+                x1, y1 = coords[i]
+                out.append(f"l{x1 - cx} {y1 - cy}")
+                cx, cy = x1, y1
+                i += 1
+        lines.append(" ".join(out) + "z")
+    return "\n".join(lines)
+
+
+def bitmap_to_svg(black: np.ndarray, turdsize: int = 2, smooth: bool = True) -> str:
+    """
+    Trace a boolean bitmap and return an SVG document laid out like potrace's:
+    width/height in pt, a 1 unit = 1 pixel viewBox, and one black-filled group
+    flipped into potrace's y-up, tenth-of-a-pixel coordinates.
+    """
+    h, w = np.asarray(black).shape
+    data = _path_data(trace_bitmap(black, turdsize, smooth), h)
+    body = f'<path d="{data}"/>\n' if data else ""
+    return (
+        '<?xml version="1.0" standalone="no"?>\n'
+        '<svg version="1.0" xmlns="http://www.w3.org/2000/svg"\n'
+        f' width="{w:.6f}pt" height="{h:.6f}pt" viewBox="0 0 {w:.6f} {h:.6f}"\n'
+        ' preserveAspectRatio="xMidYMid meet">\n'
+        "<metadata>\nCreated by LineForge native tracer\n</metadata>\n"
+        f'<g transform="translate(0.000000,{h:.6f}) scale(0.100000,-0.100000)"\n'
+        'fill="#000000" stroke="none">\n'
+        f"{body}"
+        "</g>\n"
+        "</svg>\n"
+    )
@@ -1,12 +1,30 @@
+import base64
 import os
+import queue
+import threading
 import tkinter as tk
+from dataclasses import replace
 from tkinter import filedialog, messagebox
 from pathlib import Path
 from datetime import datetime
 
 from ..settings import Settings
-from ..utils import list_images
-from ..pipeline import run_all
+from ..discovery import DirIndex, iter_images
+from ..encode import OUTPUT_FORMATS, OUTPUT_PROFILES
+from ..imaging import encode_png
+from ..preview import PREVIEW_PX, Previewer
+from ..pipeline import RunCancelled, run_all
+from ..sweep import parse_sweep, run_sweep
+from ..stages.export import EXPORT_ENGINES
+from ..stages.icon import ICO_ENGINES, ICO_ENTRY_FORMATS
+from ..stages.trace import TRACE_BINARIZERS, TRACE_ENGINES
+
+# How often queued log text and progress are drawn while a run is going.
+POLL_MS = 100
+# The log view keeps this many lines; the log file always has everything.
+MAX_LOG_LINES = 5000
+# The preview is redrawn this long after the last settings change.
+PREVIEW_DEBOUNCE_MS = 120
 
 
 class App(tk.Tk):
@@ -22,9 +40,32 @@ class App(tk.Tk):
         self._log_fh = None
         self._log_path = None
 
+        # The pipeline runs on a worker thread; it talks to the UI only through this queue.
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker = None
+        self._cancel = None
+        self._closing = False
+        self._poll_id = None
+        # background input count: a newer refresh stops the previous one
+        self._count_stop = None
+        self._count_gen = 0
+        # live preview: renders on its own thread, only the latest request counts
+        self._previewer = None
+        self._preview_thread = None
+        self._preview_win = None
+        self._preview_after = None
+        self._preview_req = None
+        self._preview_gen = 0
+        self._preview_wake = threading.Event()
+        self._preview_photo = None
+
         self._build_ui()
+        for var in list(vars(self).values()):
+            if isinstance(var, tk.Variable):
+                var.trace_add("write", self._setting_changed)
         self.start_new_log_session()
         self.refresh_found_count()
+        self._poll()
 
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
@@ -64,6 +105,43 @@ class App(tk.Tk):
         self.lbl_found = tk.Label(top, text="Found: 0 inputs", anchor="w")
         self.lbl_found.grid(row=2, column=2, columnspan=2, sticky="w", pady=(6, 0))
 
+        self.v_index = tk.BooleanVar(value=self.s.input_index)
+        tk.Checkbutton(
+            top,
+            text="Index folders (fast rescans)",
+            variable=self.v_index,
+            command=self.refresh_found_count
+        ).grid(row=3, column=2, columnspan=2, sticky="w", pady=(2, 0))
+
+        tk.Label(top, text="Include (globs, ;)").grid(row=4, column=0, sticky="w", pady=(4, 0))
+        self.e_include = tk.Entry(top, width=70)
+        self.e_include.insert(0, self.s.input_include)
+        self.e_include.grid(row=4, column=1, padx=6, sticky="we", pady=(4, 0))
+
+        tk.Label(top, text="Exclude (globs, ;)").grid(row=5, column=0, sticky="w")
+        self.e_exclude = tk.Entry(top, width=70)
+        self.e_exclude.insert(0, self.s.input_exclude)
+        self.e_exclude.grid(row=5, column=1, padx=6, sticky="we")
+
+        tk.Label(top, text="ICO engine").grid(row=6, column=0, sticky="w", pady=(4, 0))
+        ico_row = tk.Frame(top)
+        ico_row.grid(row=6, column=1, columnspan=3, sticky="w", padx=6, pady=(4, 0))
+        self.v_ico_engine = tk.StringVar(value=self.s.ico_engine)
+        tk.OptionMenu(ico_row, self.v_ico_engine, *ICO_ENGINES).pack(side="left")
+        tk.Label(ico_row, text="entries (native)").pack(side="left", padx=(12, 4))
+        self.v_ico_entry = tk.StringVar(value=self.s.ico_entry_format)
+        tk.OptionMenu(ico_row, self.v_ico_entry, *ICO_ENTRY_FORMATS).pack(side="left")
+        self.v_icon_pyramid = tk.IntVar(value=1 if self.s.icon_pyramid else 0)
+        tk.Checkbutton(ico_row, text="Icon pyramid", variable=self.v_icon_pyramid).pack(side="left", padx=(12, 0))
+        tk.Label(ico_row, text="sizes").pack(side="left", padx=(6, 4))
+        self.e_icon_sizes = tk.Entry(ico_row, width=24)
+        self.e_icon_sizes.insert(0, self.s.icon_sizes)
+        self.e_icon_sizes.pack(side="left")
+
+        for e in (self.e_in, self.e_include, self.e_exclude):
+            e.bind("<Return>", lambda _e: self.refresh_found_count())
+            e.bind("<FocusOut>", lambda _e: self.refresh_found_count())
+
         top.columnconfigure(1, weight=1)
 
         controls = tk.Frame(self)
@@ -115,6 +193,14 @@ class App(tk.Tk):
         self.scale_q = tk.Scale(a, from_=2, to=256, resolution=1, orient="horizontal", variable=self.v_qlevels, length=220)
         self.scale_q.grid(row=16, column=0, sticky="we")
 
+        tk.Label(a, text="Engine").grid(row=17, column=0, sticky="w")
+        self.v_pre_engine = tk.StringVar(value=self.s.preprocess_engine)
+        tk.OptionMenu(a, self.v_pre_engine, "magick", "pillow").grid(row=18, column=0, sticky="w")
+
+        tk.Label(a, text="Output format").grid(row=19, column=0, sticky="w")
+        self.v_pre_fmt = tk.StringVar(value=self.s.preprocess_out_fmt)
+        tk.OptionMenu(a, self.v_pre_fmt, "png", "webp").grid(row=20, column=0, sticky="w")
+
         # B) Pad
         b = tk.LabelFrame(controls, text="B) Pad")
         b.grid(row=0, column=1, padx=(0, 8), pady=(0, 8), sticky="nsew")
@@ -133,7 +219,7 @@ class App(tk.Tk):
 
         tk.Label(b, text="Output format").grid(row=5, column=0, sticky="w")
         self.v_fmt = tk.StringVar(value=self.s.pad_out_fmt)
-        tk.OptionMenu(b, self.v_fmt, "png", "jpg").grid(row=6, column=0, sticky="w")
+        tk.OptionMenu(b, self.v_fmt, *OUTPUT_FORMATS).grid(row=6, column=0, sticky="w")
 
         tk.Label(b, text="JPEG quality").grid(row=7, column=0, sticky="w")
         self.v_q = tk.IntVar(value=self.s.jpeg_quality)
@@ -163,6 +249,30 @@ class App(tk.Tk):
         self.v_smooth = tk.BooleanVar(value=self.s.potrace_smooth)
         tk.Checkbutton(c, text="Smooth (default)", variable=self.v_smooth).grid(row=6, column=0, sticky="w")
 
+        tk.Label(c, text="Bitmap step").grid(row=7, column=0, sticky="w")
+        self.v_binarize = tk.StringVar(value=self.s.trace_binarize)
+        tk.OptionMenu(c, self.v_binarize, *TRACE_BINARIZERS).grid(row=8, column=0, sticky="w")
+
+        tk.Label(c, text="Tracer").grid(row=9, column=0, sticky="w")
+        self.v_tracer = tk.StringVar(value=self.s.trace_engine)
+        tk.OptionMenu(c, self.v_tracer, *TRACE_ENGINES).grid(row=10, column=0, sticky="w")
+
+        # O) Optimize SVG
+        o = tk.LabelFrame(self, text="O) Optimize SVG")
+        o.pack(fill="x", padx=10, pady=(0, 8))
+
+        self.v_do_optimize = tk.BooleanVar(value=self.s.do_optimize)
+        tk.Checkbutton(o, text="Enable", variable=self.v_do_optimize).grid(row=0, column=0, sticky="w")
+
+        tk.Label(o, text="Decimals").grid(row=0, column=1, sticky="w", padx=(12, 0))
+        self.v_svg_precision = tk.IntVar(value=self.s.svg_precision)
+        tk.Spinbox(o, from_=0, to=1, textvariable=self.v_svg_precision, width=4).grid(row=0, column=2, sticky="w", padx=6)
+
+        self.v_svg_merge = tk.BooleanVar(value=self.s.svg_merge_paths)
+        tk.Checkbutton(o, text="Merge paths with the same fill", variable=self.v_svg_merge).grid(
+            row=0, column=3, sticky="w", padx=(12, 0)
+        )
+
         # D) Export
         d = tk.LabelFrame(self, text="D) Export → PNG")
         d.pack(fill="x", padx=10, pady=(0, 8))
@@ -178,17 +288,90 @@ class App(tk.Tk):
         self.v_area = tk.BooleanVar(value=self.s.export_area_drawing)
         tk.Checkbutton(d, text="Area: drawing", variable=self.v_area).grid(row=0, column=3, sticky="w", padx=(12, 0))
 
+        tk.Label(d, text="Engine").grid(row=0, column=4, sticky="w", padx=(12, 0))
+        self.v_export_engine = tk.StringVar(value=self.s.export_engine)
+        tk.OptionMenu(d, self.v_export_engine, *EXPORT_ENGINES).grid(row=0, column=5, sticky="w", padx=6)
+
+        tk.Label(d, text="Format").grid(row=0, column=6, sticky="w", padx=(12, 0))
+        self.v_export_fmt = tk.StringVar(value=self.s.export_format)
+        tk.OptionMenu(d, self.v_export_fmt, "png", "webp").grid(row=0, column=7, sticky="w", padx=6)
+
+        # Run options
+        r = tk.LabelFrame(self, text="Run")
+        r.pack(fill="x", padx=10, pady=(0, 8))
+
+        tk.Label(r, text="Workers (0 = all cores)").grid(row=0, column=0, sticky="w")
+        self.v_workers = tk.IntVar(value=self.s.workers)
+        tk.Spinbox(r, from_=0, to=256, textvariable=self.v_workers, width=6).grid(row=0, column=1, sticky="w", padx=6)
+
+        self.v_continue = tk.BooleanVar(value=self.s.continue_on_error)
+        tk.Checkbutton(r, text="Continue on error", variable=self.v_continue).grid(row=0, column=2, sticky="w", padx=(12, 0))
+
+        tk.Label(r, text="Mode").grid(row=0, column=3, sticky="w", padx=(12, 0))
+        self.v_pipe_mode = tk.StringVar(value=self.s.pipeline_mode)
+        tk.OptionMenu(r, self.v_pipe_mode, "staged", "streaming").grid(row=0, column=4, sticky="w", padx=6)
+
+        tk.Label(r, text="Files per magick call").grid(row=1, column=0, sticky="w")
+        self.v_magick_batch = tk.IntVar(value=self.s.magick_batch_size)
+        tk.Spinbox(r, from_=1, to=256, textvariable=self.v_magick_batch, width=6).grid(row=1, column=1, sticky="w", padx=6)
+
+        self.v_cache = tk.BooleanVar(value=self.s.use_cache)
+        tk.Checkbutton(r, text="Reuse cached results", variable=self.v_cache).grid(row=0, column=5, sticky="w", padx=(12, 0))
+
+        self.v_keep = tk.BooleanVar(value=self.s.keep_intermediates)
+        tk.Checkbutton(r, text="Keep intermediates (01/02)", variable=self.v_keep).grid(row=1, column=2, sticky="w", padx=(12, 0))
+
+        self.v_report = tk.BooleanVar(value=self.s.run_report)
+        tk.Checkbutton(r, text="Timing report", variable=self.v_report).grid(row=1, column=3, columnspan=2, sticky="w", padx=(12, 0))
+
+        self.v_ledger = tk.BooleanVar(value=self.s.use_ledger)
+        tk.Checkbutton(r, text="Job ledger", variable=self.v_ledger).grid(row=1, column=5, sticky="w", padx=(12, 0))
+
+        self.v_resume = tk.BooleanVar(value=self.s.resume)
+        tk.Checkbutton(
+            r, text="Resume (skip work already finished)", variable=self.v_resume
+        ).grid(row=2, column=2, columnspan=3, sticky="w", padx=(12, 0))
+
+        self.v_tiled = tk.BooleanVar(value=self.s.tiled)
+        tk.Checkbutton(r, text="Tiled, memory MB", variable=self.v_tiled).grid(row=2, column=0, sticky="w")
+        self.v_tile_mb = tk.IntVar(value=self.s.tile_memory_mb)
+        tk.Spinbox(r, from_=64, to=65536, increment=256, textvariable=self.v_tile_mb, width=6).grid(
+            row=2, column=1, sticky="w", padx=6
+        )
+
+        tk.Label(r, text="Output / intermediate encoding").grid(row=2, column=5, sticky="w", padx=(12, 0))
+        enc = tk.Frame(r)
+        enc.grid(row=2, column=6, sticky="w", padx=6)
+        self.v_out_profile = tk.StringVar(value=self.s.output_profile)
+        tk.OptionMenu(enc, self.v_out_profile, *OUTPUT_PROFILES).pack(side="left")
+        self.v_mid_profile = tk.StringVar(value=self.s.intermediate_profile)
+        tk.OptionMenu(enc, self.v_mid_profile, *OUTPUT_PROFILES).pack(side="left")
+
+        tk.Label(r, text="Sweep").grid(row=3, column=0, sticky="w")
+        self.e_sweep = tk.Entry(r, width=60)
+        self.e_sweep.insert(0, "trace_cutoff_pct=35:55:5; potrace_turdsize=2,8")
+        self.e_sweep.grid(row=3, column=1, columnspan=4, sticky="we", padx=6, pady=(4, 0))
+        self.btn_sweep = tk.Button(r, text="Run sweep", command=self.run_sweep_clicked, width=12)
+        self.btn_sweep.grid(row=3, column=5, sticky="w", padx=(12, 0), pady=(4, 0))
+
         # Buttons
         btn = tk.Frame(self)
         btn.pack(fill="x", padx=10, pady=(0, 8))
 
-        tk.Button(btn, text="Run ALL (A→D)", command=self.run_all_clicked, width=16).pack(side="left")
+        self.btn_run = tk.Button(btn, text="Run ALL (A→D)", command=self.run_all_clicked, width=16)
+        self.btn_run.pack(side="left")
+        self.btn_cancel = tk.Button(btn, text="Cancel", command=self.cancel_clicked, width=10, state="disabled")
+        self.btn_cancel.pack(side="left", padx=(6, 0))
         tk.Button(btn, text="Icon-safe defaults", command=self.apply_icon_defaults, width=16).pack(side="left", padx=6)
+        tk.Button(btn, text="Preview", command=self.open_preview, width=10).pack(side="left", padx=6)
         tk.Button(btn, text="Refresh Found Count", command=self.refresh_found_count, width=18).pack(side="left", padx=6)
         tk.Button(btn, text="Open output folder", command=self.open_output_folder, width=18).pack(side="left", padx=6)
         tk.Button(btn, text="Open last log", command=self.open_last_log, width=14).pack(side="left", padx=6)
         tk.Button(btn, text="Clear log", command=self.clear_log, width=12).pack(side="right")
 
+        self.lbl_status = tk.Label(self, text="Idle.", anchor="w")
+        self.lbl_status.pack(fill="x", padx=10)
+
         self.txt = tk.Text(self, wrap="word")
         self.txt.pack(fill="both", expand=True, padx=10, pady=(0, 10))
 
@@ -221,6 +404,7 @@ class App(tk.Tk):
         self.v_do_pre.set(True)
         self.v_do_pad.set(True)
         self.v_do_trace.set(False)
+        self.v_do_optimize.set(False)
         self.v_do_export.set(False)
 
         # Preprocess defaults for icons
@@ -288,6 +472,7 @@ class App(tk.Tk):
         self.write(f"--- Log: {self._log_path} ---\n")
 
     def close_log_session(self):
+        self._drain()
         try:
             if self._log_fh:
                 self._log_fh.flush()
@@ -297,16 +482,75 @@ class App(tk.Tk):
         self._log_fh = None
 
     def write(self, msg: str):
-        self.txt.insert("end", msg)
+        """Queue log text; safe from any thread. It is drawn on the next poll."""
+        self._queue.put(("log", msg))
+
+    def _progress(self, event):
+        self._queue.put(("progress", event))
+
+    def _poll(self):
+        self._drain()
+        self._poll_id = self.after(POLL_MS, self._poll)
+
+    def _drain(self):
+        """Empty the queue on the Tk thread: one insert and one log write per batch."""
+        chunks = []
+        status = None
+        finished = None
+        try:
+            while True:
+                kind, payload = self._queue.get_nowait()
+                if kind == "log":
+                    chunks.append(payload)
+                elif kind == "progress":
+                    status = self._status_text(payload) or status
+                elif kind == "found":
+                    gen, text = payload
+                    if gen == self._count_gen:
+                        self.lbl_found.config(text=text)
+                elif kind == "preview":
+                    self._show_preview(*payload)
+                elif kind == "preview_first":
+                    if self._preview_win is not None and not self.e_preview.get().strip():
+                        self.e_preview.insert(0, str(payload))
+                        self._setting_changed()
+                else:  # "finished"
+                    finished = (payload,)
+        except queue.Empty:
+            pass
+
+        if chunks:
+            self._show("".join(chunks))
+        if status:
+            self.lbl_status.config(text=status)
+        if finished is not None:
+            self._run_finished(finished[0])
+
+    def _show(self, text: str):
+        self.txt.insert("end", text)
+        extra = int(self.txt.index("end-1c").split(".")[0]) - MAX_LOG_LINES
+        if extra > 0:
+            self.txt.delete("1.0", f"{extra + 1}.0")
         self.txt.see("end")
-        self.update_idletasks()
         try:
             if self._log_fh:
-                self._log_fh.write(msg)
-                self._log_fh.flush()
+                self._log_fh.write(text)  # buffered; flushed when the run ends
         except Exception:
             pass
 
+    @staticmethod
+    def _status_text(event):
+        kind = event.get("event")
+        if kind == "start":
+            return f"Running {event['stages']} on {event['files']} file(s)..."
+        if kind == "stage":
+            return f"[{event['stage']}] {event['title']}: 0/{event['files']}"
+        if kind == "file":
+            return f"[{event['stage']}] {event['index']}/{event['total']}  {Path(str(event['file'])).name}"
+        if kind == "done":
+            return f"Done: {event['completed']} ok, {event['failed']} failed."
+        return None
+
     def clear_log(self):
         self.txt.delete("1.0", "end")
 
@@ -314,10 +558,18 @@ class App(tk.Tk):
     def sync(self):
         self.s.input_recursive = bool(self.v_recursive.get())
         self.s.handle_ico = bool(self.v_handle_ico.get())
+        self.s.ico_engine = self.v_ico_engine.get().strip().lower()
+        self.s.ico_entry_format = self.v_ico_entry.get().strip().lower()
+        self.s.icon_pyramid = bool(self.v_icon_pyramid.get())
+        self.s.icon_sizes = self.e_icon_sizes.get().strip()
+        self.s.input_include = self.e_include.get().strip()
+        self.s.input_exclude = self.e_exclude.get().strip()
+        self.s.input_index = bool(self.v_index.get())
 
         self.s.do_preprocess = bool(self.v_do_pre.get())
         self.s.do_pad = bool(self.v_do_pad.get())
         self.s.do_trace = bool(self.v_do_trace.get())
+        self.s.do_optimize = bool(self.v_do_optimize.get())
         self.s.do_export = bool(self.v_do_export.get())
 
         self.s.grayscale = bool(self.v_gray.get())
@@ -327,9 +579,11 @@ class App(tk.Tk):
         self.s.median = int(self.v_med.get())
         self.s.blur = float(self.v_blur.get())
 
+        self.s.preprocess_engine = self.v_pre_engine.get().strip().lower()
         self.s.preprocess_mode = (self.v_mode.get() or "none").strip().lower()
         self.s.threshold_pct = int(self.v_th.get())
         self.s.quantize_levels = int(self.v_qlevels.get())
+        self.s.preprocess_out_fmt = self.v_pre_fmt.get().strip().lower()
 
         self.s.pad_size = int(self.v_size.get())
         self.s.pad_bg = self.v_bg.get().strip().lower()
@@ -340,9 +594,30 @@ class App(tk.Tk):
         self.s.trace_invert = bool(self.v_trace_inv.get())
         self.s.potrace_turdsize = int(self.v_turd.get())
         self.s.potrace_smooth = bool(self.v_smooth.get())
+        self.s.trace_binarize = self.v_binarize.get().strip().lower()
+        self.s.trace_engine = self.v_tracer.get().strip().lower()
+
+        self.s.svg_precision = int(self.v_svg_precision.get())
+        self.s.svg_merge_paths = bool(self.v_svg_merge.get())
 
         self.s.export_width = int(self.v_w.get())
         self.s.export_area_drawing = bool(self.v_area.get())
+        self.s.export_engine = self.v_export_engine.get().strip().lower()
+        self.s.export_format = self.v_export_fmt.get().strip().lower()
+
+        self.s.workers = int(self.v_workers.get())
+        self.s.continue_on_error = bool(self.v_continue.get())
+        self.s.pipeline_mode = self.v_pipe_mode.get().strip().lower()
+        self.s.use_cache = bool(self.v_cache.get())
+        self.s.magick_batch_size = int(self.v_magick_batch.get())
+        self.s.keep_intermediates = bool(self.v_keep.get())
+        self.s.run_report = bool(self.v_report.get())
+        self.s.use_ledger = bool(self.v_ledger.get())
+        self.s.resume = bool(self.v_resume.get())
+        self.s.tiled = bool(self.v_tiled.get())
+        self.s.tile_memory_mb = int(self.v_tile_mb.get())
+        self.s.output_profile = self.v_out_profile.get().strip().lower()
+        self.s.intermediate_profile = self.v_mid_profile.get().strip().lower()
 
     def paths(self):
         inp = Path(self.e_in.get().strip())
@@ -353,13 +628,36 @@ class App(tk.Tk):
         return inp, out
 
     def refresh_found_count(self):
-        try:
-            inp = Path(self.e_in.get().strip())
-            recursive = bool(self.v_recursive.get())
-            files = list_images(inp, recursive=recursive)
-            self.lbl_found.config(text=f"Found: {len(files)} inputs" + (" (recursive)" if recursive else ""))
-        except Exception:
-            self.lbl_found.config(text="Found: ? inputs")
+        """Count inputs on a background thread; the label follows the count as it grows."""
+        if self._count_stop is not None:
+            self._count_stop.set()
+        stop = threading.Event()
+        self._count_stop = stop
+        self._count_gen += 1
+        gen = self._count_gen
+
+        inp = Path(self.e_in.get().strip())
+        recursive = bool(self.v_recursive.get())
+        include, exclude = self.e_include.get(), self.e_exclude.get()
+        use_index = bool(self.v_index.get())
+        suffix = " (recursive)" if recursive else ""
+        self.lbl_found.config(text="Found: counting...")
+
+        def work():
+            try:
+                index = DirIndex.for_root(inp) if use_index and inp.is_dir() else None
+                n = 0
+                for _ in iter_images(inp, recursive, include, exclude, index):
+                    if stop.is_set():
+                        return
+                    n += 1
+                    if n % 1000 == 0:
+                        self._queue.put(("found", (gen, f"Found: {n:,} inputs so far...")))
+                self._queue.put(("found", (gen, f"Found: {n:,} inputs{suffix}")))
+            except Exception:
+                self._queue.put(("found", (gen, "Found: ? inputs")))
+
+        threading.Thread(target=work, name="lineforge-count", daemon=True).start()
 
     def open_output_folder(self):
         try:
@@ -383,22 +681,219 @@ class App(tk.Tk):
         except Exception as e:
             messagebox.showerror("Open last log failed", str(e))
 
+    # ---- live preview ----
+    def open_preview(self):
+        if self._preview_win is not None:
+            self._preview_win.lift()
+            return
+        win = tk.Toplevel(self)
+        win.title("LineForge Preview")
+        win.protocol("WM_DELETE_WINDOW", self.close_preview)
+
+        top = tk.Frame(win)
+        top.pack(fill="x", padx=8, pady=6)
+        tk.Label(top, text="Image").pack(side="left")
+        self.e_preview = tk.Entry(top, width=60)
+        self.e_preview.pack(side="left", fill="x", expand=True, padx=6)
+        self.e_preview.bind("<Return>", self._setting_changed)
+        self.e_preview.bind("<FocusOut>", self._setting_changed)
+        tk.Button(top, text="Browse", command=self.browse_preview_image).pack(side="left")
+
+        self.lbl_preview = tk.Label(win, bg="#808080")
+        self.lbl_preview.pack(padx=8, pady=4)
+        self.lbl_preview_status = tk.Label(win, text="", anchor="w")
+        self.lbl_preview_status.pack(fill="x", padx=8, pady=(0, 6))
+
+        inp = Path(self.e_in.get().strip())
+        recursive = bool(self.v_recursive.get())
+        include, exclude = self.e_include.get(), self.e_exclude.get()
+        use_index = bool(self.v_index.get())
+
+        def first_image():
+            # a huge folder takes a while to list: keep it off the Tk thread
+            try:
+                index = DirIndex.for_root(inp) if use_index and inp.is_dir() else None
+                first = next(iter_images(inp, recursive, include, exclude, index), None) if inp.exists() else None
+            except Exception:
+                first = None
+            if first is not None:
+                self._queue.put(("preview_first", first))
+
+        threading.Thread(target=first_image, name="lineforge-preview-first", daemon=True).start()
+
+        if self._previewer is None:
+            self._previewer = Previewer(PREVIEW_PX)
+            self._preview_thread = threading.Thread(target=self._preview_loop, name="lineforge-preview", daemon=True)
+            self._preview_thread.start()
+        self._preview_win = win
+        self._setting_changed()
+
+    def browse_preview_image(self):
+        p = filedialog.askopenfilename(
+            title="Preview image",
+            filetypes=[("Images", "*.png *.jpg *.jpeg *.webp *.bmp *.tif *.tiff *.ico"), ("All files", "*.*")]
+        )
+        if p:
+            self.e_preview.delete(0, "end")
+            self.e_preview.insert(0, p)
+            self._setting_changed()
+
+    def close_preview(self):
+        if self._preview_after is not None:
+            self.after_cancel(self._preview_after)
+            self._preview_after = None
+        if self._preview_win is not None:
+            self._preview_win.destroy()
+        self._preview_win = None
+        self._preview_photo = None
+
+    def _setting_changed(self, *_):
+        """Debounce: redraw once the settings have been still for PREVIEW_DEBOUNCE_MS."""
+        if self._preview_win is None:
+            return
+        if self._preview_after is not None:
+            self.after_cancel(self._preview_after)
+        self._preview_after = self.after(PREVIEW_DEBOUNCE_MS, self._request_preview)
+
+    def _request_preview(self):
+        self._preview_after = None
+        src = Path(self.e_preview.get().strip())
+        if not src.is_file():
+            self.lbl_preview_status.config(text="Choose an image to preview.")
+            return
+        try:
+            self.sync()
+        except (tk.TclError, ValueError):
+            return  # a field is mid-edit; the next change redraws
+        self._preview_gen += 1
+        self._preview_req = (self._preview_gen, src, replace(self.s))
+        self._preview_wake.set()
+
+    def _preview_loop(self):
+        """Preview thread: renders the newest request; older ones still waiting are skipped."""
+        while True:
+            self._preview_wake.wait()
+            self._preview_wake.clear()
+            req = self._preview_req
+            if req is None:
+                continue
+            gen, src, s = req
+            try:
+                result, error = self._previewer.render(src, s), None
+            except Exception as e:
+                result, error = None, e
+            self._queue.put(("preview", (gen, result, error)))
+
+    def _show_preview(self, gen, result, error):
+        if self._preview_win is None or gen != self._preview_gen:
+            return
+        if error is not None:
+            self.lbl_preview_status.config(text=f"Preview failed: {error}")
+            return
+        data = base64.b64encode(encode_png(result.image)).decode("ascii")
+        self._preview_photo = tk.PhotoImage(data=data)
+        self.lbl_preview.config(image=self._preview_photo)
+        self.lbl_preview_status.config(text=f"{result.image.width}x{result.image.height} proxy, {result.describe()}")
+
     def on_close(self):
+        if self._worker is not None:
+            # let the running files finish so outputs are not left half-written
+            self._closing = True
+            self.cancel_clicked()
+            return
+        if self._preview_win is not None:
+            self.close_preview()
+        if self._previewer is not None:
+            self._previewer.close()
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
         self.close_log_session()
         self.destroy()
 
     # ---- run ----
     def run_all_clicked(self):
+        self._start("Running ALL stages...", lambda inp, out, s, cancel: run_all(
+            inp, out, s, self.write, self._progress, cancel
+        ))
+
+    def run_sweep_clicked(self):
+        try:
+            sweep = parse_sweep(self.e_sweep.get())
+        except ValueError as e:
+            messagebox.showerror("Sweep", str(e))
+            return
+        self._start("Running sweep...", lambda inp, out, s, cancel: run_sweep(
+            inp, out, s, sweep, self.write, self._progress, cancel
+        ))
+
+    def _start(self, title, fn):
+        """Run fn(inp, out, settings, cancel) on the worker thread."""
+        if self._worker is not None:
+            return
         self.start_new_log_session()
         self.sync()
         self._toggle_pre_mode_ui()
         try:
             inp, out = self.paths()
-            self.refresh_found_count()
-            self.write("\nRunning ALL stages...\n")
-            run_all(inp, out, self.s, self.write)
-            self.write("\nDONE.\n")
-            self.open_output_folder()
         except Exception as e:
             self.write(f"\nFAILED: {e}\n")
             messagebox.showerror("Run failed", str(e))
+            return
+
+        self.refresh_found_count()
+        self.write(f"\n{title}\n")
+        self.btn_run.config(state="disabled")
+        self.btn_sweep.config(state="disabled")
+        self.btn_cancel.config(state="normal")
+        self.lbl_status.config(text="Starting...")
+
+        cancel = threading.Event()
+        s = replace(self.s)  # the UI may change self.s while the run goes on
+
+        def work():
+            error = None
+            try:
+                fn(inp, out, s, cancel)
+            except Exception as e:
+                error = e
+            self._queue.put(("finished", error))
+
+        self._cancel = cancel
+        self._worker = threading.Thread(target=work, name="lineforge-run", daemon=True)
+        self._worker.start()
+
+    def cancel_clicked(self):
+        if self._cancel is not None and not self._cancel.is_set():
+            self._cancel.set()
+            self.btn_cancel.config(state="disabled")
+            self.lbl_status.config(text="Cancelling after the current file(s)...")
+            self.write("\nCancelling...\n")
+
+    def _run_finished(self, error):
+        self._worker.join()
+        self._worker = None
+        self._cancel = None
+        self.btn_run.config(state="normal")
+        self.btn_sweep.config(state="normal")
+        self.btn_cancel.config(state="disabled")
+
+        if error is None:
+            self._show("\nDONE.\n")
+        elif isinstance(error, RunCancelled):
+            self._show("\nCANCELLED.\n")
+            self.lbl_status.config(text="Cancelled.")
+        else:
+            self._show(f"\nFAILED: {error}\n")
+            self.lbl_status.config(text="Failed.")
+        try:
+            if self._log_fh:
+                self._log_fh.flush()
+        except Exception:
+            pass
+
+        if self._closing:
+            self.on_close()
+        elif error is None:
+            self.open_output_folder()
+        elif not isinstance(error, RunCancelled):
+            messagebox.showerror("Run failed", str(error))
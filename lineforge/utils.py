@@ -1,8 +1,10 @@
+import os
 import shutil
 import subprocess
 import sys
+import time
 from pathlib import Path
-from typing import Optional, List
+from typing import Callable, Optional, List
 
 IMG_EXTS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff", ".ico"}
 
@@ -11,12 +13,15 @@ def which(cmd: str) -> Optional[str]:
     return shutil.which(cmd)
 
 
-def run_cmd(args: List[str]) -> None:
-    """
-    Run a subprocess command silently (no flashing console windows on Windows).
-    Raises RuntimeError if the command fails.
-    """
+def user_cache_dir() -> Path:
+    """Per-user cache folder: %LOCALAPPDATA%\\LineForge on Windows, ~/.cache/lineforge elsewhere."""
+    if sys.platform.startswith("win"):
+        return Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local") / "LineForge"
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "lineforge"
+
 
+def hidden_window_kwargs() -> dict:
+    """subprocess keyword arguments that keep console windows from flashing up on Windows."""
     creationflags = 0
     startupinfo = None
 
@@ -25,43 +30,78 @@ def run_cmd(args: List[str]) -> None:
         startupinfo = subprocess.STARTUPINFO()
         startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
 
-    p = subprocess.run(
+    return {"creationflags": creationflags, "startupinfo": startupinfo}
+
+
+# Called after every external command with (args, spawn_s, total_s, returncode,
+# stdin_bytes, stdout_bytes), from the thread that ran it. returncode is None for
+# long-lived workers that are only reported once started (Inkscape shell).
+CmdObserver = Callable[[List[str], float, float, Optional[int], int, int], None]
+_cmd_observers: List[CmdObserver] = []
+
+
+def add_cmd_observer(fn: CmdObserver) -> None:
+    _cmd_observers.append(fn)
+
+
+def remove_cmd_observer(fn: CmdObserver) -> None:
+    try:
+        _cmd_observers.remove(fn)
+    except ValueError:
+        pass
+
+
+def notify_cmd(
+    args: List[str], spawn_s: float, total_s: float, returncode: Optional[int], stdin_bytes: int, stdout_bytes: int,
+) -> None:
+    for fn in list(_cmd_observers):
+        fn(args, spawn_s, total_s, returncode, stdin_bytes, stdout_bytes)
+
+
+def run_cmd(args: List[str], input_bytes: Optional[bytes] = None) -> bytes:
+    """
+    Run a subprocess command silently (no flashing console windows on Windows).
+    input_bytes, if given, is written to the command's stdin.
+    Returns the captured stdout bytes.
+    Raises RuntimeError if the command fails.
+    """
+    t0 = time.perf_counter()
+    p = subprocess.Popen(
         args,
+        stdin=subprocess.PIPE if input_bytes is not None else None,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        text=True,
-        creationflags=creationflags,
-        startupinfo=startupinfo,
+        **hidden_window_kwargs(),
     )
+    spawned = time.perf_counter()
+    out, err = p.communicate(input_bytes)
+    if _cmd_observers:
+        notify_cmd(args, spawned - t0, time.perf_counter() - t0, p.returncode, len(input_bytes or b""), len(out))
 
     if p.returncode != 0:
         raise RuntimeError(
             "Command failed:\n"
             + " ".join(args)
             + "\n"
-            + (p.stderr or p.stdout)
+            + (err or out).decode(errors="replace")
         )
 
+    return out
+
 
-def list_images(path: Path, recursive: bool = False) -> list[Path]:
+def list_images(
+    path: Path,
+    recursive: bool = False,
+    include="",
+    exclude="",
+    use_index: bool = False,
+) -> list[Path]:
     """
-    Return supported image files for a file OR directory.
+    Return supported image files for a file OR directory, sorted.
+    See discovery.iter_images for include/exclude and the folder index.
     """
-    path = Path(path)
-
-    if path.is_file():
-        return [path] if path.suffix.lower() in IMG_EXTS else []
+    from .discovery import DirIndex, iter_images
 
-    if not path.exists() or not path.is_dir():
-        return []
-
-    if recursive:
-        return sorted(
-            p for p in path.rglob("*")
-            if p.is_file() and p.suffix.lower() in IMG_EXTS
-        )
-
-    return sorted(
-        p for p in path.iterdir()
-        if p.is_file() and p.suffix.lower() in IMG_EXTS
-    )
+    path = Path(path)
+    index = DirIndex.for_root(path) if use_index and path.is_dir() else None
+    return sorted(iter_images(path, recursive, include, exclude, index))